@@ -0,0 +1 @@
+"""Support code for the Petstore API tests"""
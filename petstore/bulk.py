@@ -0,0 +1,317 @@
+"""Batch size sweep for the bulk user imports, /user/createWithList and /user/createWithArray
+
+Every trial imports the same users through one endpoint at one batch size
+and concurrency, and is compared with the same users sent one POST /user
+at a time at the same concurrency. A batch is generated and encoded while
+it is sent, as a chunked request body, so even the largest never sits whole
+in the client's memory. After each trial a sample of the users is read back
+to check the import really stored them.
+
+    python -m petstore.bulk --base-url=http://localhost:8080/v2 --users=10000 --sizes=1,10,100,1000,10000
+"""
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from collections import Counter
+
+import requests
+
+from petstore.client import PetstoreClient
+from petstore.ids import IdAllocator, new_run_id
+from petstore.metrics import Histogram, Recorder
+from petstore.seeding import BULK_USER_ENDPOINTS, check, run_all
+from petstore.streaming import CHUNK_SIZE
+from petstore.throttle import RetryPolicy
+
+SINGLE = "/user"
+SIZES = (1, 10, 100, 1000, 10_000)
+CONCURRENCY = (1, 4, 16)
+USERS = 10_000
+SPOT_CHECKS = 20
+
+# The default read timeout is meant for single requests, not for importing ten thousand users
+TIMEOUT = (5, 120)
+JSON = {"Content-Type": "application/json"}
+
+
+def encode(item):
+    return json.dumps(item, separators=(",", ":")).encode()
+
+
+class ChunkedBody:
+    """JSON array request body, encoded a chunk at a time as the items are generated
+
+    requests sends any iterable without a length with chunked transfer
+    encoding, so only the chunk being sent is ever in memory. A retry
+    iterates the body again, so items must be re-iterable: a spent
+    generator would send an empty array that the API accepts.
+    """
+
+    def __init__(self, items, chunk_size=CHUNK_SIZE):
+        if iter(items) is items:
+            raise TypeError("ChunkedBody needs items it can iterate again, not a one-shot iterator")
+        self.items = items
+        self.chunk_size = chunk_size
+        self.bytes = 0
+
+    def __iter__(self):
+        # Bytes of the latest attempt
+        self.bytes = 0
+        buffer = bytearray(b"[")
+        for number, item in enumerate(self.items):
+            if number:
+                buffer += b","
+            buffer += encode(item)
+            if len(buffer) >= self.chunk_size:
+                self.bytes += len(buffer)
+                yield bytes(buffer)
+                buffer.clear()
+        buffer += b"]"
+        self.bytes += len(buffer)
+        yield bytes(buffer)
+
+
+class UserSource:
+    """Users numbered 0 to count - 1, generated on demand with the same ids and usernames in every trial"""
+
+    def __init__(self, allocator, count):
+        self.count = count
+        self.first_id = allocator.reserve(count)
+        self.prefix = allocator.name("bulk")
+
+    def username(self, index):
+        return f"{self.prefix}{index}"
+
+    def user(self, index, tag):
+        # The tag tells which trial last wrote a user, since every trial writes the same ones
+        return {
+            "id": self.first_id + index, "username": self.username(index), "firstName": tag, "lastName": str(index),
+            "email": f"bulk{index}@test.com", "password": "root", "phone": "987654321", "userStatus": 0,
+        }
+
+    def batch(self, indices, tag):
+        return UserBatch(self, indices, tag)
+
+    def batches(self, size):
+        return (range(start, min(start + size, self.count)) for start in range(0, self.count, size))
+
+
+class UserBatch:
+    """Some of a source's users, generated afresh each time the batch is iterated"""
+
+    def __init__(self, source, indices, tag):
+        self.source = source
+        self.indices = indices
+        self.tag = tag
+
+    def __iter__(self):
+        return (self.source.user(index, self.tag) for index in self.indices)
+
+
+class Trial:
+    """One endpoint at one batch size and concurrency"""
+
+    def __init__(self, endpoint, batch_size, concurrency):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.lock = threading.Lock()
+        self.latency = Histogram()
+        # Status codes, or exception names for requests that got no response
+        self.statuses = Counter()
+        self.requests = 0
+        # Users in requests answered 200
+        self.users = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.checked = 0
+        self.missing = 0
+
+    @property
+    def errors(self):
+        return self.requests - self.statuses[200]
+
+    @property
+    def users_per_second(self):
+        return self.users / self.seconds if self.seconds else 0.0
+
+    def error_text(self):
+        return ", ".join(f"{status} x{count}" for status, count in self.statuses.items() if status != 200)
+
+    def line(self, single=None):
+        speedup = f"{'-':>9}"
+        if single is not None and single.users:
+            speedup = f"{self.users_per_second / single.users_per_second:>8.1f}x"
+        payload = self.bytes / self.requests / 1024 if self.requests else 0
+        stored = f"{self.checked - self.missing}/{self.checked}"
+        return (
+            f"{self.endpoint:<22} {self.batch_size:>6} {self.concurrency:>5} {self.requests:>8} "
+            f"{self.users_per_second:>9.0f} {speedup} {self.latency.percentile(99) * 1000:>9.1f}ms "
+            f"{payload:>9.1f}KiB {self.errors:>6} {stored:>9}"
+        )
+
+
+class BulkSweep:
+    """Runs trials over batch sizes and concurrency levels for both bulk endpoints and single POST /user"""
+
+    def __init__(self, client, allocator, users=USERS, spot_checks=SPOT_CHECKS, seed=None):
+        self.client = client
+        self.source = UserSource(allocator, users)
+        self.spot_checks = spot_checks
+        self.random = random.Random(seed)
+        self.tags = itertools.count()
+        self.trials = []
+        # Single POST /user trials, by concurrency
+        self.singles = {}
+        # Smallest batch size that saw errors, by endpoint, with the trial that saw them
+        self.thresholds = {}
+
+    def send(self, trial, indices, tag):
+        if trial.endpoint == SINGLE:
+            body = encode(self.source.user(indices[0], tag))
+            size = len(body)
+        else:
+            body = ChunkedBody(self.source.batch(indices, tag))
+        started = time.perf_counter()
+        try:
+            status = self.client.post(trial.endpoint, data=body, headers=JSON, timeout=TIMEOUT).status_code
+        except requests.RequestException as exc:
+            status = type(exc).__name__
+        latency = time.perf_counter() - started
+        if trial.endpoint != SINGLE:
+            size = body.bytes
+        with trial.lock:
+            trial.latency.record(latency)
+            trial.statuses[status] += 1
+            trial.requests += 1
+            trial.bytes += size
+            if status == 200:
+                trial.users += len(indices)
+        return status == 200
+
+    def spot_check(self, trial, stored, tag):
+        """Read back a random sample of the users the trial was told it stored"""
+        if not stored:
+            return
+        indices = {self.random.choice(self.random.choice(stored)) for _ in range(self.spot_checks)}
+        for index in sorted(indices):
+            response = self.client.get(f"/user/{self.source.username(index)}")
+            trial.checked += 1
+            if response.status_code != 200 or response.json().get("firstName") != tag:
+                trial.missing += 1
+
+    def trial(self, endpoint, batch_size, concurrency):
+        """Import every user in batches of batch_size, with up to concurrency batches in flight"""
+        trial = Trial(endpoint, batch_size, concurrency)
+        tag = f"trial{next(self.tags)}"
+        batches = self.source.batches(batch_size)
+        lock = threading.Lock()
+        stored = []
+
+        def work():
+            while True:
+                with lock:
+                    indices = next(batches, None)
+                if indices is None:
+                    return
+                if self.send(trial, indices, tag):
+                    with lock:
+                        stored.append(indices)
+
+        threads = [threading.Thread(target=work, daemon=True) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        trial.seconds = time.perf_counter() - started
+        self.spot_check(trial, stored, tag)
+        return trial
+
+    def run(self, sizes=SIZES, concurrencies=CONCURRENCY):
+        for concurrency in concurrencies:
+            self.singles[concurrency] = self.trial(SINGLE, 1, concurrency)
+        for endpoint in BULK_USER_ENDPOINTS:
+            for concurrency in concurrencies:
+                for size in sorted(sizes):
+                    trial = self.trial(endpoint, size, concurrency)
+                    self.trials.append(trial)
+                    if trial.errors:
+                        known = self.thresholds.get(endpoint)
+                        if known is None or size < known.batch_size:
+                            self.thresholds[endpoint] = trial
+                    # Past the size where nothing gets through, larger batches won't either
+                    if not trial.users:
+                        break
+        return self.trials
+
+    def best(self):
+        working = [trial for trial in self.trials if not trial.errors]
+        return max(working, key=lambda trial: trial.users_per_second, default=None)
+
+    def report_lines(self):
+        lines = [
+            f"{'endpoint':<22} {'batch':>6} {'conc':>5} {'requests':>8} {'users/s':>9} {'vs single':>9} "
+            f"{'p99':>11} {'payload':>12} {'errors':>6} {'stored':>9}"
+        ]
+        lines += [trial.line() for _, trial in sorted(self.singles.items())]
+        lines += [trial.line(self.singles.get(trial.concurrency)) for trial in self.trials]
+        for endpoint in BULK_USER_ENDPOINTS:
+            trial = self.thresholds.get(endpoint)
+            if trial is not None:
+                lines.append(
+                    f"{endpoint} fails from batch size {trial.batch_size} at concurrency {trial.concurrency}: "
+                    f"{trial.error_text()}"
+                )
+            elif any(trial.endpoint == endpoint for trial in self.trials):
+                largest = max(trial.batch_size for trial in self.trials if trial.endpoint == endpoint)
+                lines.append(f"{endpoint} has no errors up to batch size {largest}")
+        best = self.best()
+        if best is not None:
+            single = self.singles.get(best.concurrency)
+            speedup = ""
+            if single is not None and single.users:
+                speedup = f" ({best.users_per_second / single.users_per_second:.1f}x single)"
+            lines.append(
+                f"best: {best.endpoint} in batches of {best.batch_size} at concurrency {best.concurrency}, "
+                f"{best.users_per_second:.0f} users/s{speedup}"
+            )
+        missing = sum(trial.missing for trial in [*self.singles.values(), *self.trials])
+        if missing:
+            lines.append(f"{missing} users reported stored were missing or stale when read back")
+        return lines
+
+    def cleanup(self, workers=CONCURRENCY[-1]):
+        paths = [f"/user/{self.source.username(index)}" for index in range(self.source.count)]
+        check(run_all([(self.client.delete, path, {}) for path in paths], workers), "cleanup", allowed=(200, 404))
+
+
+def main():
+    """Run the sweep against an API and print the table"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", required=True, help="API to measure, e.g. https://petstore.swagger.io/v2")
+    parser.add_argument("--users", type=int, default=USERS, help="Users each trial imports")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma separated batch sizes")
+    parser.add_argument("--concurrency", default=",".join(map(str, CONCURRENCY)), help="Comma separated levels")
+    parser.add_argument("--spot-checks", type=int, default=SPOT_CHECKS, help="Users read back after each trial")
+    args = parser.parse_args()
+
+    concurrencies = [int(level) for level in args.concurrency.split(",")]
+    # Failed imports are part of the result, so none are retried
+    client = PetstoreClient(
+        args.base_url, pool_size=max(concurrencies), recorder=Recorder(), retry=RetryPolicy(retries=0),
+    )
+    with client:
+        sweep = BulkSweep(client, IdAllocator(new_run_id(), 0), args.users, args.spot_checks)
+        try:
+            sweep.run([int(size) for size in args.sizes.split(",")], concurrencies)
+        finally:
+            sweep.cleanup()
+    print(*sweep.report_lines(), sep="\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Opt-in LRU+TTL cache of read-only lookups, for setup and verification reads that aren't under test"""
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from petstore.metrics import endpoint_template
+
+# A write under one collection may change what reads under these return: pet statuses feed /store/inventory
+INVALIDATES = {"pet": ("pet", "store"), "store": ("store",), "user": ("user",)}
+
+# Only plain lookups are cached; anything else about a GET is passed straight through
+CACHEABLE_ARGS = frozenset({"params", "timeout"})
+
+
+def collection(path):
+    """First path segment, e.g. "pet" for /pet/123"""
+    return path.lstrip("/").split("/", 1)[0]
+
+
+class ResponseCache:
+    """Thread-safe LRU of successful GET responses, each kept for at most ttl seconds"""
+
+    def __init__(self, max_entries=200, ttl=5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.stats = Counter()
+        # Bumped by every invalidation, so a read that raced a write isn't cached
+        self.generation = 0
+
+    @staticmethod
+    def key(path, params):
+        if isinstance(params, dict):
+            params = tuple(sorted((name, str(value)) for name, value in params.items()))
+        return path, params
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            expires, response = entry
+            if time.monotonic() >= expires:
+                del self.entries[key]
+                self.stats["misses"] += 1
+                self.stats["expired"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return response
+
+    def put(self, key, response, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (time.monotonic() + self.ttl, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.stats["evicted"] += 1
+
+    def invalidate(self, path):
+        """Drop every entry a write to path could have changed"""
+        groups = INVALIDATES.get(collection(path))
+        with self.lock:
+            stale = [key for key in self.entries if groups is None or collection(key[0]) in groups]
+            for key in stale:
+                del self.entries[key]
+            self.stats["invalidated"] += len(stale)
+            self.generation += 1
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class CachingClient:
+    """Wraps a PetstoreClient so repeated GETs are answered from a ResponseCache
+
+    Every POST, PUT or DELETE goes to the server and invalidates what it may
+    have changed. GETs to the endpoint templates in `measured` always go to
+    the server, so the cache never hides the behaviour a test is checking.
+    """
+
+    def __init__(self, client, cache=None, measured=()):
+        self.client = client
+        self.cache = cache if cache is not None else ResponseCache()
+        # Endpoint templates such as "/pet/{petId}"; concrete paths are mapped onto theirs
+        self.measured = frozenset(endpoint_template(path) for path in measured)
+
+    def cacheable(self, path, kwargs):
+        return kwargs.keys() <= CACHEABLE_ARGS and endpoint_template(path) not in self.measured
+
+    def get(self, path, **kwargs):
+        if not self.cacheable(path, kwargs):
+            return self.client.get(path, **kwargs)
+        key = self.cache.key(path, kwargs.get("params"))
+        generation = self.cache.generation
+        response = self.cache.get(key)
+        if response is None:
+            response = self.client.get(path, **kwargs)
+            if response.status_code == 200:
+                self.cache.put(key, response, generation)
+        return response
+
+    def write(self, method, path, **kwargs):
+        try:
+            return self.client.request(method, path, **kwargs)
+        finally:
+            # Even a failed write may have reached the server
+            self.cache.invalidate(path)
+
+    def post(self, path, **kwargs):
+        return self.write("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.write("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.write("DELETE", path, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        if method == "GET":
+            return self.get(path, **kwargs)
+        return self.write(method, path, **kwargs)
+
+
+# Hits, misses and invalidations summed over every test's cache, for the session report
+totals = Counter()
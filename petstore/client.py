@@ -0,0 +1,158 @@
+"""Shared pooled HTTP client for the Petstore API"""
+import time
+
+import requests
+
+from petstore import metrics
+from petstore.live import LiveMetrics, live as live_metrics
+from petstore.schemas import SchemaLog, schema_log
+from petstore.throttle import RetryPolicy, ThrottleLog, TokenBucket, parse_retry_after, throttle_log
+from petstore.timing import PhaseLog, TimedAdapter, phase_log
+
+URL = "https://petstore.swagger.io/v2"
+
+# Matches the largest ThreadPoolExecutor in the suite so no worker waits on a connection
+POOL_SIZE = 20
+
+# (connect, read) timeout applied to every call that doesn't pass its own
+TIMEOUT = (5, 10)
+
+
+class PetstoreClient:
+    """Keep-alive client that every test shares instead of module level requests calls"""
+
+    def __init__(
+        self, base_url=URL, pool_size=POOL_SIZE, timeout=TIMEOUT, recorder=None, capture=None,
+        limiter=None, retry=None, throttle=None, schemas=None, phases=None, live=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.recorder = recorder if recorder is not None else metrics.recorder
+        # One bucket for every thread sharing this client, so together they stay under the server's limit
+        self.limiter = limiter if limiter is not None else TokenBucket()
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.throttle = throttle if throttle is not None else throttle_log
+        # Every JSON body is checked against the Petstore schema and violations logged here
+        self.schemas = schemas if schemas is not None else schema_log
+        # DNS, connect, TLS, first byte and transfer time of every request, per endpoint
+        self.phases = phases if phases is not None else phase_log
+        # In-flight count, status counts and rolling percentiles, readable while the run is going
+        self.live = live if live is not None else live_metrics
+        # Optional petstore.replay.TrafficCapture that logs every request and response
+        self.capture = capture
+        self.session = requests.Session()
+
+        # Block rather than open throwaway connections when every pooled one is busy
+        self.adapter = TimedAdapter(pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", self.adapter)
+        self.session.mount("https://", self.adapter)
+
+    @classmethod
+    def isolated(cls, base_url=URL, **kwargs):
+        """Client whose calls stay out of the session's latency, status, phase, schema, retry and live reports"""
+        kwargs.setdefault("recorder", metrics.Recorder())
+        kwargs.setdefault("phases", PhaseLog())
+        kwargs.setdefault("schemas", SchemaLog())
+        kwargs.setdefault("throttle", ThrottleLog())
+        kwargs.setdefault("live", LiveMetrics(enabled=False))
+        return cls(base_url, **kwargs)
+
+    def request(self, method, path, **kwargs):
+        """Send a request to a path relative to the base URL, retrying when the server allows it"""
+        kwargs.setdefault("timeout", self.timeout)
+        attempt = 0
+        while True:
+            self.throttle.limited(self.limiter.acquire())
+            try:
+                response = self.send(method, path, kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                if method not in self.retry.methods or attempt >= self.retry.retries:
+                    raise
+                self.back_off(method, path, attempt, type(exc).__name__)
+                attempt += 1
+                continue
+
+            status = response.status_code
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if status == 429:
+                self.limiter.throttled(retry_after)
+            elif status < 500:
+                self.limiter.succeeded()
+            if not self.retry.should_retry(method, status):
+                return response
+            if attempt >= self.retry.retries:
+                self.throttle.exhausted()
+                return response
+            # Frees the connection of a streamed response before it is sent again
+            response.close()
+            self.back_off(method, path, attempt, status, retry_after)
+            attempt += 1
+
+    def send(self, method, path, kwargs):
+        """Send one attempt, timing it as server latency apart from any throttling"""
+        timestamp = time.time()
+        started = time.perf_counter()
+        self.live.started()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", **kwargs)
+        except requests.RequestException as exc:
+            latency = time.perf_counter() - started
+            self.live.finished(method, path, type(exc).__name__, latency)
+            self.recorder.record(method, path, latency, type(exc).__name__)
+            raise
+        finished = time.perf_counter()
+        latency = finished - started
+        self.live.finished(method, path, response.status_code, latency)
+        self.recorder.record(method, path, latency, response.status_code)
+        phases = getattr(response.raw, "phases", None)
+        if phases is not None:
+            # A streamed body is still to be read, so only whoever reads it knows how long that takes
+            if not kwargs.get("stream"):
+                phases["transfer"] = finished - response.raw.first_byte_at
+            response.phases = phases
+            self.phases.record(method, path, phases)
+        if self.capture is not None:
+            self.capture.record(method, path, kwargs, response.status_code, latency, timestamp)
+        # Streamed bodies are validated item by item by whoever reads them
+        if not kwargs.get("stream") and response.content and "json" in response.headers.get("Content-Type", ""):
+            self.schemas.check(method, path, response.status_code, response.content)
+        return response
+
+    def back_off(self, method, path, attempt, reason, retry_after=None):
+        delay = self.retry.delay(attempt, retry_after)
+        self.throttle.retried(method, path, reason, delay)
+        time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def connection_stats(self):
+        """Count requests sent and connections opened across the pool"""
+        pools = self.adapter.poolmanager.pools
+        sent = opened = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                sent += pool.num_requests
+                opened += pool.num_connections
+        return {"requests": sent, "connections": opened, "reused": sent - opened}
+
+    def close(self):
+        self.session.close()
+        if self.capture is not None:
+            self.capture.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
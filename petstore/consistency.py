@@ -0,0 +1,255 @@
+"""Timestamped histories of concurrent writes and reads, checked for linearizability and lost writes"""
+import bisect
+import math
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+WRITE_KINDS = ("write", "create")
+
+
+class Operation:
+    """One write or read of one register, such as the name of one pet
+
+    ok is True for an acknowledged write, False for a rejected one and None when
+    the outcome is unknown, e.g. the connection failed after sending.
+    """
+
+    __slots__ = ("process", "kind", "key", "value", "invoked", "completed", "ok")
+
+    def __init__(self, process, kind, key, value, invoked, completed, ok=True):
+        self.process = process
+        self.kind = kind
+        self.key = key
+        self.value = value
+        self.invoked = invoked
+        self.completed = completed
+        self.ok = ok
+
+    def __repr__(self):
+        return f"{self.kind} {self.key}={self.value!r} by {self.process} [{self.invoked:.6f}, {self.completed:.6f}]"
+
+
+class History:
+    """Thread-safe log of operations, timed with one monotonic clock"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations = []
+
+    def add(self, process, kind, key, value, invoked, completed, ok=True):
+        operation = Operation(process, kind, key, value, invoked, completed, ok)
+        with self.lock:
+            self.operations.append(operation)
+        return operation
+
+    def __len__(self):
+        return len(self.operations)
+
+
+class Anomaly:
+    """A place where a history can't be explained by any sequential order"""
+
+    def __init__(self, kind, message, operations):
+        self.kind = kind
+        self.message = message
+        self.operations = operations
+
+    def __str__(self):
+        return f"{self.kind}: {self.message}"
+
+
+class Zone:
+    """Span over which a written value must have been the register's current value (Gibbons and Korach)"""
+
+    __slots__ = ("value", "start", "end", "cluster")
+
+    def __init__(self, value, start, end, cluster):
+        self.value = value
+        self.start = start
+        self.end = end
+        self.cluster = cluster
+
+
+def check_register(key, operations):
+    """Anomalies in the history of one register whose writes all write different values
+
+    With unique values every read names the write it saw, so the history is
+    linearizable exactly when each read follows its write, no two forward zones
+    overlap and no backward zone sits inside a forward zone. That is an
+    O(n log n) check instead of a search over orderings.
+    """
+    anomalies = []
+    writes = {}
+    reads = {}
+    for operation in operations:
+        if operation.kind in WRITE_KINDS:
+            if operation.value in writes:
+                raise ValueError(f"{key}: value {operation.value!r} is written twice; writes must be unique")
+            writes[operation.value] = operation
+        else:
+            reads.setdefault(operation.value, []).append(operation)
+
+    for value, seen in reads.items():
+        write = writes.get(value)
+        if write is None:
+            anomalies.append(Anomaly("unknown value", f"{key} read {value!r}, which nobody wrote", seen[:1]))
+            continue
+        if write.ok is False:
+            anomalies.append(Anomaly("failed write visible", f"{key} read {value!r} from a rejected write", [write]))
+        early = [read for read in seen if read.completed < write.invoked]
+        if early:
+            anomalies.append(Anomaly("future read", f"{key} read {value!r} before it was written", [write, early[0]]))
+
+    forward = []
+    backward = []
+    for value, write in writes.items():
+        cluster = [write] + reads.get(value, [])
+        if len(cluster) == 1 and not write.ok:
+            # A rejected or lost-in-flight write nobody saw needn't have happened at all
+            continue
+        # An unacknowledged write may take effect at any time after it was sent
+        end = min(math.inf if operation.ok is None else operation.completed for operation in cluster)
+        start = max(operation.invoked for operation in cluster)
+        if end < start:
+            forward.append(Zone(value, end, start, cluster))
+        else:
+            backward.append(Zone(value, start, end, cluster))
+
+    forward.sort(key=lambda zone: zone.start)
+    for before, after in zip(forward, forward[1:]):
+        if after.start < before.end:
+            anomalies.append(Anomaly(
+                "order",
+                f"{key} was read as {before.value!r} after {after.value!r} was current and the other way round",
+                [before.cluster[0], after.cluster[0]],
+            ))
+
+    # Forward zones found to overlap above are reported already, so containment is checked against sorted starts
+    starts = [zone.start for zone in forward]
+    for zone in backward:
+        index = bisect.bisect_right(starts, zone.start) - 1
+        if index < 0 or forward[index].end <= zone.end or forward[index].start >= zone.start:
+            continue
+        current = forward[index]
+        write = zone.cluster[0]
+        if len(zone.cluster) == 1:
+            anomalies.append(Anomaly(
+                "lost write",
+                f"{key}={write.value!r} was acknowledged but {current.value!r} was read both before and after it",
+                [write, current.cluster[0]],
+            ))
+        else:
+            anomalies.append(Anomaly(
+                "stale read",
+                f"{key} read {write.value!r} while {current.value!r} had to be current",
+                [zone.cluster[-1], current.cluster[0]],
+            ))
+    return anomalies
+
+
+def duplicate_creates(key, operations):
+    """Creates of the same resource that were all acknowledged, where only one should win"""
+    created = [operation for operation in operations if operation.kind == "create" and operation.ok]
+    if len(created) <= 1:
+        return []
+    return [Anomaly("duplicate create", f"{key} was created {len(created)} times", created)]
+
+
+def check(history):
+    """Every anomaly in a history, register by register"""
+    by_key = {}
+    for operation in history.operations:
+        by_key.setdefault(operation.key, []).append(operation)
+    anomalies = []
+    for key, operations in by_key.items():
+        anomalies += duplicate_creates(key, operations)
+        anomalies += check_register(key, operations)
+    return anomalies
+
+
+def timed(client_call, *args, **kwargs):
+    """Make a call, returning (invoked, completed, response); response is None if the call failed"""
+    invoked = time.perf_counter()
+    try:
+        response = client_call(*args, **kwargs)
+    except requests.RequestException:
+        response = None
+    return invoked, time.perf_counter(), response
+
+
+def pet_workload(client, pet_id, workers=10, operations=100, read_ratio=0.5, seed=None):
+    """Interleave PUT /pet, POST /pet/{petId} form updates and reads of one pet from many workers
+
+    The pet's name and status are two registers. Every write uses values no
+    other write uses, so each read says exactly which write it saw. Writes that
+    overlap may legally apply in either order, so a few busy workers expose lost
+    writes better than many.
+    """
+    history = History()
+    path = f"/pet/{pet_id}"
+
+    invoked, completed, response = timed(
+        client.post, "/pet", json={"id": pet_id, "name": "n0", "status": "s0", "photoUrls": []}
+    )
+    if response is None or response.status_code != 200:
+        raise RuntimeError(f"Could not create pet {pet_id} for the workload")
+    history.add("setup", "write", "name", "n0", invoked, completed)
+    history.add("setup", "write", "status", "s0", invoked, completed)
+
+    def worker(process):
+        rng = random.Random(None if seed is None else seed * 1000 + process)
+        for index in range(operations):
+            name, status = f"n{process}-{index}", f"s{process}-{index}"
+            roll = rng.random()
+            if roll < read_ratio:
+                invoked, completed, response = timed(client.get, path)
+                if response is not None and response.status_code == 200:
+                    pet = response.json()
+                    history.add(process, "read", "name", pet.get("name"), invoked, completed)
+                    history.add(process, "read", "status", pet.get("status"), invoked, completed)
+                continue
+            if roll < read_ratio + (1 - read_ratio) / 2:
+                pet = {"id": pet_id, "name": name, "status": status, "photoUrls": []}
+                invoked, completed, response = timed(client.put, "/pet", json=pet)
+                written = {"name": name, "status": status}
+            else:
+                # A form update changes one field, so the other must survive it
+                field, value = rng.choice((("name", name), ("status", status)))
+                invoked, completed, response = timed(client.post, path, data={field: value})
+                written = {field: value}
+            ok = None if response is None else response.status_code == 200
+            for key, value in written.items():
+                history.add(process, "write", key, value, invoked, completed, ok)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    return history
+
+
+def order_workload(client, order, workers=20, reads=5):
+    """Place the same order id from many workers at once, each with its own quantity, then read it back
+
+    Only one of the conflicting creates should be accepted, and every read
+    must agree with some order in which they were applied.
+    """
+    history = History()
+    barrier = threading.Barrier(workers)
+
+    def worker(process):
+        placed = {**order, "quantity": process + 1}
+        barrier.wait()
+        invoked, completed, response = timed(client.post, "/store/order", json=placed)
+        ok = None if response is None else response.status_code == 200
+        history.add(process, "create", "quantity", placed["quantity"], invoked, completed, ok)
+        for _ in range(reads):
+            invoked, completed, response = timed(client.get, f"/store/order/{order['id']}")
+            if response is not None and response.status_code == 200:
+                history.add(process, "read", "quantity", response.json().get("quantity"), invoked, completed)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(worker, range(workers)))
+    return history
@@ -0,0 +1,271 @@
+"""Load generation spread over agents on several hosts, run by a coordinator over plain TCP sockets
+
+Agents connect to the coordinator, which sends each of them the same endpoint
+mix and a share of the arrival schedule, starts them all at once, and merges
+the counters and histograms they send back into one report. Every message is
+one line of JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+
+from petstore import metrics
+from petstore.history import load_log
+from petstore.load import Call, LoadEngine, LoadResult, absorb_output, process_output
+from petstore.metrics import Histogram
+from petstore.profiles import Constant, Share, profile_from_dict
+
+# A result message carries every histogram an agent kept, so lines can be long
+LINE_LIMIT = 2**24
+# Seconds between the progress summaries each agent streams while it runs
+PROGRESS_EVERY = 1.0
+
+
+async def send(writer, message):
+    writer.write(json.dumps(message, separators=(",", ":")).encode() + b"\n")
+    await writer.drain()
+
+
+async def receive(reader):
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("Peer closed the connection")
+    return json.loads(line)
+
+
+def call_to_dict(call):
+    if call.check is not None:
+        raise ValueError(f"{call.name}: per-item checks are functions and can't be sent to agents")
+    return {"method": call.method, "path": call.path, "weight": call.weight, "kwargs": call.kwargs}
+
+
+def call_from_dict(data):
+    return Call(data["method"], data["path"], data.get("weight", 1), **data.get("kwargs", {}))
+
+
+def parse_address(address):
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def progress(result):
+    """Compact running totals of a load run in progress"""
+    return {
+        "sent": sum(interval.sent for interval in result.intervals),
+        "completed": sum(interval.completed for interval in result.intervals),
+        "errors": sum(interval.errors for interval in result.intervals),
+        "latency": result.latency.to_dict(),
+    }
+
+
+class Agent:
+    """Runs its share of the coordinator's load when told to and streams back what it saw"""
+
+    def __init__(self, host, port, name=None):
+        self.host = host
+        self.port = port
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+
+    async def run(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port, limit=LINE_LIMIT)
+        try:
+            await send(writer, {"type": "hello", "name": self.name})
+            job = await receive(reader)
+            profile = Share(profile_from_dict(job["profile"]), job["index"], job["count"])
+            mix = [call_from_dict(call) for call in job["mix"]]
+            engine = LoadEngine(
+                job["base_url"], mix, concurrency=job["concurrency"], seed=job["seed"], profile=profile,
+                interval=job["interval"],
+            )
+            await send(writer, {"type": "ready"})
+            if (await receive(reader))["type"] != "start":
+                return
+            run = asyncio.create_task(engine.run())
+            while not run.done():
+                await asyncio.wait([run], timeout=PROGRESS_EVERY)
+                if not run.done() and engine.result is not None:
+                    await send(writer, {"type": "progress", **progress(engine.result)})
+            await send(writer, {"type": "result", "output": process_output(run.result())})
+        except ConnectionError:
+            # Nobody is left to tell
+            raise
+        except Exception as exc:
+            await send(writer, {"type": "error", "message": f"{type(exc).__name__}: {exc}"})
+            raise
+        finally:
+            writer.close()
+
+
+class Coordinator:
+    """Waits for a number of agents, hands each a share of the load and merges what they send back
+
+    The listening socket is bound when the coordinator is made, so agents can
+    be pointed at its address before run() is awaited.
+    """
+
+    def __init__(self, agents, host="127.0.0.1", port=0, timeout=30.0):
+        self.agents = agents
+        self.timeout = timeout
+        self.socket = socket.create_server((host, port))
+        self.progress = {}
+
+    @property
+    def address(self):
+        host, port = self.socket.getsockname()[:2]
+        return f"{host}:{port}"
+
+    def totals(self):
+        """Latest progress summed over every agent, with their latency histograms merged"""
+        totals = {"agents": len(self.progress), "sent": 0, "completed": 0, "errors": 0, "latency": Histogram()}
+        for message in self.progress.values():
+            for key in ("sent", "completed", "errors"):
+                totals[key] += message[key]
+            totals["latency"].merge(Histogram.from_dict(message["latency"]))
+        return totals
+
+    async def run(self, base_url, mix, profile, concurrency=100, seed=None, interval=1.0, on_progress=None):
+        """Run the load on every agent and return the merged LoadResult"""
+        try:
+            calls = [call_to_dict(call) for call in mix]
+        except ValueError:
+            self.socket.close()
+            raise
+        connected = asyncio.Queue()
+
+        async def accept(reader, writer):
+            await connected.put((reader, writer))
+
+        server = await asyncio.start_server(accept, sock=self.socket, limit=LINE_LIMIT)
+        peers = []
+        try:
+            async with asyncio.timeout(self.timeout):
+                while len(peers) < self.agents:
+                    reader, writer = await connected.get()
+                    hello = await receive(reader)
+                    peers.append((hello["name"], reader, writer))
+            server.close()
+
+            for index, (name, reader, writer) in enumerate(peers):
+                await send(writer, {
+                    "type": "job", "base_url": base_url, "mix": calls, "profile": profile.to_dict(),
+                    "index": index, "count": self.agents, "concurrency": max(1, concurrency // self.agents),
+                    "seed": None if seed is None else seed + index, "interval": interval,
+                })
+            async with asyncio.timeout(self.timeout):
+                for name, reader, writer in peers:
+                    await self.expect(name, reader, "ready")
+            # Write every start before waiting on any socket, so agents start within a network round trip
+            for name, reader, writer in peers:
+                writer.write(b'{"type":"start"}\n')
+            await asyncio.gather(*(writer.drain() for name, reader, writer in peers))
+            outputs = await asyncio.gather(*(self.follow(name, reader, on_progress) for name, reader, writer in peers))
+        finally:
+            server.close()
+            for name, reader, writer in peers:
+                writer.close()
+
+        result = LoadResult(profile.peak, profile.duration, concurrency, profile, interval)
+        result.processes = self.agents
+        for output in outputs:
+            absorb_output(result, output)
+        load_log.record(result)
+        return result
+
+    async def expect(self, name, reader, kind):
+        message = await receive(reader)
+        if message["type"] == "error":
+            raise RuntimeError(f"Agent {name} failed: {message['message']}")
+        if message["type"] != kind:
+            raise RuntimeError(f"Agent {name} sent {message['type']!r} instead of {kind!r}")
+        return message
+
+    async def follow(self, name, reader, on_progress):
+        """Collect an agent's progress until its result arrives"""
+        while True:
+            message = await receive(reader)
+            if message["type"] == "progress":
+                self.progress[name] = message
+                if on_progress is not None:
+                    on_progress(self.totals())
+            elif message["type"] == "result":
+                return message["output"]
+            elif message["type"] == "error":
+                raise RuntimeError(f"Agent {name} failed: {message['message']}")
+
+
+def start_local_agents(address, count):
+    """Start agents as local processes, e.g. to try distributed runs on one machine"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    return [
+        subprocess.Popen([sys.executable, "-m", "petstore.distributed", "agent", address], cwd=root)
+        for _ in range(count)
+    ]
+
+
+def run_distributed(
+    base_url, mix, agents, rate=None, duration=None, concurrency=100, profile=None, seed=None, interval=1.0,
+    host="127.0.0.1", port=0, local=True, on_progress=None,
+):
+    """Coordinate a run from synchronous code, starting the agents locally unless they run elsewhere"""
+    profile = profile if profile is not None else Constant(rate, duration)
+    coordinator = Coordinator(agents, host, port)
+    processes = start_local_agents(coordinator.address, agents) if local else []
+    try:
+        return asyncio.run(coordinator.run(base_url, mix, profile, concurrency, seed, interval, on_progress))
+    finally:
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def print_progress(totals):
+    print(
+        f"{totals['agents']} agents: {totals['sent']} sent, {totals['completed']} completed, "
+        f"{totals['errors']} errors, p99 {totals['latency'].percentile(99) * 1000:.1f}ms",
+        flush=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    agent = commands.add_parser("agent", help="Connect to a coordinator and generate load when it says so")
+    agent.add_argument("coordinator", help="Coordinator address, e.g. 10.0.0.5:7000")
+    coordinate = commands.add_parser("coordinate", help="Wait for agents, run the load and print the merged report")
+    coordinate.add_argument("--listen", default="0.0.0.0:7000", help="Address agents connect to (default 0.0.0.0:7000)")
+    coordinate.add_argument("--agents", type=int, required=True, help="Number of agents to wait for")
+    coordinate.add_argument("--base-url", required=True, help="API under load, e.g. http://10.0.0.9:8080/v2")
+    coordinate.add_argument(
+        "--mix", required=True, help='JSON file with a list of calls: [{"method": "GET", "path": "/store/inventory"}]'
+    )
+    coordinate.add_argument("--rate", type=float, required=True, help="Total requests per second over all agents")
+    coordinate.add_argument("--duration", type=float, required=True)
+    coordinate.add_argument("--concurrency", type=int, default=100, help="Total requests in flight over all agents")
+    args = parser.parse_args()
+
+    if args.command == "agent":
+        try:
+            asyncio.run(Agent(*parse_address(args.coordinator)).run())
+        except OSError as exc:
+            sys.exit(f"Lost the coordinator at {args.coordinator}: {exc}")
+        return
+    with open(args.mix, encoding="utf-8") as file:
+        mix = [call_from_dict(call) for call in json.load(file)]
+    host, port = parse_address(args.listen)
+    coordinator = Coordinator(args.agents, host, port)
+    print(f"Waiting for {args.agents} agents on {coordinator.address}", flush=True)
+    profile = Constant(args.rate, args.duration)
+    result = asyncio.run(coordinator.run(args.base_url, mix, profile, args.concurrency, on_progress=print_progress))
+    print(result.summary())
+    for line in metrics.recorder.report_lines():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+"""Schema-driven fuzzing of the Petstore models: generation, shrinking and batched concurrent runs"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+
+from petstore.client import POOL_SIZE
+from petstore.schemas import DEFINITIONS, FORMATS, VALIDATORS
+
+INTS = {
+    "int32": [0, 1, -1, 2**31 - 1, -2**31, 2**31, -2**31 - 1],
+    "int64": [0, 1, -1, 2**63 - 1, -2**63, 2**63, -2**63 - 1, 2**53 + 1, 2**31],
+}
+STRINGS = [
+    "", " ", "a", "Oreo", "名前", "🐶🐾", "e\u0301", "\u202eevil", "\x00", "line\nbreak", "  padded  ",
+    "'; DROP TABLE pet;--", "<script>alert(1)</script>", "%00%2F", "a/b?c#d", "..", "a" * 10000, "é" * 2000,
+]
+DATES = ["2024-11-20T10:00:00.000+0000", "2024-02-29T23:59:59Z", "1970-01-01T00:00:00Z", "2024-13-45", "tomorrow"]
+WRONG_TYPES = [True, 1.5, "1", [], {}]
+
+# How often a generated property is left out, sent as null, or sent as the wrong type
+MISSING_RATE = 0.1
+NULL_RATE = 0.05
+WRONG_TYPE_RATE = 0.1
+# How often a field with a fixed value, such as a namespaced id, uses it instead of the fuzzed one
+FIXED_RATE = 0.8
+
+
+class PayloadGenerator:
+    """Random payloads for one schema definition, biased towards boundaries, odd text and missing fields"""
+
+    def __init__(self, definition, seed=None, fixed=None):
+        self.definition = definition
+        self.random = random.Random(seed)
+        # Top-level field -> function turning the fuzzed value into the one to send, e.g. a namespaced id
+        self.fixed = fixed or {}
+
+    def text(self):
+        if self.random.random() < 0.7:
+            return self.random.choice(STRINGS)
+        # Any code point outside the surrogates, which JSON can't carry on their own
+        chars = []
+        for _ in range(self.random.randint(1, 20)):
+            point = self.random.randint(0x20, 0x10FFFF)
+            chars.append(chr(point if not 0xD800 <= point <= 0xDFFF else 0xFFFD))
+        return "".join(chars)
+
+    def value(self, schema):
+        if "$ref" in schema:
+            return self.object(DEFINITIONS[schema["$ref"]])
+        kind = schema["type"]
+        if kind == "object":
+            return self.object(schema)
+        if kind == "array":
+            return [self.value(schema["items"]) for _ in range(self.random.choice((0, 1, 1, 2, 5)))]
+        if kind == "integer":
+            fmt = schema.get("format", "int64")
+            if self.random.random() < 0.5:
+                return self.random.choice(INTS[fmt])
+            return self.random.randint(*FORMATS[fmt])
+        if kind == "string":
+            if schema.get("format") == "date-time":
+                return self.random.choice(DATES)
+            return self.text()
+        return self.random.random() < 0.5
+
+    def object(self, schema):
+        generated = {}
+        for name, prop in schema.get("properties", {}).items():
+            roll = self.random.random()
+            if roll < MISSING_RATE:
+                continue
+            if roll < MISSING_RATE + NULL_RATE:
+                generated[name] = None
+            elif roll < MISSING_RATE + NULL_RATE + WRONG_TYPE_RATE:
+                generated[name] = self.random.choice(WRONG_TYPES)
+            else:
+                generated[name] = self.value(prop)
+        return generated
+
+    def payload(self):
+        payload = self.object(DEFINITIONS[self.definition])
+        for name, make in self.fixed.items():
+            if name in payload and payload[name] is not None and self.random.random() < FIXED_RATE:
+                payload[name] = make(payload[name])
+        return payload
+
+    def cases(self, count):
+        return [self.payload() for _ in range(count)]
+
+
+def simpler(value):
+    """Smaller variants of a value to try while shrinking, simplest first"""
+    if value is None or value is False:
+        candidates = []
+    elif value is True:
+        candidates = [False]
+    elif isinstance(value, int):
+        # Only values strictly closer to 0, so shrinking can't swing back and forth
+        half = int(value / 2) if abs(value) < 2**53 else value // 2
+        candidates = [0, half, value - 1 if value > 0 else value + 1] if value else []
+    elif isinstance(value, float):
+        candidates = [0, int(value)]
+    elif isinstance(value, str):
+        candidates = ["", value[len(value) // 2:]]
+        # Cut ever smaller pieces off the end, so a long string shrinks in logarithmic steps
+        cut = len(value) // 2
+        while cut:
+            candidates.append(value[:-cut])
+            cut //= 2
+        if not value.isascii():
+            candidates.append("a" * len(value))
+    elif isinstance(value, list):
+        candidates = [[]] + [value[:index] + value[index + 1:] for index in range(len(value))]
+        for index, item in enumerate(value):
+            candidates += [value[:index] + [smaller] + value[index + 1:] for smaller in simpler(item)]
+    elif isinstance(value, dict):
+        candidates = [{key: item for key, item in value.items() if key != name} for name in value]
+        for name, item in value.items():
+            candidates += [{**value, name: smaller} for smaller in simpler(item)]
+    else:
+        candidates = []
+    unique = []
+    for candidate in candidates:
+        if candidate != value and candidate not in unique:
+            unique.append(candidate)
+    return unique
+
+
+def shrink(case, message, run, max_steps=500):
+    """Greedily reduce a failing case to a smaller one that still fails
+
+    Each step checks every simpler variant of the current case in one concurrent
+    batch through run(), then moves to the first that still fails.
+    """
+    for _ in range(max_steps):
+        candidates = simpler(case)
+        for candidate, result in zip(candidates, run(candidates)):
+            if result is not None:
+                case, message = candidate, result
+                break
+        else:
+            break
+    return case, message
+
+
+class Failure:
+    """A case that broke a property, and the smallest case found that still breaks it"""
+
+    def __init__(self, case, message):
+        self.case = case
+        self.message = message
+        self.shrunk = case
+        self.shrunk_message = message
+
+    def __str__(self):
+        return f"{self.shrunk_message}\n    minimal case: {self.shrunk!r:.500}"
+
+
+class FuzzResult:
+    """Outcome of checking a property against generated cases"""
+
+    def __init__(self, name):
+        self.name = name
+        self.cases = 0
+        self.failures = []
+        self.elapsed = 0.0
+
+    def summary(self):
+        return (
+            f"{self.name}: {self.cases} cases in {self.elapsed:.2f}s "
+            f"({self.cases / self.elapsed if self.elapsed else 0.0:.0f}/s), {len(self.failures)} failures"
+        )
+
+
+def run_property(prop, cases, workers=POOL_SIZE, batch_size=200, max_failures=5):
+    """Check a property on every case in concurrent batches, then shrink the failures
+
+    A property returns None when a case passes and a message when it fails.
+    Batches keep the number of cases in flight bounded and let a run stop
+    early once max_failures cases have failed.
+    """
+    result = FuzzResult(getattr(prop, "name", type(prop).__name__))
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        def run(batch):
+            return list(executor.map(prop, batch))
+
+        for start in range(0, len(cases), batch_size):
+            batch = cases[start:start + batch_size]
+            for case, message in zip(batch, run(batch)):
+                if message is not None:
+                    result.failures.append(Failure(case, message))
+            result.cases += len(batch)
+            if len(result.failures) >= max_failures:
+                break
+        for failure in result.failures[:max_failures]:
+            failure.shrunk, failure.shrunk_message = shrink(failure.case, failure.message, run)
+    result.elapsed = time.perf_counter() - started
+    return result
+
+
+def differences(sent, got, where="$", ignore=()):
+    """First place where got doesn't hold what was sent, or None; extra fields in got are fine"""
+    if isinstance(sent, dict):
+        if not isinstance(got, dict):
+            return f"{where}: sent an object, got {got!r:.80}"
+        for name, value in sent.items():
+            if name in ignore or value is None:
+                continue
+            if name not in got:
+                return f"{where}.{name}: missing"
+            problem = differences(value, got[name], f"{where}.{name}")
+            if problem:
+                return problem
+        return None
+    if isinstance(sent, list):
+        if not isinstance(got, list) or len(got) != len(sent):
+            return f"{where}: sent {len(sent)} items, got {got!r:.80}"
+        for index, (value, item) in enumerate(zip(sent, got)):
+            problem = differences(value, item, f"{where}[{index}]")
+            if problem:
+                return problem
+        return None
+    if sent != got or type(sent) is not type(got):
+        return f"{where}: sent {sent!r:.80}, got {got!r:.80}"
+    return None
+
+
+class RoundTrip:
+    """Property: a schema-valid payload is stored and reads back unchanged
+
+    Invalid payloads may be accepted or rejected, but must not break the
+    connection or return something that isn't JSON. Subclasses say how to
+    create, read and delete one model. Cases that keep a fuzzed id or
+    username instead of a namespaced one would overwrite and delete someone
+    else's data, so they are only sent when the API is local to the run.
+    """
+
+    name = "round trip"
+    definition = None
+    path = None
+    id_field = "id"
+    # Whether a successful create answers with the stored model
+    echoes = True
+
+    def __init__(self, client, allocator, local=False):
+        self.client = client
+        self.allocator = allocator
+        self.local = local
+
+    def generator(self, seed=None):
+        return PayloadGenerator(self.definition, seed, {"id": lambda _: self.allocator.next_id()})
+
+    def fresh(self, case):
+        """Copy of a case with new namespaced ids, so the same case can run concurrently while shrinking"""
+        payload = dict(case)
+        if self.allocator.owns(payload.get("id")):
+            payload["id"] = self.allocator.next_id()
+        return payload
+
+    def __call__(self, case):
+        payload = self.fresh(case)
+        if not self.local and not self.addressable(payload):
+            return None
+        try:
+            return self.check(payload, VALIDATORS[self.definition](payload) is None)
+        except (requests.RequestException, ValueError) as exc:
+            return f"{type(exc).__name__}: {exc}"
+
+    def addressable(self, payload):
+        """Whether this payload's id or username is the run's own, or left for the API to assign"""
+        key = payload.get(self.id_field)
+        return self.allocator.owns(key) or (self.id_field == "id" and not key)
+
+    def check(self, payload, valid):
+        response = self.client.post(self.path, json=payload)
+        if response.status_code != 200:
+            return f"POST {self.path} answered {response.status_code} to a valid payload" if valid else None
+        created = response.json()
+        key = self.key(payload, created)
+        try:
+            if not valid:
+                return None
+            problem = self.compare(payload, created) if self.echoes else None
+            if problem:
+                return f"POST {self.path} response: {problem}"
+            if not self.addressable(payload):
+                return None
+            read = self.client.get(self.item_path(key))
+            if read.status_code != 200:
+                return f"GET {self.path}/{key} answered {read.status_code} for a stored {self.definition}"
+            problem = VALIDATORS[self.definition](read.json())
+            if problem:
+                return f"GET {self.path}/{key} broke the schema at ${problem}"
+            problem = self.compare(payload, read.json())
+            return f"GET {self.path}/{key}: {problem}" if problem else None
+        finally:
+            if key is not None and (self.local or self.addressable(payload)):
+                self.client.delete(self.item_path(key))
+
+    def key(self, payload, created):
+        key = created.get("id") if isinstance(created, dict) else None
+        return key if type(key) is int else None
+
+    def item_path(self, key):
+        return f"{self.path}/{key}"
+
+    def compare(self, payload, stored):
+        # A missing or zero id asks the API to assign one
+        ignore = ("id",) if not payload.get("id") else ()
+        return differences(payload, stored, ignore=ignore)
+
+
+class PetRoundTrip(RoundTrip):
+    name = "pet round trip"
+    definition = "Pet"
+    path = "/pet"
+
+
+class OrderRoundTrip(RoundTrip):
+    name = "order round trip"
+    definition = "Order"
+    path = "/store/order"
+
+    def compare(self, payload, stored):
+        # The real API normalises shipDate to its own date-time format
+        ignore = ("shipDate",) + (("id",) if not payload.get("id") else ())
+        return differences(payload, stored, ignore=ignore)
+
+
+class UserRoundTrip(RoundTrip):
+    name = "user round trip"
+    definition = "User"
+    path = "/user"
+    id_field = "username"
+    echoes = False
+
+    def generator(self, seed=None):
+        fixed = {"id": lambda _: self.allocator.next_id(), "username": lambda value: self.allocator.name(value)}
+        return PayloadGenerator(self.definition, seed, fixed)
+
+    def fresh(self, case):
+        payload = super().fresh(case)
+        username = payload.get("username")
+        if self.allocator.owns(username):
+            unique = f"{self.allocator.next_id()}{username[len(self.allocator.prefix):]}"
+            payload["username"] = self.allocator.name(unique)
+        return payload
+
+    def key(self, payload, created):
+        username = payload.get("username")
+        # "", "." and ".." can't be put in a URL path as a username
+        return username if isinstance(username, str) and username not in ("", ".", "..") else None
+
+    def item_path(self, key):
+        return f"{self.path}/{quote(key, safe='')}"
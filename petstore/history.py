@@ -0,0 +1,397 @@
+"""Structured per-run performance reports, kept in an append-only SQLite store for trends and comparisons
+
+A report holds each endpoint's request count, rate, latency percentiles and
+status breakdown, the environment the run came from, and the load runs it
+made, along with the raw histograms so any two runs can be compared properly
+later. The store keeps every report as JSON, plus one row per endpoint per run
+in a table clustered by endpoint, so trend queries over thousands of runs are
+a single index range scan.
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+from petstore.metrics import PERCENTILES, dump_histograms, load_histograms
+from petstore.slo import find_regressions
+
+VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    label TEXT,
+    git TEXT,
+    requests INTEGER NOT NULL,
+    passed INTEGER,
+    failed INTEGER,
+    report TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS endpoints (
+    method TEXT NOT NULL,
+    endpoint TEXT NOT NULL,
+    run_id INTEGER NOT NULL REFERENCES runs (id),
+    count INTEGER NOT NULL,
+    rate REAL NOT NULL,
+    p50 REAL NOT NULL,
+    p90 REAL NOT NULL,
+    p99 REAL NOT NULL,
+    p999 REAL NOT NULL,
+    max REAL NOT NULL,
+    errors INTEGER NOT NULL,
+    client_errors INTEGER NOT NULL,
+    PRIMARY KEY (method, endpoint, run_id)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS runs_no_update BEFORE UPDATE ON runs
+BEGIN SELECT RAISE(ABORT, 'reports are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS runs_no_delete BEFORE DELETE ON runs
+BEGIN SELECT RAISE(ABORT, 'reports are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS endpoints_no_update BEFORE UPDATE ON endpoints
+BEGIN SELECT RAISE(ABORT, 'reports are append-only'); END;
+CREATE TRIGGER IF NOT EXISTS endpoints_no_delete BEFORE DELETE ON endpoints
+BEGIN SELECT RAISE(ABORT, 'reports are append-only'); END;
+"""
+
+# Trend lines are drawn with these, lowest to highest
+SPARKS = "▁▂▃▄▅▆▇█"
+
+METRICS = ("count", "rate", "p50", "p90", "p99", "p99.9", "max", "errors")
+
+
+def status_kind(status):
+    """Whether a status is a server or network error, a client error (4xx) or a success"""
+    if not str(status).isdigit():
+        return "error"
+    status = int(status)
+    return "error" if status >= 500 else "client_error" if status >= 400 else "ok"
+
+
+class LoadLog:
+    """The load runs a session made, with the test that made each, for the report's load profile"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.runs = []
+
+    def record(self, result):
+        profile = result.profile
+        run = {
+            "test": os.environ.get("PYTEST_CURRENT_TEST", "").rsplit(" ", 1)[0] or None,
+            "profile": str(profile) if profile is not None else f"{result.rate}/s for {result.duration}s",
+            "params": profile.to_dict() if profile is not None else None,
+            "concurrency": result.concurrency,
+            "processes": result.processes,
+            "requests": result.requests,
+            "elapsed": result.elapsed,
+            "throughput": result.throughput,
+            "p50": result.percentile(50),
+            "p99": result.percentile(99),
+            "errors": dict(result.errors),
+        }
+        with self.lock:
+            self.runs.append(run)
+
+    def to_dict(self):
+        with self.lock:
+            return {"runs": list(self.runs)}
+
+    def absorb(self, data):
+        """Add load runs made elsewhere, e.g. by another worker process"""
+        with self.lock:
+            self.runs.extend(data["runs"])
+
+    def report_lines(self):
+        with self.lock:
+            runs = list(self.runs)
+        if not runs:
+            return []
+        width = max(len(run["test"] or "-") for run in runs)
+        lines = [f"{'test':<{width}} {'requests':>8} {'req/s':>7} {'p50':>8} {'p99':>8} {'errors':>6}  profile"]
+        for run in runs:
+            profile = run["profile"]
+            if run["processes"] > 1:
+                profile = f"{profile} from {run['processes']} processes"
+            lines.append(
+                f"{run['test'] or '-':<{width}} {run['requests']:>8} {run['throughput']:>7.0f} "
+                f"{run['p50'] * 1000:>6.1f}ms {run['p99'] * 1000:>6.1f}ms {sum(run['errors'].values()):>6}  {profile}"
+            )
+        return lines
+
+
+# Fed by the load engine, so the report shows what load each run applied
+load_log = LoadLog()
+
+
+def git_describe():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        described = subprocess.run(
+            ["git", "describe", "--always", "--dirty"], cwd=root, capture_output=True, text=True, timeout=5,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return described.stdout.strip() or None
+
+
+def environment(base_url=None, workers=None, args=()):
+    """Where and how a run happened, so runs are only compared like for like"""
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "hostname": socket.gethostname(),
+        "cpus": os.cpu_count(),
+        "git": git_describe(),
+        "base_url": base_url,
+        "workers": workers,
+        "args": list(args),
+    }
+
+
+def build_report(histograms, statuses, started, finished, env=None, loads=(), outcome=None, label=None):
+    """Report of one run from its per-endpoint histograms and {(method, template): {status: count}}"""
+    duration = max(finished - started, 1e-9)
+    endpoints = []
+    for key in sorted(set(histograms) | set(statuses), key=lambda key: (key[1], key[0])):
+        histogram = histograms.get(key)
+        counts = {str(status): count for status, count in sorted(statuses.get(key, {}).items(), key=str)}
+        kinds = {"error": 0, "client_error": 0, "ok": 0}
+        for status, count in counts.items():
+            kinds[status_kind(status)] += count
+        count = histogram.count if histogram is not None else 0
+        endpoints.append({
+            "method": key[0],
+            "endpoint": key[1],
+            "count": count,
+            "rate": count / duration,
+            **{f"p{pct:g}": histogram.percentile(pct) if histogram else 0.0 for pct in PERCENTILES},
+            "max": histogram.max / 1000000 if histogram else 0.0,
+            "mean": histogram.mean if histogram else 0.0,
+            "statuses": counts,
+            "errors": kinds["error"],
+            "client_errors": kinds["client_error"],
+        })
+    requests = sum(endpoint["count"] for endpoint in endpoints)
+    return {
+        "version": VERSION,
+        "label": label,
+        "started": started,
+        "finished": finished,
+        "duration": duration,
+        "outcome": outcome or {},
+        "environment": env or {},
+        "load": {"requests": requests, "throughput": requests / duration, "runs": list(loads)},
+        "endpoints": endpoints,
+        "histograms": dump_histograms(histograms),
+    }
+
+
+class ReportStore:
+    """Append-only SQLite store of run reports"""
+
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(SCHEMA)
+
+    def add(self, report):
+        """Append a report and return its run id"""
+        outcome = report.get("outcome", {})
+        with self.db:
+            cursor = self.db.execute(
+                "INSERT INTO runs (started, duration, label, git, requests, passed, failed, report) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    report["started"], report["duration"], report.get("label"),
+                    report.get("environment", {}).get("git"), report["load"]["requests"],
+                    outcome.get("passed"), outcome.get("failed"), json.dumps(report, separators=(",", ":")),
+                ),
+            )
+            run_id = cursor.lastrowid
+            self.db.executemany(
+                "INSERT INTO endpoints VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        endpoint["method"], endpoint["endpoint"], run_id, endpoint["count"], endpoint["rate"],
+                        endpoint["p50"], endpoint["p90"], endpoint["p99"], endpoint["p99.9"], endpoint["max"],
+                        endpoint["errors"], endpoint["client_errors"],
+                    )
+                    for endpoint in report["endpoints"]
+                ],
+            )
+        return run_id
+
+    def resolve(self, run):
+        """Run id from an id, or from a negative index counting back from the latest run (-1)"""
+        run = int(run)
+        if run > 0:
+            return run
+        row = self.db.execute("SELECT id FROM runs ORDER BY id DESC LIMIT 1 OFFSET ?", (-run - 1,)).fetchone()
+        if row is None:
+            raise LookupError(f"No run {run}: the store has fewer runs")
+        return row["id"]
+
+    def report(self, run):
+        run_id = self.resolve(run)
+        row = self.db.execute("SELECT report FROM runs WHERE id = ?", (run_id,)).fetchone()
+        if row is None:
+            raise LookupError(f"No run {run_id}")
+        report = json.loads(row["report"])
+        report["id"] = run_id
+        return report
+
+    def runs(self, last=20):
+        rows = self.db.execute(
+            "SELECT id, started, duration, label, git, requests, passed, failed FROM runs ORDER BY id DESC LIMIT ?",
+            (last,),
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def endpoints(self):
+        rows = self.db.execute("SELECT DISTINCT method, endpoint FROM endpoints ORDER BY endpoint, method")
+        return [(row["method"], row["endpoint"]) for row in rows]
+
+    def trend(self, method, endpoint, last=30):
+        """One endpoint's rows over its last runs, oldest first"""
+        rows = self.db.execute(
+            "SELECT e.*, r.started, r.git, r.label FROM endpoints e JOIN runs r ON r.id = e.run_id "
+            "WHERE e.method = ? AND e.endpoint = ? ORDER BY e.run_id DESC LIMIT ?",
+            (method, endpoint, last),
+        ).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def sparkline(values):
+    if not values:
+        return ""
+    low, high = min(values), max(values)
+    span = (high - low) or 1.0
+    return "".join(SPARKS[min(len(SPARKS) - 1, int((value - low) / span * len(SPARKS)))] for value in values)
+
+
+def value_text(metric, value):
+    if metric in ("count", "errors"):
+        return f"{value:.0f}"
+    if metric == "rate":
+        return f"{value:.1f}/s"
+    return f"{value * 1000:.1f}ms"
+
+
+def trend_lines(store, endpoints=None, metric="p99", last=30):
+    """Per endpoint, a sparkline of a metric over the last runs and its change from first to last"""
+    keys = store.endpoints()
+    if endpoints:
+        keys = [key for key in keys if f"{key[0]} {key[1]}" in endpoints or key[1] in endpoints]
+    column = "p999" if metric == "p99.9" else metric
+    rows = []
+    for method, endpoint in keys:
+        values = [row[column] for row in store.trend(method, endpoint, last)]
+        if values:
+            rows.append((f"{method} {endpoint}", values))
+    if not rows:
+        return []
+    width = max(len(name) for name, _ in rows)
+    lines = [f"{metric} over the last {last} runs, oldest first"]
+    for name, values in rows:
+        change = f"{(values[-1] - values[0]) / values[0]:+.0%}" if values[0] else "-"
+        lines.append(
+            f"{name:<{width}} {sparkline(values):<{last}} {value_text(metric, values[0]):>9} -> "
+            f"{value_text(metric, values[-1]):>9} {change:>6} ({len(values)} runs)"
+        )
+    return lines
+
+
+def run_title(report):
+    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(report["started"]))
+    git = report.get("environment", {}).get("git") or "-"
+    return f"run {report['id']} at {started} ({git}{', ' + report['label'] if report.get('label') else ''})"
+
+
+def compare_lines(before, after):
+    """Per-endpoint changes between two reports, then any significant slowdown"""
+    old = {(row["method"], row["endpoint"]): row for row in before["endpoints"]}
+    new = {(row["method"], row["endpoint"]): row for row in after["endpoints"]}
+    keys = sorted(set(old) | set(new), key=lambda key: (key[1], key[0]))
+    width = max([len("endpoint")] + [len(f"{method} {endpoint}") for method, endpoint in keys])
+    lines = [
+        f"{run_title(before)} -> {run_title(after)}",
+        f"{'endpoint':<{width}} {'count':>13} {'p50':>21} {'p99':>21} {'errors':>11}",
+    ]
+    for key in keys:
+        a, b = old.get(key), new.get(key)
+        if a is None or b is None:
+            lines.append(f"{key[0] + ' ' + key[1]:<{width}} only in run {before['id'] if b is None else after['id']}")
+            continue
+        cells = [f"{a['count']:>5} -> {b['count']:>5}"]
+        for pct in ("p50", "p99"):
+            change = f"{(b[pct] - a[pct]) / a[pct]:+.0%}" if a[pct] else "-"
+            cells.append(f"{a[pct] * 1000:>6.1f} -> {b[pct] * 1000:>6.1f}ms {change:>5}")
+        cells.append(f"{a['errors']:>4} -> {b['errors']:>4}")
+        lines.append(f"{key[0] + ' ' + key[1]:<{width}} " + " ".join(cells))
+    regressions = find_regressions(load_histograms(before["histograms"]), load_histograms(after["histograms"]))
+    lines.append("significant slowdowns: " + ("none" if not regressions else ""))
+    lines += [f"  {regression}" for regression in regressions]
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="petstore-reports.db", help="Report store written by pytest --report")
+    commands = parser.add_subparsers(dest="command", required=True)
+    runs = commands.add_parser("runs", help="List the latest runs")
+    runs.add_argument("--last", type=int, default=20)
+    trend = commands.add_parser("trend", help="Show how each endpoint changed over the latest runs")
+    trend.add_argument("endpoints", nargs="*", help='Endpoints to show, e.g. "/user/login" or "GET /store/inventory"')
+    trend.add_argument("--metric", default="p99", choices=METRICS)
+    trend.add_argument("--last", type=int, default=30)
+    compare = commands.add_parser("compare", help="Compare two runs, by id or counting back from the latest (-1)")
+    compare.add_argument("before", type=int)
+    compare.add_argument("after", type=int, nargs="?", default=-1)
+    show = commands.add_parser("show", help="Print a run's full JSON report")
+    show.add_argument("run", type=int, nargs="?", default=-1)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        sys.exit(f"No report store at {args.db}; write one with pytest --report={args.db}")
+    with ReportStore(args.db) as store:
+        try:
+            if args.command == "runs":
+                for run in store.runs(args.last):
+                    started = time.strftime("%Y-%m-%d %H:%M", time.localtime(run["started"]))
+                    print(
+                        f"{run['id']:>6}  {started}  {run['duration']:>7.1f}s  {run['requests']:>8} requests  "
+                        f"{run['passed'] or 0:>4} passed {run['failed'] or 0:>4} failed  {run['git'] or '-'}"
+                        f"{'  ' + run['label'] if run['label'] else ''}"
+                    )
+            elif args.command == "trend":
+                print("\n".join(trend_lines(store, args.endpoints, args.metric, args.last)) or "No runs stored")
+            elif args.command == "compare":
+                print("\n".join(compare_lines(store.report(args.before), store.report(args.after))))
+            else:
+                print(json.dumps(store.report(args.run), indent=1))
+        except LookupError as exc:
+            sys.exit(str(exc))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Non-overlapping ids and names for parallel test workers"""
+import itertools
+import random
+import threading
+
+# Every run gets its own span of ids, split into one slot per worker
+ID_BASE = 10**11
+RUN_SPAN = 10**9
+SLOT_SIZE = 10**7
+MAX_SLOTS = RUN_SPAN // SLOT_SIZE
+MAX_RUNS = 10**6
+
+
+def new_run_id():
+    """Random run id, so concurrent runs against a shared API don't collide either"""
+    return random.randrange(MAX_RUNS)
+
+
+class IdAllocator:
+    """Hands out ids and name prefixes from the range reserved for one worker"""
+
+    def __init__(self, run_id, slot):
+        if not 0 <= slot < MAX_SLOTS:
+            raise ValueError(f"Worker slot {slot} is outside 0-{MAX_SLOTS - 1}")
+        self.run_id = run_id
+        self.slot = slot
+        self.first = ID_BASE + run_id * RUN_SPAN + slot * SLOT_SIZE
+        self.counter = itertools.count(self.first)
+        self.lock = threading.Lock()
+        self.prefix = f"t{run_id:05x}w{slot}_"
+
+    def next_id(self):
+        with self.lock:
+            value = next(self.counter)
+        if value >= self.first + SLOT_SIZE:
+            raise RuntimeError(f"Worker slot {self.slot} has used up its {SLOT_SIZE} ids")
+        return value
+
+    def reserve(self, count):
+        """First of count consecutive ids, for callers that number a large batch themselves"""
+        with self.lock:
+            first = next(self.counter)
+            self.counter = itertools.count(first + count)
+        if first + count > self.first + SLOT_SIZE:
+            raise RuntimeError(f"Worker slot {self.slot} has no room for {count} more ids")
+        return first
+
+    def name(self, base):
+        return f"{self.prefix}{base}"
+
+    def owns(self, value):
+        """Whether an id or name came from this allocator"""
+        if isinstance(value, str):
+            return value.startswith(self.prefix)
+        return type(value) is int and self.first <= value < self.first + SLOT_SIZE
+
+
+class Namespace:
+    """Ids and names for one test, deleted again when the test finishes"""
+
+    def __init__(self, allocator):
+        self.allocator = allocator
+        self.pets = []
+        self.orders = []
+        self.users = []
+
+    def pet_id(self):
+        pet_id = self.allocator.next_id()
+        self.pets.append(pet_id)
+        return pet_id
+
+    def order_id(self):
+        order_id = self.allocator.next_id()
+        self.orders.append(order_id)
+        return order_id
+
+    def user_id(self):
+        return self.allocator.next_id()
+
+    def username(self, base):
+        username = self.allocator.name(base)
+        self.users.append(username)
+        return username
+
+    def name(self, base):
+        """Worker-unique name for anything else the API stores, such as a pet status"""
+        return self.allocator.name(base)
+
+    def cleanup(self, client):
+        """Delete everything this namespace handed out; missing resources are ignored"""
+        for pet_id in self.pets:
+            client.delete(f"/pet/{pet_id}")
+        for order_id in self.orders:
+            client.delete(f"/store/order/{order_id}")
+        for username in self.users:
+            client.delete(f"/user/{username}")
+        self.pets.clear()
+        self.orders.clear()
+        self.users.clear()
@@ -0,0 +1,252 @@
+"""Correctness and latency of /store/inventory as the number of pets grows
+
+Pets are seeded in steps up to each dataset size, spread over many statuses
+of this run's own, and the client keeps the count it expects for each. At
+every size the inventory is read back repeatedly, first on its own and then
+while other threads move pets between statuses. Every read is checked
+against the expected counts and timed. A median that grows in step with
+the dataset means the server counts inventory by scanning every pet.
+
+    python -m petstore.inventory --base-url=http://localhost:8080/v2 --sizes=1000,10000,100000
+"""
+import argparse
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from petstore.client import POOL_SIZE, PetstoreClient
+from petstore.ids import IdAllocator, new_run_id
+from petstore.metrics import Histogram, Recorder
+from petstore.seeding import check, run_all
+
+SIZES = (1000, 10_000, 100_000)
+STATUSES = 50
+READS = 50
+UPDATERS = 4
+
+# Growth exponents of the median read time below FLAT look constant, above SCAN they look like a full scan
+FLAT = 0.25
+SCAN = 0.7
+
+
+class Point:
+    """Inventory reads at one dataset size, on their own (idle) and during status updates (busy)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.idle = Histogram()
+        self.busy = Histogram()
+        self.reads = 0
+        # Reads with a count the client can't explain, and reads whose counts don't add up to the pets seeded
+        self.wrong = 0
+        self.torn = 0
+        self.moves = 0
+        self.settled = True
+        self.example = None
+
+    @property
+    def correct(self):
+        return not self.wrong and not self.torn and self.settled
+
+    def line(self):
+        return (
+            f"{self.size:>8} {self.reads:>6} {ms(self.idle.percentile(50))} {ms(self.idle.percentile(99))} "
+            f"{ms(self.busy.percentile(50))} {ms(self.busy.percentile(99))} {self.moves:>6} "
+            f"{self.wrong:>6} {self.torn:>6}  " + ("ok" if self.correct else "WRONG")
+        )
+
+
+def ms(seconds):
+    return f"{seconds * 1000:>8.1f}ms"
+
+
+def growth_exponent(points):
+    """Slope of log median idle read time against log dataset size; 0 is flat, 1 is linear"""
+    pairs = [(math.log(point.size), math.log(point.idle.percentile(50))) for point in points if point.idle.count]
+    if len({size for size, _ in pairs}) < 2:
+        return None
+    mean_x = sum(x for x, _ in pairs) / len(pairs)
+    mean_y = sum(y for _, y in pairs) / len(pairs)
+    spread = sum((x - mean_x) ** 2 for x, _ in pairs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in pairs) / spread
+
+
+def curve_lines(points):
+    lines = [
+        f"{'pets':>8} {'reads':>6} {'idle p50':>10} {'idle p99':>10} {'busy p50':>10} {'busy p99':>10} "
+        f"{'moves':>6} {'wrong':>6} {'torn':>6}  counts"
+    ]
+    lines += [point.line() for point in points]
+    exponent = growth_exponent(points)
+    if exponent is not None:
+        if exponent < FLAT:
+            verdict = "flat, inventory doesn't depend on the number of pets"
+        elif exponent < SCAN:
+            verdict = "sublinear"
+        else:
+            verdict = "close to linear, inventory looks like a full scan of the pets"
+        lines.append(f"idle p50 grows as pets^{exponent:.2f}: {verdict}")
+    for point in points:
+        if point.example:
+            lines.append(f"first wrong read at {point.size} pets: {point.example}")
+    return lines
+
+
+class InventoryBenchmark:
+    """Grows a dataset of pets with known statuses and reads the inventory back at each size
+
+    Each updater thread owns its own share of the pets, so a pet is never
+    moved twice at once. Every move widens the range a status's count may
+    show from when its request is sent until its response comes back.
+    """
+
+    def __init__(
+        self, client, allocator, statuses=STATUSES, reads=READS, updaters=UPDATERS, workers=POOL_SIZE, seed=None,
+    ):
+        self.client = client
+        self.allocator = allocator
+        self.statuses = [allocator.name(f"inv{index}") for index in range(statuses)]
+        self.reads = reads
+        self.updaters = updaters
+        self.workers = workers
+        self.random = random.Random(seed)
+        self.pets = []
+        self.lock = threading.Lock()
+        # Counts each status may show: low once moves out have started, high once moves in have started
+        self.low = Counter()
+        self.high = Counter()
+        # Moves started so far, into and out of each status
+        self.moved_in = Counter()
+        self.moved_out = Counter()
+        self.errors = []
+
+    def grow(self, size):
+        """Add pets, round robin over the statuses, until there are size of them"""
+        statuses = self.statuses
+        pets = [
+            {"id": self.allocator.next_id(), "name": f"inventory-{index}", "status": statuses[index % len(statuses)]}
+            for index in range(len(self.pets), size)
+        ]
+        check(run_all([(self.client.post, "/pet", {"json": pet}) for pet in pets], self.workers), "inventory seeding")
+        self.pets += pets
+        for pet in pets:
+            self.low[pet["status"]] += 1
+            self.high[pet["status"]] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return Counter(self.low), Counter(self.high), Counter(self.moved_in), Counter(self.moved_out)
+
+    def read(self, point, histogram):
+        low, high, moved_in, moved_out = self.snapshot()
+        started = time.perf_counter()
+        response = self.client.get("/store/inventory")
+        histogram.record(time.perf_counter() - started)
+        check([response], "inventory")
+        _, _, moved_in_after, moved_out_after = self.snapshot()
+        counts = response.json()
+        point.reads += 1
+        for status in self.statuses:
+            # Anything started while the read was in flight may or may not be counted
+            least = low[status] - (moved_out_after[status] - moved_out[status])
+            most = high[status] + (moved_in_after[status] - moved_in[status])
+            if not least <= counts.get(status, 0) <= most:
+                point.wrong += 1
+                point.example = point.example or f"{status}: {counts.get(status, 0)}, expected {least}-{most}"
+                break
+        if sum(counts.get(status, 0) for status in self.statuses) != len(self.pets):
+            point.torn += 1
+        return counts
+
+    def move(self, pet):
+        """Move one pet to another status, returning whether it moved"""
+        old, new = pet["status"], self.random.choice(self.statuses)
+        if old == new:
+            return False
+        with self.lock:
+            self.low[old] -= 1
+            self.high[new] += 1
+            self.moved_out[old] += 1
+            self.moved_in[new] += 1
+        response = self.client.put("/pet", json={**pet, "status": new})
+        if response.status_code != 200:
+            self.errors.append(response)
+            return False
+        pet["status"] = new
+        with self.lock:
+            self.high[old] -= 1
+            self.low[new] += 1
+        return True
+
+    def update(self, pets, stopped, point):
+        while not stopped.is_set() and not self.errors:
+            if self.move(self.random.choice(pets)):
+                with self.lock:
+                    point.moves += 1
+
+    def measure(self, size):
+        """Grow to size pets and return its Point"""
+        self.grow(size)
+        point = Point(size)
+        for _ in range(self.reads):
+            self.read(point, point.idle)
+
+        stopped = threading.Event()
+        threads = [
+            threading.Thread(target=self.update, args=(self.pets[index::self.updaters], stopped, point), daemon=True)
+            for index in range(self.updaters)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            for _ in range(self.reads):
+                self.read(point, point.busy)
+        finally:
+            stopped.set()
+            for thread in threads:
+                thread.join()
+        if self.errors:
+            check(self.errors, "status update")
+
+        # With every move answered the counts must be exact again
+        counts = self.read(point, point.idle)
+        point.settled = all(counts.get(status, 0) == self.low[status] for status in self.statuses)
+        return point
+
+    def run(self, sizes=SIZES):
+        return [self.measure(size) for size in sorted(sizes)]
+
+    def cleanup(self):
+        paths = [f"/pet/{pet['id']}" for pet in self.pets]
+        check(run_all([(self.client.delete, path, {}) for path in paths], self.workers), "cleanup", allowed=(200, 404))
+        self.pets.clear()
+
+
+def main():
+    """Run the benchmark against an API and print the curve"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", required=True, help="API to measure, e.g. https://petstore.swagger.io/v2")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="Comma separated dataset sizes")
+    parser.add_argument("--statuses", type=int, default=STATUSES)
+    parser.add_argument("--reads", type=int, default=READS, help="Inventory reads per size, idle and busy each")
+    parser.add_argument("--updaters", type=int, default=UPDATERS, help="Threads moving pets between statuses")
+    args = parser.parse_args()
+
+    with PetstoreClient(args.base_url, recorder=Recorder()) as client:
+        benchmark = InventoryBenchmark(
+            client, IdAllocator(new_run_id(), 0), args.statuses, args.reads, args.updaters,
+        )
+        try:
+            points = []
+            for size in sorted(int(size) for size in args.sizes.split(",")):
+                points.append(benchmark.measure(size))
+                print(points[-1].line(), flush=True)
+        finally:
+            benchmark.cleanup()
+    print(*curve_lines(points), sep="\n")
+
+
+if __name__ == "__main__":
+    main()
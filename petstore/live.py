@@ -0,0 +1,266 @@
+"""Live view of a run in progress: Prometheus-style /metrics endpoint and a periodic terminal summary"""
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from petstore.metrics import Histogram, endpoint_template
+
+# Rolling rates and percentiles cover the last WINDOW seconds, kept as one bucket per second
+WINDOW = 10
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class Second:
+    """Everything that completed within one wall-clock second"""
+
+    __slots__ = ("second", "latency", "statuses")
+
+    def __init__(self, second):
+        self.second = second
+        self.latency = {}
+        self.statuses = Counter()
+
+
+def label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class LiveMetrics:
+    """Counters, an in-flight gauge and rolling per-endpoint histograms, updated as requests complete
+
+    status is the HTTP status code, or the exception's name when no response came back.
+    While not enabled, started and finished do nothing, so a run that doesn't
+    watch live metrics takes no lock for them on every request.
+    """
+
+    def __init__(self, window=WINDOW, enabled=True):
+        self.window = window
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.in_flight = 0
+        self.totals = Counter()
+        self.seconds = {}
+        self.sums = Counter()
+        self.recent = deque(maxlen=window + 1)
+
+    def started(self):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.in_flight += 1
+
+    def finished(self, method, path, status, seconds):
+        if not self.enabled:
+            return
+        key = (method, endpoint_template(path))
+        now = int(time.monotonic())
+        with self.lock:
+            self.in_flight -= 1
+            self.totals[key + (str(status),)] += 1
+            self.sums[key] += seconds
+            if not self.recent or self.recent[-1].second != now:
+                self.recent.append(Second(now))
+            bucket = self.recent[-1]
+            bucket.statuses[str(status)] += 1
+            histogram = bucket.latency.get(key)
+            if histogram is None:
+                histogram = bucket.latency[key] = Histogram()
+            histogram.record(seconds)
+
+    def statuses(self):
+        """Requests completed since the start, as {(method, template): {status: count}}"""
+        statuses = {}
+        with self.lock:
+            for (method, template, status), count in self.totals.items():
+                statuses.setdefault((method, template), {})[status] = count
+        return statuses
+
+    def to_dict(self):
+        """Counts and latency sums since the start; rolling windows stay with the process that saw them"""
+        with self.lock:
+            return {
+                "totals": [[*key, count] for key, count in self.totals.items()],
+                "sums": [[*key, total] for key, total in self.sums.items()],
+            }
+
+    def absorb(self, data):
+        """Add counts from another process, e.g. an xdist worker"""
+        with self.lock:
+            for method, template, status, count in data["totals"]:
+                self.totals[(method, template, status)] += count
+            for method, template, total in data["sums"]:
+                self.sums[(method, template)] += total
+
+    def rolling(self):
+        """Merged latency per endpoint, status counts and the span they cover, over the last window"""
+        now = time.monotonic()
+        cutoff = int(now) - self.window
+        latency = {}
+        statuses = Counter()
+        with self.lock:
+            buckets = [bucket for bucket in self.recent if bucket.second > cutoff]
+            for bucket in buckets:
+                statuses.update(bucket.statuses)
+                for key, histogram in bucket.latency.items():
+                    latency.setdefault(key, Histogram()).merge(histogram)
+        span = min(self.window, max(now - self.started_at, 1e-9))
+        return latency, statuses, span
+
+    def snapshot(self):
+        """Plain numbers for the terminal summary and tests"""
+        latency, statuses, span = self.rolling()
+        total = Histogram()
+        for histogram in latency.values():
+            total.merge(histogram)
+        failed = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+        with self.lock:
+            in_flight = self.in_flight
+            requests = sum(self.totals.values())
+        return {
+            "in_flight": in_flight,
+            "requests": requests,
+            "rps": total.count / span,
+            "error_rate": failed / total.count if total.count else 0.0,
+            "statuses": dict(statuses),
+            "p50": total.percentile(50),
+            "p99": total.percentile(99),
+        }
+
+    def render(self):
+        """Prometheus text exposition format"""
+        latency, statuses, span = self.rolling()
+        with self.lock:
+            totals = dict(self.totals)
+            sums = dict(self.sums)
+            in_flight = self.in_flight
+        lines = [
+            "# HELP petstore_in_flight Requests sent and not yet answered",
+            "# TYPE petstore_in_flight gauge",
+            f"petstore_in_flight {in_flight}",
+            "# HELP petstore_requests_total Requests completed, by endpoint and status or error",
+            "# TYPE petstore_requests_total counter",
+        ]
+        for (method, template, status), count in sorted(totals.items()):
+            lines.append(
+                f'petstore_requests_total{{method="{label(method)}",endpoint="{label(template)}",'
+                f'status="{label(status)}"}} {count}'
+            )
+        lines += [
+            f"# HELP petstore_requests_per_second Requests completed per second over the last {self.window}s",
+            "# TYPE petstore_requests_per_second gauge",
+            f"petstore_requests_per_second {sum(statuses.values()) / span:.3f}",
+            f"# HELP petstore_responses_per_second Completions per second by status over the last {self.window}s",
+            "# TYPE petstore_responses_per_second gauge",
+        ]
+        for status, count in sorted(statuses.items()):
+            lines.append(f'petstore_responses_per_second{{status="{label(status)}"}} {count / span:.3f}')
+        lines += [
+            f"# HELP petstore_latency_seconds Latency quantiles over the last {self.window}s; count and sum since start",
+            "# TYPE petstore_latency_seconds summary",
+        ]
+        counts = Counter()
+        for (method, template, status), count in totals.items():
+            counts[(method, template)] += count
+        for key in sorted(counts):
+            labels = f'method="{label(key[0])}",endpoint="{label(key[1])}"'
+            histogram = latency.get(key)
+            if histogram is not None:
+                for quantile in QUANTILES:
+                    lines.append(
+                        f'petstore_latency_seconds{{{labels},quantile="{quantile:g}"}} '
+                        f"{histogram.percentile(quantile * 100):.6f}"
+                    )
+            lines.append(f"petstore_latency_seconds_count{{{labels}}} {counts[key]}")
+            lines.append(f"petstore_latency_seconds_sum{{{labels}}} {sums[key]:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        snapshot = self.snapshot()
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(snapshot["statuses"].items()))
+        return (
+            f"{time.monotonic() - self.started_at:>5.0f}s  in flight {snapshot['in_flight']:>4}  "
+            f"{snapshot['rps']:>7.1f} req/s  errors {snapshot['error_rate']:>6.1%}  "
+            f"p50 {snapshot['p50'] * 1000:>6.1f}ms  p99 {snapshot['p99'] * 1000:>6.1f}ms  [{statuses}]"
+        )
+
+
+class MetricsServer:
+    """Serves live metrics at /metrics for Prometheus or curl, from a daemon thread"""
+
+    def __init__(self, live, host="127.0.0.1", port=0):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = live.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="petstore-metrics", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class LiveReporter:
+    """Writes a one-line summary every few seconds while a run is going"""
+
+    def __init__(self, live, every=5.0, write=print):
+        self.live = live
+        self.every = every
+        self.write = write
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def run(self):
+        while not self.stopped.wait(self.every):
+            self.write(self.live.summary())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="petstore-live-summary", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# Fed by the client and the load engine, so one endpoint shows everything in flight. Off unless the session
+# serves or prints live metrics or writes a run report, which takes its status counts from here.
+live = LiveMetrics(enabled=False)
@@ -0,0 +1,423 @@
+"""Open-loop asyncio load engine for the Petstore API"""
+import asyncio
+import multiprocessing
+import os
+import queue
+import random
+import time
+from collections import Counter
+
+import aiohttp
+
+from petstore import metrics
+from petstore.client import TIMEOUT
+from petstore.history import load_log
+from petstore.live import live as live_metrics
+from petstore.metrics import Histogram, endpoint_template
+from petstore.profiles import Constant, Share
+from petstore.resources import resources as resource_sampler
+from petstore.schemas import checked_items, schema_log
+from petstore.streaming import CHUNK_SIZE, JsonArrayParser, StreamStats, parse_log
+from petstore.timing import phase_log, trace_config, traced_phases
+
+
+class Call:
+    """One weighted entry of an endpoint mix"""
+
+    def __init__(self, method, path, weight=1, check=None, **kwargs):
+        self.method = method
+        self.path = path
+        self.weight = weight
+        # Optional per-item check for JSON array responses, applied while the body streams in
+        self.check = check
+        self.item_check = checked_items(method, path, check) if check is not None else None
+        # Passed straight through to aiohttp, e.g. params= or json=
+        self.kwargs = kwargs
+
+    @property
+    def name(self):
+        return f"{self.method} {self.path}"
+
+    def __getstate__(self):
+        # The schema-checking wrapper is a closure, so worker processes rebuild it from check
+        state = dict(self.__dict__)
+        del state["item_check"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.item_check = checked_items(self.method, self.path, self.check) if self.check is not None else None
+
+
+class Interval:
+    """Traffic that fell due within one slice of a load run"""
+
+    def __init__(self, start, length):
+        self.start = start
+        self.length = length
+        self.sent = 0
+        self.completed = 0
+        self.errors = 0
+        self.latency = Histogram()
+
+    @property
+    def offered_rate(self):
+        return self.sent / self.length
+
+    @property
+    def throughput(self):
+        return self.completed / self.length
+
+    @property
+    def error_rate(self):
+        return self.errors / self.sent if self.sent else 0.0
+
+
+
+class LoadResult:
+    """Outcome of a load run"""
+
+    def __init__(self, rate, duration, concurrency, profile=None, interval=1.0):
+        self.rate = rate
+        self.duration = duration
+        self.concurrency = concurrency
+        self.profile = profile
+        self.interval = interval
+        self.intervals = []
+        self.elapsed = 0.0
+        self.statuses = Counter()
+        self.errors = Counter()
+        # Latency counts from when a request was due, so queueing delay isn't hidden
+        self.latency = Histogram()
+        self.service_time = Histogram()
+        self.endpoints = {}
+        self.max_in_flight = 0
+        # Streamed items failing either the call's check or the schema, and whole bodies breaking the schema
+        self.violations = 0
+        self.schema_errors = 0
+        # How many processes generated the load, each with its own event loop
+        self.processes = 1
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values()) + sum(self.errors.values())
+
+    @property
+    def throughput(self):
+        return self.requests / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, pct):
+        """Latency in seconds at the given percentile"""
+        return self.latency.percentile(pct)
+
+    def to_dict(self):
+        """Counters and histograms only, so a worker process can send its result back cheaply"""
+        return {
+            "elapsed": self.elapsed,
+            "statuses": dict(self.statuses),
+            "errors": dict(self.errors),
+            "latency": self.latency.to_dict(),
+            "service_time": self.service_time.to_dict(),
+            "endpoints": metrics.dump_histograms(self.endpoints),
+            "max_in_flight": self.max_in_flight,
+            "violations": self.violations,
+            "schema_errors": self.schema_errors,
+            "intervals": [
+                [interval.sent, interval.completed, interval.errors, interval.latency.to_dict()]
+                for interval in self.intervals
+            ],
+        }
+
+    def absorb(self, data):
+        """Add the result of another process's share of the same run"""
+        self.elapsed = max(self.elapsed, data["elapsed"])
+        self.statuses.update({int(status): count for status, count in data["statuses"].items()})
+        self.errors.update(data["errors"])
+        self.latency.merge(Histogram.from_dict(data["latency"]))
+        self.service_time.merge(Histogram.from_dict(data["service_time"]))
+        for key, histogram in metrics.load_histograms(data["endpoints"]).items():
+            self.endpoints.setdefault(key, Histogram()).merge(histogram)
+        # Each process peaked on its own, so the sum is an upper bound
+        self.max_in_flight += data["max_in_flight"]
+        self.violations += data["violations"]
+        self.schema_errors += data["schema_errors"]
+        for index, (sent, completed, errors, latency) in enumerate(data["intervals"]):
+            interval = self.slice(index * self.interval)
+            interval.sent += sent
+            interval.completed += completed
+            interval.errors += errors
+            interval.latency.merge(Histogram.from_dict(latency))
+
+    def slice(self, offset):
+        # Nudge arrivals that land on a boundary through float error into the later slice
+        index = int(offset / self.interval + 1e-9)
+        while len(self.intervals) <= index:
+            self.intervals.append(Interval(len(self.intervals) * self.interval, self.interval))
+        return self.intervals[index]
+
+    def degradation(self, max_error_rate=0.01, latency_factor=3.0, latency_floor=0.05, min_requests=10):
+        """First interval where errors or p99 latency break away from the start of the run
+
+        Latency only counts as degraded once p99 is both latency_factor times the
+        first busy interval's and above latency_floor seconds, so jitter on a fast
+        server isn't mistaken for a limit.
+        """
+        baseline = None
+        for interval in self.intervals:
+            if interval.sent < min_requests:
+                continue
+            p99 = interval.latency.percentile(99)
+            if baseline is None:
+                baseline = p99
+            if interval.error_rate > max_error_rate or p99 > max(baseline * latency_factor, latency_floor):
+                return interval
+        return None
+
+    def interval_lines(self):
+        lines = [f"{'t':>6} {'offered':>8} {'achieved':>9} {'errors':>7} {'p50':>8} {'p99':>8}"]
+        for interval in self.intervals:
+            lines.append(
+                f"{interval.start:>5.0f}s {interval.offered_rate:>7.0f}/s {interval.throughput:>8.0f}/s "
+                f"{interval.error_rate:>6.1%} {interval.latency.percentile(50) * 1000:>6.1f}ms "
+                f"{interval.latency.percentile(99) * 1000:>6.1f}ms"
+            )
+        knee = self.degradation()
+        if knee is not None:
+            lines.append(f"degrades from {knee.start:g}s at {knee.offered_rate:.0f}/s offered")
+        return lines
+
+    def summary(self):
+        target = self.profile if self.profile is not None else f"{self.rate}/s"
+        if self.processes > 1:
+            target = f"{target} from {self.processes} processes"
+        return (
+            f"{self.requests} requests in {self.elapsed:.2f}s ({self.throughput:.0f}/s, "
+            f"target {target}), p50 {self.percentile(50) * 1000:.1f}ms, "
+            f"p99 {self.percentile(99) * 1000:.1f}ms, statuses {dict(self.statuses)}, "
+            f"errors {dict(self.errors)}, schema errors {self.schema_errors}"
+        )
+
+
+class LoadEngine:
+    """Fires an endpoint mix on an arrival schedule, regardless of how fast responses come back
+
+    The schedule is either a fixed rate and duration or a load profile such as
+    a ramp or spike from petstore.profiles.
+    """
+
+    def __init__(
+        self, base_url, mix, rate=None, duration=None, concurrency=100, seed=None, recorder=None,
+        profile=None, interval=1.0, phases=None, live=None, resources=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder if recorder is not None else metrics.recorder
+        self.phases = phases if phases is not None else phase_log
+        self.live = live if live is not None else live_metrics
+        # Measures how late this engine's event loop wakes, to tell a busy client from a slow server
+        self.resources = resources if resources is not None else resource_sampler
+        self.mix = mix
+        self.profile = profile if profile is not None else Constant(rate, duration)
+        self.rate = rate if rate is not None else self.profile.peak
+        self.duration = self.profile.duration
+        self.interval = interval
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        # The result of the run in progress, readable while it runs
+        self.result = None
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        result = self.result = LoadResult(self.rate, self.duration, self.concurrency, self.profile, self.interval)
+        slots = asyncio.Semaphore(self.concurrency)
+        weights = [call.weight for call in self.mix]
+        arrivals = self.profile.arrivals()
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+
+        session = aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=[trace_config()])
+        self.resources.watch(loop)
+        try:
+            async with session:
+                tasks = set()
+                start = loop.time()
+                due = next(arrivals, None)
+                while due is not None:
+                    # Launch everything that has come due, then sleep until the next one
+                    now = loop.time() - start
+                    while due is not None and due <= now:
+                        call = self.random.choices(self.mix, weights)[0]
+                        task = asyncio.create_task(self.fire(session, slots, call, start, due, result))
+                        tasks.add(task)
+                        task.add_done_callback(tasks.discard)
+                        due = next(arrivals, None)
+                    if due is not None:
+                        await asyncio.sleep(max(0.0, due - (loop.time() - start)))
+                if tasks:
+                    await asyncio.gather(*tasks)
+                result.elapsed = loop.time() - start
+        finally:
+            self.resources.unwatch(loop)
+        load_log.record(result)
+        return result
+
+    async def fire(self, session, slots, call, start, offset, result):
+        loop = asyncio.get_running_loop()
+        due = start + offset
+        interval = result.slice(offset)
+        interval.sent += 1
+        failed = True
+        marks = {}
+        async with slots:
+            self.in_flight += 1
+            result.max_in_flight = max(result.max_in_flight, self.in_flight)
+            started = loop.time()
+            self.live.started()
+            status = None
+            try:
+                async with session.request(
+                    call.method, self.base_url + call.path, trace_request_ctx=marks, **call.kwargs
+                ) as response:
+                    if call.check is not None and response.status == 200:
+                        stats = await self.stream_check(response, call.item_check)
+                        self.record_phases(call, marks)
+                        parse_log.record(call.method, call.path, stats)
+                        result.violations += not stats.ok
+                    else:
+                        body = await response.read()
+                        self.record_phases(call, marks)
+                        if body and "json" in response.content_type:
+                            error = schema_log.check(call.method, call.path, response.status, body)
+                            result.schema_errors += error is not None
+                    result.statuses[response.status] += 1
+                    status = response.status
+                    failed = response.status >= 400
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+                result.errors[type(exc).__name__] += 1
+                status = type(exc).__name__
+            finally:
+                self.in_flight -= 1
+            finished = loop.time()
+            self.live.finished(call.method, call.path, status, finished - started)
+        result.latency.record(finished - due)
+        result.service_time.record(finished - started)
+        interval.latency.record(finished - due)
+        interval.errors += failed
+        result.slice(finished - start).completed += 1
+        key = (call.method, endpoint_template(call.path))
+        result.endpoints.setdefault(key, Histogram()).record(finished - due)
+        self.recorder.record(call.method, call.path, finished - started, status)
+
+    def record_phases(self, call, marks):
+        """Record a request's phases once its body has been read"""
+        phases = traced_phases(marks, time.perf_counter())
+        if phases is not None:
+            self.phases.record(call.method, call.path, phases)
+
+    @staticmethod
+    async def stream_check(response, check):
+        """Check a JSON array body item by item as it arrives, stopping at the first failure"""
+        stats = StreamStats()
+        parser = JsonArrayParser()
+        async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+            stats.bytes += len(chunk)
+            started = time.perf_counter()
+            for item in parser.feed(chunk):
+                stats.items += 1
+                if not check(item):
+                    stats.violation = item
+                    break
+            stats.parse_seconds += time.perf_counter() - started
+            if stats.violation is not None:
+                return stats
+        parser.close()
+        return stats
+
+
+def run_load(base_url, mix, rate=None, duration=None, concurrency=100, seed=None, recorder=None, **kwargs):
+    """Run a load engine to completion from synchronous test code"""
+    return asyncio.run(LoadEngine(base_url, mix, rate, duration, concurrency, seed, recorder, **kwargs).run())
+
+
+def process_output(result):
+    """A load result and everything else this process recorded, as JSON-able counters and histograms"""
+    return {
+        "result": result.to_dict(),
+        "latency": metrics.dump_histograms(metrics.recorder.snapshot()),
+        "statuses": metrics.dump_statuses(metrics.recorder.statuses()),
+        "phases": phase_log.to_dict(),
+        "schema": schema_log.to_dict(),
+        "parse": parse_log.to_dict(),
+    }
+
+
+def absorb_output(result, output):
+    """Merge another process's process_output() into a result and into this process's logs"""
+    result.absorb(output["result"])
+    metrics.recorder.absorb(
+        metrics.load_histograms(output["latency"]), metrics.load_statuses(output.get("statuses", []))
+    )
+    phase_log.absorb(output["phases"])
+    schema_log.absorb(output["schema"])
+    parse_log.absorb(output["parse"])
+
+
+def load_worker(base_url, mix, profile, concurrency, seed, interval, barrier, results):
+    """Run one process's share of a load run, then send back only its counters and histograms"""
+    engine = LoadEngine(base_url, mix, concurrency=concurrency, seed=seed, profile=profile, interval=interval)
+    # Every process starts sending together, however long each took to start up
+    barrier.wait()
+    results.put(process_output(asyncio.run(engine.run())))
+
+
+def run_load_processes(
+    base_url, mix, rate=None, duration=None, concurrency=100, processes=None, seed=None, profile=None, interval=1.0,
+):
+    """Split a load run across processes, each with its own event loop, and merge their results
+
+    Each process sends every processes-th arrival of the schedule, so together
+    they follow the profile exactly. Calls and their checks must be picklable,
+    e.g. module-level functions rather than lambdas.
+    """
+    processes = processes or os.cpu_count()
+    profile = profile if profile is not None else Constant(rate, duration)
+    # A forked copy of a threaded test process can inherit locks held by other threads
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(processes)
+    results = context.Queue()
+    workers = [
+        context.Process(
+            target=load_worker,
+            args=(
+                base_url, mix, Share(profile, index, processes), max(1, concurrency // processes),
+                None if seed is None else seed + index, interval, barrier, results,
+            ),
+            daemon=True,
+        )
+        for index in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+
+    outputs = []
+    try:
+        while len(outputs) < processes:
+            try:
+                outputs.append(results.get(timeout=1.0))
+            except queue.Empty:
+                if any(worker.exitcode for worker in workers):
+                    barrier.abort()
+                    raise RuntimeError("A load worker process failed") from None
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    result = LoadResult(rate if rate is not None else profile.peak, profile.duration, concurrency, profile, interval)
+    result.processes = processes
+    for output in outputs:
+        absorb_output(result, output)
+    # Each process logged only its own share, in a log that went away with it
+    load_log.record(result)
+    return result
@@ -0,0 +1,296 @@
+"""Latency histograms for every call the suite makes to the Petstore API"""
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+# Path templates of the Petstore v2 API, so /pet/12345 and /pet/678 share one bucket
+TEMPLATES = [
+    "/pet",
+    "/pet/findByStatus",
+    "/pet/findByTags",
+    "/pet/{petId}",
+    "/pet/{petId}/uploadImage",
+    "/store/inventory",
+    "/store/order",
+    "/store/order/{orderId}",
+    "/user",
+    "/user/createWithList",
+    "/user/createWithArray",
+    "/user/login",
+    "/user/logout",
+    "/user/{username}",
+]
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+# Each power of two range is split into this many sub-buckets, for roughly 1.5% precision
+SUB_BUCKET_BITS = 7
+SUB_BUCKETS = 1 << SUB_BUCKET_BITS
+HALF_BUCKETS = SUB_BUCKETS >> 1
+# Latencies are kept in microseconds, up to 2**32us (about 71 minutes)
+MAX_SHIFT = 32 - SUB_BUCKET_BITS + 1
+BUCKETS = SUB_BUCKETS + MAX_SHIFT * HALF_BUCKETS
+
+
+@lru_cache(maxsize=4096)
+def endpoint_template(path):
+    """Map a concrete request path onto the API path template it belongs to"""
+    path = path.split("?", 1)[0]
+    if path in TEMPLATES:
+        return path
+    segments = path.strip("/").split("/")
+    for template in TEMPLATES:
+        parts = template.strip("/").split("/")
+        if len(parts) == len(segments) and all(
+            part.startswith("{") or part == segment for part, segment in zip(parts, segments)
+        ):
+            return template
+    return path
+
+
+def bucket_index(micros):
+    if micros < SUB_BUCKETS:
+        return micros
+    shift = micros.bit_length() - SUB_BUCKET_BITS
+    if shift > MAX_SHIFT:
+        return BUCKETS - 1
+    return SUB_BUCKETS + (shift - 1) * HALF_BUCKETS + (micros >> shift) - HALF_BUCKETS
+
+
+def bucket_value(index):
+    """Midpoint in microseconds of the values a bucket holds"""
+    if index < SUB_BUCKETS:
+        return index
+    shift, offset = divmod(index - SUB_BUCKETS, HALF_BUCKETS)
+    shift += 1
+    low = (offset + HALF_BUCKETS) << shift
+    return low + (1 << shift) // 2
+
+
+class Histogram:
+    """Fixed-memory log-linear latency histogram in the style of HdrHistogram"""
+
+    __slots__ = ("counts", "count", "total", "min", "max", "first", "last")
+
+    def __init__(self):
+        self.counts = [0] * BUCKETS
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.first = None
+        self.last = None
+
+    def record(self, seconds, at=None):
+        micros = max(0, int(seconds * 1000000))
+        self.counts[bucket_index(micros)] += 1
+        self.count += 1
+        self.total += micros
+        if self.min is None or micros < self.min:
+            self.min = micros
+        if micros > self.max:
+            self.max = micros
+        if at is not None:
+            if self.first is None:
+                self.first = at - seconds
+            self.last = at
+
+    def merge(self, other):
+        if not other.count:
+            return self
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        if other.first is not None:
+            self.first = other.first if self.first is None else min(self.first, other.first)
+            self.last = other.last if self.last is None else max(self.last, other.last)
+        return self
+
+    def percentile(self, pct):
+        """Latency in seconds below which pct percent of the recorded values fall"""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(self.count * pct / 100))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bucket_value(index), self.max) / 1000000
+        return self.max / 1000000
+
+    def to_dict(self):
+        """Compact JSON-able form that only keeps the buckets in use"""
+        return {
+            "counts": {index: count for index, count in enumerate(self.counts) if count},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "first": self.first,
+            "last": self.last,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls()
+        for index, count in data["counts"].items():
+            histogram.counts[int(index)] = count
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        histogram.first = data.get("first")
+        histogram.last = data.get("last")
+        return histogram
+
+    @property
+    def mean(self):
+        return self.total / self.count / 1000000 if self.count else 0.0
+
+    @property
+    def throughput(self):
+        """Calls per second between the first and last recorded call"""
+        if self.first is None or self.last <= self.first:
+            return 0.0
+        return self.count / (self.last - self.first)
+
+
+class Recorder:
+    """Per-thread histograms and status counts keyed by (method, endpoint template), merged only when read
+
+    Each thread records into its own dict of histograms, so the hot path never
+    takes a lock that would serialise the concurrency tests.
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.tables = []
+        self.counters = []
+
+    def table(self):
+        try:
+            return self.local.table
+        except AttributeError:
+            table = self.local.table = {}
+            with self.lock:
+                self.tables.append(table)
+            return table
+
+    def counter(self):
+        try:
+            return self.local.counter
+        except AttributeError:
+            counter = self.local.counter = Counter()
+            with self.lock:
+                self.counters.append(counter)
+            return counter
+
+    def record(self, method, path, seconds, status=None):
+        """Record a call's latency and, if given, the status code or exception name it ended with"""
+        key = (method, endpoint_template(path))
+        table = self.table()
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram()
+        # Wall clock, so windows recorded in different processes line up when merged
+        histogram.record(seconds, time.time())
+        if status is not None:
+            self.counter()[(*key, status)] += 1
+
+    def snapshot(self):
+        """Merged histogram per (method, endpoint template)"""
+        merged = {}
+        with self.lock:
+            tables = list(self.tables)
+        for table in tables:
+            for key, histogram in list(table.items()):
+                merged.setdefault(key, Histogram()).merge(histogram)
+        return merged
+
+    def statuses(self):
+        """Merged status counts as {(method, template): {status: count}}"""
+        with self.lock:
+            counters = list(self.counters)
+        totals = Counter()
+        for counter in counters:
+            totals.update(dict(counter))
+        statuses = {}
+        for (method, template, status), count in totals.items():
+            statuses.setdefault((method, template), {})[status] = count
+        return statuses
+
+    def absorb(self, histograms, statuses=None):
+        """Fold histograms and status counts recorded elsewhere, e.g. by another worker process, into this recorder"""
+        table = self.table()
+        for key, histogram in histograms.items():
+            table.setdefault(key, Histogram()).merge(histogram)
+        counter = self.counter()
+        for key, counts in (statuses or {}).items():
+            for status, count in counts.items():
+                counter[(*key, status)] += count
+
+    def clear(self):
+        with self.lock:
+            for table in self.tables:
+                table.clear()
+            for counter in self.counters:
+                counter.clear()
+
+    def report_lines(self):
+        snapshot = self.snapshot()
+        if not snapshot:
+            return []
+        total = Histogram()
+        rows = []
+        for (method, template), histogram in sorted(snapshot.items(), key=lambda item: (item[0][1], item[0][0])):
+            total.merge(histogram)
+            rows.append((f"{method} {template}", histogram))
+        rows.append(("all endpoints", total))
+
+        # Throughput is over the whole recorded window, not each endpoint's own burst
+        span = (total.last - total.first) if total.first is not None else 0.0
+        width = max(len(name) for name, _ in rows)
+        header = f"{'endpoint':<{width}} {'count':>7} " + " ".join(
+            f"{'p' + format(pct, 'g'):>8}" for pct in PERCENTILES
+        ) + f" {'max':>8} {'req/s':>8}"
+        lines = [header]
+        for name, histogram in rows:
+            cells = " ".join(f"{histogram.percentile(pct) * 1000:>6.1f}ms" for pct in PERCENTILES)
+            lines.append(
+                f"{name:<{width}} {histogram.count:>7} {cells} {histogram.max / 1000:>6.1f}ms "
+                f"{histogram.count / span if span > 0 else 0.0:>8.1f}"
+            )
+        return lines
+
+
+def dump_histograms(histograms):
+    """JSON-able form of a {(method, template): Histogram} mapping"""
+    return {f"{method} {template}": histogram.to_dict() for (method, template), histogram in histograms.items()}
+
+
+def load_histograms(data):
+    return {tuple(name.split(" ", 1)): Histogram.from_dict(histogram) for name, histogram in data.items()}
+
+
+def dump_statuses(statuses):
+    """JSON-able form of a {(method, template): {status: count}} mapping, keeping int statuses ints"""
+    return [[method, template, status, count] for (method, template), counts in statuses.items()
+            for status, count in counts.items()]
+
+
+def load_statuses(data):
+    statuses = {}
+    for method, template, status, count in data:
+        statuses.setdefault((method, template), {})[status] = count
+    return statuses
+
+
+# Shared by the client and the load engine so every call lands in one report
+recorder = Recorder()
@@ -0,0 +1,156 @@
+"""Named load profiles: how the arrival rate changes over a load run"""
+import itertools
+
+# Arrival times are found by integrating the rate in steps this long
+STEP = 0.001
+
+
+class Profile:
+    """Arrival rate over time; subclasses define rate_at()"""
+
+    name = "profile"
+    # Constructor arguments, so a profile can be sent to another machine as JSON
+    params = ("duration",)
+
+    def __init__(self, duration):
+        self.duration = duration
+
+    def rate_at(self, elapsed):
+        raise NotImplementedError
+
+    @property
+    def peak(self):
+        return max(self.rate_at(index * STEP) for index in range(int(self.duration / STEP)))
+
+    def arrivals(self):
+        """Seconds after the start at which each request is due"""
+        area = 0.0
+        sent = 0
+        steps = int(round(self.duration / STEP))
+        for index in range(steps):
+            start = index * STEP
+            rate = self.rate_at(start)
+            added = rate * STEP
+            # The rate is constant within a step, so place arrivals exactly inside it
+            while sent < area + added - 1e-9:
+                yield start + (sent - area) / rate
+                sent += 1
+            area += added
+
+    def __str__(self):
+        return f"{self.name} over {self.duration:g}s, peak {self.peak:g}/s"
+
+    def to_dict(self):
+        return {"profile": self.name, **{name: getattr(self, name) for name in self.params}}
+
+
+class Constant(Profile):
+    """Same rate for the whole run"""
+
+    name = "constant"
+    params = ("rate", "duration")
+
+    def __init__(self, rate, duration):
+        super().__init__(duration)
+        self.rate = rate
+
+    def rate_at(self, elapsed):
+        return self.rate
+
+    @property
+    def peak(self):
+        return self.rate
+
+    def arrivals(self):
+        # Exact for the common case, so rate * duration requests are always sent
+        for sent in range(int(round(self.rate * self.duration))):
+            yield sent / self.rate
+
+
+class Soak(Constant):
+    """Constant rate held for minutes, to surface leaks and slow degradation"""
+
+    name = "soak"
+
+
+class Ramp(Profile):
+    """Rate rising linearly from start to end"""
+
+    name = "ramp"
+    params = ("start", "end", "duration")
+
+    def __init__(self, start, end, duration):
+        super().__init__(duration)
+        self.start = start
+        self.end = end
+
+    def rate_at(self, elapsed):
+        return self.start + (self.end - self.start) * min(elapsed / self.duration, 1.0)
+
+
+class Step(Profile):
+    """Rate held at each level in turn for step_duration seconds"""
+
+    name = "step"
+    params = ("rates", "step_duration")
+
+    def __init__(self, rates, step_duration):
+        super().__init__(len(rates) * step_duration)
+        self.rates = rates
+        self.step_duration = step_duration
+
+    def rate_at(self, elapsed):
+        return self.rates[min(int(elapsed / self.step_duration), len(self.rates) - 1)]
+
+
+class Spike(Profile):
+    """Base rate with a sudden jump to peak_rate between spike_at and spike_at + spike_duration"""
+
+    name = "spike"
+    params = ("base", "peak_rate", "duration", "spike_at", "spike_duration")
+
+    def __init__(self, base, peak_rate, duration, spike_at, spike_duration):
+        super().__init__(duration)
+        self.base = base
+        self.peak_rate = peak_rate
+        self.spike_at = spike_at
+        self.spike_duration = spike_duration
+
+    def rate_at(self, elapsed):
+        if self.spike_at <= elapsed < self.spike_at + self.spike_duration:
+            return self.peak_rate
+        return self.base
+
+
+class Share(Profile):
+    """One of count equal parts of another profile, for one process of a multi-process run
+
+    Taking every count-th arrival keeps the shape of the whole profile, so the
+    parts add back up to exactly the original schedule.
+    """
+
+    def __init__(self, profile, index, count):
+        super().__init__(profile.duration)
+        self.profile = profile
+        self.index = index
+        self.count = count
+        self.name = f"{profile.name} share {index + 1}/{count}"
+
+    def rate_at(self, elapsed):
+        return self.profile.rate_at(elapsed) / self.count
+
+    @property
+    def peak(self):
+        return self.profile.peak / self.count
+
+    def arrivals(self):
+        return itertools.islice(self.profile.arrivals(), self.index, None, self.count)
+
+
+PROFILES = {profile.name: profile for profile in (Constant, Soak, Ramp, Step, Spike)}
+
+
+def profile_from_dict(data):
+    """Rebuild a profile sent as JSON by Profile.to_dict()"""
+    data = dict(data)
+    return PROFILES[data.pop("profile")](**data)
@@ -0,0 +1,376 @@
+"""Fault and latency injecting HTTP proxy, to put between the suite and a Petstore API
+
+Requests are relayed as they arrive, without buffering whole bodies, over one
+upstream keep-alive connection per client connection. Requests whose path
+matches a Fault pattern can be delayed, reset, answered with a 5xx or 429,
+have their response body cut short, or have it trickled out at a capped rate.
+"""
+import argparse
+import asyncio
+import fnmatch
+import json
+import random
+import socket
+import ssl
+import struct
+import threading
+from collections import Counter
+from urllib.parse import urlsplit
+
+from petstore.server import MAX_HEAD, PetstoreServer, api_response
+
+# Bodies are copied in pieces of at most this many bytes
+CHUNK = 64 * 1024
+
+ERROR_STATUSES = (500, 502, 503)
+
+# A capped body is written in slices this many seconds long, so it trickles rather than arrives in bursts
+PACE_SLICE = 0.02
+
+# Responses that never have a body, whatever their headers say
+NO_BODY = frozenset({204, 304})
+
+
+class Fault:
+    """Faults for requests whose path below the API base matches a glob such as /store/order/*
+
+    Each *_rate is the chance that a matching request gets that fault. delay is
+    in seconds, or a (low, high) range, and is added before the request is
+    forwarded. bandwidth caps the response body in bytes per second. A
+    truncated response keeps its headers but loses the second half of its
+    body, then the connection is closed.
+    """
+
+    def __init__(
+        self, pattern, methods=None, delay=0, delay_rate=1.0, bandwidth=None, reset_rate=0.0, truncate_rate=0.0,
+        error_rate=0.0, error_statuses=ERROR_STATUSES, throttle_rate=0.0, retry_after=None,
+    ):
+        self.pattern = pattern
+        self.methods = None if methods is None else frozenset(method.upper() for method in methods)
+        self.delay = delay
+        self.delay_rate = delay_rate
+        self.bandwidth = bandwidth
+        self.reset_rate = reset_rate
+        self.truncate_rate = truncate_rate
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    def matches(self, method, path):
+        return (self.methods is None or method in self.methods) and fnmatch.fnmatchcase(path, self.pattern)
+
+    def pause(self, rng):
+        if not self.delay or rng.random() >= self.delay_rate:
+            return 0
+        if isinstance(self.delay, (tuple, list)):
+            return rng.uniform(*self.delay)
+        return self.delay
+
+
+def load_faults(path):
+    """Faults from a JSON file holding a list of Fault arguments, e.g. [{"pattern": "/pet/*", "delay": 0.5}]"""
+    with open(path, encoding="utf-8") as file:
+        return [Fault.from_dict(fault) for fault in json.load(file)]
+
+
+def parse_head(head):
+    """Start line parts and (name, value) header pairs of a request or response head"""
+    start, *lines = head.decode("latin-1").split("\r\n")
+    headers = []
+    for line in lines:
+        if line:
+            name, _, value = line.partition(":")
+            headers.append((name.strip(), value.strip()))
+    return start.split(" ", 2), headers
+
+
+def header_map(headers):
+    return {name.lower(): value for name, value in headers}
+
+
+def keeps_alive(version, headers):
+    connection = headers.get("connection", "").lower()
+    return connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+
+
+async def body_pieces(reader, headers, to_close=False):
+    """Raw bytes of one message body as they arrive, chunked framing included"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            yield line
+            size = int(line.split(b";")[0], 16)
+            if size == 0:
+                # Trailers, up to the blank line that ends the body
+                while line != b"\r\n":
+                    line = await reader.readuntil(b"\r\n")
+                    yield line
+                return
+            async for piece in exactly(reader, size + 2):
+                yield piece
+    elif "content-length" in headers:
+        async for piece in exactly(reader, int(headers["content-length"])):
+            yield piece
+    elif to_close:
+        while piece := await reader.read(CHUNK):
+            yield piece
+
+
+async def exactly(reader, remaining):
+    while remaining:
+        piece = await reader.read(min(CHUNK, remaining))
+        if not piece:
+            raise asyncio.IncompleteReadError(b"", remaining)
+        remaining -= len(piece)
+        yield piece
+
+
+async def relay(pieces, writer, cut=None, bandwidth=None):
+    """Copy body pieces to writer; False if it stopped after cut bytes"""
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    sent = 0
+    size = max(1, int(bandwidth * PACE_SLICE)) if bandwidth else CHUNK
+    async for piece in pieces:
+        for offset in range(0, len(piece), size):
+            part = piece[offset:offset + size]
+            if cut is not None and sent + len(part) >= cut:
+                writer.write(part[:cut - sent])
+                await writer.drain()
+                return False
+            writer.write(part)
+            sent += len(part)
+            if bandwidth:
+                wait = started + sent / bandwidth - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+            await writer.drain()
+    return True
+
+
+def reset(writer):
+    """Close with a TCP RST rather than a FIN, as a crashed server or middlebox would"""
+    sock = writer.get_extra_info("socket")
+    if sock is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+    writer.transport.abort()
+
+
+class FaultProxy:
+    """Relays HTTP/1.1 to an upstream API from a background event loop thread, injecting faults
+
+    The first fault whose pattern matches a request applies to it. faults can
+    be replaced while the proxy runs. stats counts requests and every fault
+    injected.
+    """
+
+    def __init__(self, upstream, faults=(), host="127.0.0.1", port=0, seed=None):
+        url = urlsplit(upstream)
+        self.scheme = url.scheme
+        self.upstream_host = url.hostname
+        self.upstream_port = url.port or (443 if url.scheme == "https" else 80)
+        self.netloc = url.netloc
+        self.prefix = url.path.rstrip("/")
+        self.faults = list(faults)
+        self.host = host
+        self.port = port
+        self.rng = random.Random(seed)
+        self.stats = Counter()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.tasks = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}{self.prefix}"
+
+    def fault_for(self, method, target):
+        path = urlsplit(target).path
+        if path.startswith(self.prefix):
+            path = path[len(self.prefix):]
+        for fault in self.faults:
+            if fault.matches(method, path):
+                return fault
+        return None
+
+    async def open_upstream(self):
+        context = ssl.create_default_context() if self.scheme == "https" else None
+        return await asyncio.open_connection(
+            self.upstream_host, self.upstream_port, ssl=context, limit=MAX_HEAD,
+            server_hostname=self.upstream_host if context else None,
+        )
+
+    async def handle_connection(self, reader, writer):
+        self.tasks.add(asyncio.current_task())
+        upstream = None
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                (method, target, version), headers = parse_head(head)
+                lookup = header_map(headers)
+                self.stats["requests"] += 1
+                fault = self.fault_for(method, target)
+                if fault is not None and self.rng.random() < fault.reset_rate:
+                    self.stats["reset"] += 1
+                    reset(writer)
+                    return
+                if fault is not None:
+                    pause = fault.pause(self.rng)
+                    if pause:
+                        self.stats["delayed"] += 1
+                        await asyncio.sleep(pause)
+                    answer = self.injected_answer(fault)
+                    if answer is not None:
+                        async for _ in body_pieces(reader, lookup):
+                            pass
+                        keep_alive = keeps_alive(version, lookup)
+                        status, extra = answer
+                        payload = api_response(status, "injected by petstore.proxy")
+                        writer.write(PetstoreServer.encode_response(status, payload, extra, keep_alive))
+                        await writer.drain()
+                        if not keep_alive:
+                            return
+                        continue
+
+                if upstream is None or upstream[0].at_eof():
+                    if upstream is not None:
+                        upstream[1].close()
+                    try:
+                        upstream = await self.open_upstream()
+                    except OSError:
+                        self.stats["upstream unreachable"] += 1
+                        payload = api_response(502, "upstream unreachable")
+                        writer.write(PetstoreServer.encode_response(502, payload, {}, False))
+                        await writer.drain()
+                        return
+                if not await self.forward(method, target, version, headers, lookup, fault, reader, writer, upstream):
+                    return
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, OSError, ValueError):
+            # A broken or malformed message on either side ends this client's connection
+            return
+        finally:
+            self.tasks.discard(asyncio.current_task())
+            if upstream is not None:
+                upstream[1].close()
+            writer.close()
+
+    def injected_answer(self, fault):
+        """Status and extra headers of an error to answer with instead of forwarding, if one is rolled"""
+        if fault.error_rate and self.rng.random() < fault.error_rate:
+            self.stats["errors"] += 1
+            return self.rng.choice(fault.error_statuses), {}
+        if fault.throttle_rate and self.rng.random() < fault.throttle_rate:
+            self.stats["throttled"] += 1
+            return 429, {} if fault.retry_after is None else {"Retry-After": str(fault.retry_after)}
+        return None
+
+    async def forward(self, method, target, version, headers, lookup, fault, reader, writer, upstream):
+        """Send one request upstream and its response back; False once either connection must close"""
+        upstream_reader, upstream_writer = upstream
+        lines = [f"{method} {target} {version}"]
+        lines += [f"{name}: {self.netloc if name.lower() == 'host' else value}" for name, value in headers]
+        upstream_writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await relay(body_pieces(reader, lookup), upstream_writer)
+
+        head = await upstream_reader.readuntil(b"\r\n\r\n")
+        (response_version, status, _), response_headers = parse_head(head)
+        response_lookup = header_map(response_headers)
+        keep_alive = keeps_alive(version, lookup) and keeps_alive(response_version, response_lookup)
+        writer.write(head)
+        if method == "HEAD" or int(status) in NO_BODY or status.startswith("1"):
+            await writer.drain()
+            return keep_alive
+
+        framed = "content-length" in response_lookup or "transfer-encoding" in response_lookup
+        keep_alive = keep_alive and framed
+        cut = bandwidth = None
+        if fault is not None:
+            bandwidth = fault.bandwidth
+            if bandwidth:
+                self.stats["capped"] += 1
+            if fault.truncate_rate and self.rng.random() < fault.truncate_rate:
+                self.stats["truncated"] += 1
+                # Half the body, or its first byte when the length isn't known up front
+                cut = max(1, int(response_lookup.get("content-length", 2)) // 2)
+        pieces = body_pieces(upstream_reader, response_lookup, to_close=not framed)
+        if not await relay(pieces, writer, cut, bandwidth):
+            return False
+        return keep_alive
+
+    def report_lines(self):
+        if not self.stats:
+            return []
+        return [", ".join(f"{kind}: {count}" for kind, count in sorted(self.stats.items()))]
+
+    async def serve(self):
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_HEAD, backlog=4096
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def start(self):
+        """Start relaying from a daemon thread and return once the port is bound"""
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.serve())
+        self.thread = threading.Thread(target=self.loop.run_forever, name="petstore-proxy", daemon=True)
+        self.thread.start()
+        return self
+
+    async def shutdown(self):
+        # A connection may be waiting on either side, so its task is cancelled rather than its socket closed
+        self.server.close()
+        tasks = list(self.tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.server.wait_closed()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Run the proxy in the foreground"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--upstream", required=True, help="API to relay to, e.g. https://petstore.swagger.io/v2")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--faults", help='JSON file with a list of faults: [{"pattern": "/store/order/*", "delay": 0.5}]')
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    faults = load_faults(args.faults) if args.faults else []
+    proxy = FaultProxy(args.upstream, faults, args.host, args.port, args.seed)
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(proxy.serve())
+    print(f"Relaying {proxy.url} to {args.upstream} with {len(faults)} fault rules")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    print(*proxy.report_lines(), sep="\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Record Petstore API traffic to JSON Lines and replay it against any base URL"""
+import argparse
+import asyncio
+import json
+import queue
+import threading
+from collections import Counter
+
+import aiohttp
+
+from petstore import metrics
+from petstore.client import TIMEOUT
+from petstore.load import LoadResult
+from petstore.metrics import Histogram, endpoint_template
+
+
+class TrafficCapture:
+    """Appends one JSON line per request/response, written from a background thread
+
+    Callers only put a dict on a queue, so recording adds no file I/O or lock
+    contention to the requests being timed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.SimpleQueue()
+        self.thread = threading.Thread(target=self.write_all, name="traffic-capture", daemon=True)
+        self.thread.start()
+
+    def record(self, method, path, kwargs, status, latency, timestamp):
+        entry = {"ts": timestamp, "method": method, "path": path}
+        if kwargs.get("params"):
+            entry["params"] = kwargs["params"]
+        if kwargs.get("json") is not None:
+            entry["json"] = kwargs["json"]
+        elif isinstance(kwargs.get("data"), dict):
+            entry["form"] = kwargs["data"]
+        elif isinstance(kwargs.get("data"), (bytes, str)):
+            data = kwargs["data"]
+            entry["data"] = data.decode(errors="replace") if isinstance(data, bytes) else data
+        elif kwargs.get("data") is not None:
+            # A streamed body is generated while it is sent and isn't kept, so replay sends the request without it
+            entry["streamed"] = type(kwargs["data"]).__name__
+        entry["status"] = status
+        entry["latency"] = latency
+        self.queue.put(entry)
+
+    def write_all(self):
+        with open(self.path, "a", encoding="utf-8") as file:
+            while True:
+                entry = self.queue.get()
+                if entry is None:
+                    return
+                file.write(self.line(entry) + "\n")
+
+    def line(self, entry):
+        try:
+            return json.dumps(entry, separators=(",", ":"))
+        except (TypeError, ValueError) as exc:
+            # Keep the request in the capture, without whatever JSON couldn't hold
+            for name in ("params", "json", "form", "data"):
+                entry.pop(name, None)
+            entry["unencodable"] = str(exc)
+            return json.dumps(entry, separators=(",", ":"))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+
+
+def iter_records(path):
+    """Stream records from a capture file one line at a time"""
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+class ReplayResult(LoadResult):
+    """Outcome of a replay, including responses whose status differs from the capture"""
+
+    def __init__(self, speed, concurrency):
+        super().__init__(rate=None, duration=None, concurrency=concurrency)
+        self.speed = speed
+        self.mismatches = Counter()
+
+    def summary(self):
+        pace = f"{self.speed:g}x" if self.speed else "max speed"
+        return (
+            f"replayed {self.requests} requests in {self.elapsed:.2f}s ({self.throughput:.0f}/s at {pace}), "
+            f"p50 {self.percentile(50) * 1000:.1f}ms, p99 {self.percentile(99) * 1000:.1f}ms, "
+            f"status mismatches {sum(self.mismatches.values())}, errors {dict(self.errors)}"
+        )
+
+
+class Replayer:
+    """Re-issues a captured request stream at its original pace, a multiple of it, or flat out
+
+    Only `concurrency` requests are ever in flight or buffered, so captures of
+    any size replay in constant memory.
+    """
+
+    def __init__(self, base_url, records, speed=1.0, concurrency=100, recorder=None):
+        self.base_url = base_url.rstrip("/")
+        self.records = records
+        self.speed = speed
+        self.concurrency = concurrency
+        self.recorder = recorder if recorder is not None else metrics.recorder
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        result = ReplayResult(self.speed, self.concurrency)
+        slots = asyncio.Semaphore(self.concurrency)
+        connector = aiohttp.TCPConnector(limit=self.concurrency, limit_per_host=self.concurrency)
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+
+        async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+            tasks = set()
+            start = loop.time()
+            first = None
+            for record in self.records:
+                due = start
+                if self.speed:
+                    first = record["ts"] if first is None else first
+                    due = start + (record["ts"] - first) / self.speed
+                    if due > loop.time():
+                        await asyncio.sleep(due - loop.time())
+                # Waiting for a slot before reading on keeps the file from being pulled into memory
+                await slots.acquire()
+                task = asyncio.create_task(self.send(session, slots, record, due, result))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+            result.elapsed = loop.time() - start
+        return result
+
+    async def send(self, session, slots, record, due, result):
+        loop = asyncio.get_running_loop()
+        kwargs = {}
+        if "params" in record:
+            kwargs["params"] = record["params"]
+        if "json" in record:
+            kwargs["json"] = record["json"]
+        elif "form" in record:
+            kwargs["data"] = record["form"]
+        elif "data" in record:
+            kwargs["data"] = record["data"]
+        try:
+            started = loop.time()
+            async with session.request(record["method"], self.base_url + record["path"], **kwargs) as response:
+                await response.read()
+                status = response.status
+            result.statuses[status] += 1
+            if status != record.get("status", status):
+                result.mismatches[f"{record['method']} {endpoint_template(record['path'])}"] += 1
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            result.errors[type(exc).__name__] += 1
+            return
+        finally:
+            slots.release()
+        finished = loop.time()
+        result.latency.record(finished - due)
+        result.service_time.record(finished - started)
+        key = (record["method"], endpoint_template(record["path"]))
+        result.endpoints.setdefault(key, Histogram()).record(finished - due)
+        self.recorder.record(record["method"], record["path"], finished - started, status)
+
+
+def replay(base_url, path, speed=1.0, concurrency=100):
+    """Replay a capture file to completion from synchronous code"""
+    return asyncio.run(Replayer(base_url, iter_records(path), speed, concurrency).run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("capture", help="JSON Lines capture written with --record")
+    parser.add_argument("--base-url", required=True, help="API to replay against, e.g. http://127.0.0.1:8080/v2")
+    pace = parser.add_mutually_exclusive_group()
+    pace.add_argument("--speed", type=float, default=1.0, help="Multiple of the captured pace (default 1)")
+    pace.add_argument("--max", action="store_true", help="Ignore captured timing and send as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    result = replay(args.base_url, args.capture, None if args.max else args.speed, args.concurrency)
+    print(result.summary())
+    for line in metrics.recorder.report_lines():
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
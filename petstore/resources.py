@@ -0,0 +1,305 @@
+"""Resource use of the test process itself, to tell a slow server from a saturated client
+
+A background thread samples the process's CPU, RSS, open sockets and threads,
+and how late each watched event loop wakes up. Each test's samples are judged
+against THRESHOLDS, and a test that crosses any of them is reported as
+client-bound. Optionally the same thread samples the stacks of the client's
+threads that are using CPU, to show where the client's own time goes.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Threads that serve rather than send; their CPU and stacks aren't the client's
+SERVER_THREADS = frozenset({"petstore-server", "petstore-proxy", "petstore-metrics"})
+
+# Past any of these the client, not the server, is what limits a run. cpu is a fraction of one core, which is
+# all the GIL lets Python code use, and is the median over the run, as is loop_lag in seconds. rss, threads and
+# sockets are peaks; sockets is a fraction of the open file limit.
+THRESHOLDS = {"cpu": 0.85, "loop_lag": 0.05, "rss": 2 * 2**30, "threads": 500, "sockets": 0.8}
+
+# Runs with fewer samples than this are too short to judge
+MIN_SAMPLES = 3
+
+# Functions listed in the profile section of the report
+PROFILE_TOP = 15
+
+
+def median(values):
+    ordered = sorted(values)
+    return ordered[len(ordered) // 2] if ordered else 0.0
+
+
+def thread_cpu(thread_id):
+    """CPU seconds used by one thread, or None where the platform can't tell or it isn't running yet"""
+    if thread_id is None:
+        return None
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm", encoding="ascii") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        if resource is None:
+            return None
+        # Peak rather than current where /proc is missing; macOS reports bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def open_sockets():
+    try:
+        fds = os.listdir("/proc/self/fd")
+    except OSError:
+        return None
+    count = 0
+    for fd in fds:
+        try:
+            count += os.readlink(f"/proc/self/fd/{fd}").startswith("socket:")
+        except OSError:
+            pass
+    return count
+
+
+def socket_limit():
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0] if resource is not None else None
+
+
+def frame_name(code):
+    """Function name with the last two parts of its file path, e.g. json/encoder.py:205 encode"""
+    path = code.co_filename.replace("\\", "/").rsplit("/", 2)
+    return f"{'/'.join(path[-2:])}:{code.co_firstlineno} {code.co_qualname}"
+
+
+class Usage:
+    """What one run, usually one test, asked of the test process"""
+
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.cpu = []
+        self.loop_lag = []
+        self.rss = 0
+        self.threads = 0
+        self.sockets = 0
+
+    @property
+    def samples(self):
+        return len(self.cpu)
+
+    def peaks(self, rss, threads, sockets):
+        self.rss = max(self.rss, rss or 0)
+        self.threads = max(self.threads, threads)
+        self.sockets = max(self.sockets, sockets or 0)
+
+    def flags(self, thresholds=THRESHOLDS, limit=None):
+        """Which limits the client hit, e.g. ["cpu 97%"]; empty unless the run is long enough to judge"""
+        if self.samples < MIN_SAMPLES:
+            return []
+        flags = []
+        if median(self.cpu) > thresholds["cpu"]:
+            flags.append(f"cpu {median(self.cpu):.0%}")
+        if median(self.loop_lag) > thresholds["loop_lag"]:
+            flags.append(f"loop lag {median(self.loop_lag) * 1000:.0f}ms")
+        if self.rss > thresholds["rss"]:
+            flags.append(f"rss {self.rss / 2**20:.0f}MiB")
+        if self.threads > thresholds["threads"]:
+            flags.append(f"{self.threads} threads")
+        if limit and self.sockets > thresholds["sockets"] * limit:
+            flags.append(f"{self.sockets}/{limit} sockets")
+        return flags
+
+    def line(self, width, thresholds=THRESHOLDS, limit=None):
+        lag = f"{max(self.loop_lag) * 1000:>7.1f}ms" if self.loop_lag else f"{'-':>9}"
+        flags = self.flags(thresholds, limit)
+        return (
+            f"{self.name:<{width}} {self.seconds:>6.1f}s {median(self.cpu):>5.0%} {max(self.cpu, default=0):>5.0%} "
+            f"{lag} {self.rss / 2**20:>6.0f}MiB {self.threads:>7} {self.sockets:>7}  "
+            + ("CLIENT-BOUND: " + ", ".join(flags) if flags else "ok")
+        )
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    @classmethod
+    def from_dict(cls, data):
+        usage = cls(data["name"])
+        vars(usage).update(data)
+        return usage
+
+
+class ResourceSampler:
+    """Samples the process every interval seconds from a daemon thread, into whichever run is current
+
+    With profile set it also samples, every profile_interval seconds, the
+    stack of each client thread that was busy since the last look, counting
+    the function on top (self) and every function on the stack (total).
+    """
+
+    def __init__(self, interval=0.1, thresholds=THRESHOLDS, profile=False, profile_interval=0.005):
+        self.interval = interval
+        self.thresholds = thresholds
+        self.profile = profile
+        self.profile_interval = profile_interval
+        self.lock = threading.Lock()
+        self.loops = set()
+        self.current = None
+        # Runs long enough to judge, kept for the report
+        self.runs = []
+        self.self_samples = Counter()
+        self.total_samples = Counter()
+        self.stack_samples = 0
+        self.thread_cpu = {}
+        self.limit = socket_limit()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def watch(self, loop):
+        """Measure how late this event loop runs callbacks until unwatch(loop)"""
+        with self.lock:
+            self.loops.add(loop)
+
+    def unwatch(self, loop):
+        with self.lock:
+            self.loops.discard(loop)
+
+    def begin(self, name):
+        self.current = Usage(name)
+        return self.current
+
+    def end(self):
+        """Finish the current run, returning its Usage"""
+        usage, self.current = self.current, None
+        if usage is not None and usage.samples >= MIN_SAMPLES:
+            with self.lock:
+                self.runs.append(usage)
+        return usage
+
+    def client_cpu(self):
+        """CPU seconds of the whole process, less what the in-process server threads used"""
+        used = time.process_time()
+        for thread in threading.enumerate():
+            if thread.name in SERVER_THREADS:
+                used -= thread_cpu(thread.ident) or 0.0
+        return used
+
+    def sample(self, elapsed, cpu):
+        usage = self.current
+        if usage is None:
+            return
+        usage.seconds += elapsed
+        usage.cpu.append(cpu / elapsed)
+        usage.peaks(rss_bytes(), threading.active_count(), open_sockets())
+        sent = time.monotonic()
+        with self.lock:
+            loops = list(self.loops)
+        for loop in loops:
+            try:
+                loop.call_soon_threadsafe(lambda: usage.loop_lag.append(time.monotonic() - sent))
+            except RuntimeError:
+                # Closed without being unwatched
+                self.unwatch(loop)
+
+    def sample_stacks(self):
+        skip = {threading.get_ident()}
+        skip.update(thread.ident for thread in threading.enumerate() if thread.name in SERVER_THREADS)
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id in skip:
+                continue
+            # A thread that ran for less than half the tick spent it mostly waiting on a socket or a lock
+            used = thread_cpu(thread_id)
+            if used is not None:
+                busy = used - self.thread_cpu.get(thread_id, used)
+                self.thread_cpu[thread_id] = used
+                if busy < self.profile_interval / 2:
+                    continue
+            self.stack_samples += 1
+            self.self_samples[frame_name(frame.f_code)] += 1
+            seen = set()
+            while frame is not None:
+                name = frame_name(frame.f_code)
+                if name not in seen:
+                    seen.add(name)
+                    self.total_samples[name] += 1
+                frame = frame.f_back
+
+    def run(self):
+        tick = self.profile_interval if self.profile else self.interval
+        last = time.monotonic()
+        last_cpu = self.client_cpu()
+        while not self.stopped.wait(tick):
+            # Only while a test runs, so collection and fixtures don't crowd out the client
+            if self.profile and self.current is not None:
+                self.sample_stacks()
+            now = time.monotonic()
+            if now - last >= self.interval:
+                cpu = self.client_cpu()
+                self.sample(now - last, cpu - last_cpu)
+                last, last_cpu = now, cpu
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="petstore-resources", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def to_dict(self):
+        with self.lock:
+            runs = [usage.to_dict() for usage in self.runs]
+        return {
+            "runs": runs, "self": dict(self.self_samples), "total": dict(self.total_samples),
+            "stacks": self.stack_samples,
+        }
+
+    def absorb(self, data):
+        """Add runs and profile samples recorded elsewhere, e.g. by another worker process"""
+        with self.lock:
+            self.runs.extend(Usage.from_dict(usage) for usage in data["runs"])
+        self.self_samples.update(data["self"])
+        self.total_samples.update(data["total"])
+        self.stack_samples += data["stacks"]
+
+    def report_lines(self):
+        with self.lock:
+            runs = list(self.runs)
+        lines = []
+        if runs:
+            width = max(len("run"), *(len(usage.name) for usage in runs))
+            lines.append(
+                f"{'run':<{width}} {'time':>7} {'cpu50':>5} {'cpumax':>5} {'max lag':>9} {'rss':>9} "
+                f"{'threads':>7} {'sockets':>7}  verdict"
+            )
+            lines += [usage.line(width, self.thresholds, self.limit) for usage in runs]
+            lines.append("cpu is the client's share of one core, without the in-process server's threads")
+        if self.stack_samples:
+            lines.append(f"hottest client functions over {self.stack_samples} on-cpu stack samples:")
+            lines.append(f"{'self':>6} {'total':>6}  function")
+            for name, count in self.self_samples.most_common(PROFILE_TOP):
+                lines.append(
+                    f"{count / self.stack_samples:>6.1%} {self.total_samples[name] / self.stack_samples:>6.1%}  {name}"
+                )
+        return lines
+
+
+# Started by the test session; the load engine and scenario runner register their event loops with it
+resources = ResourceSampler()
@@ -0,0 +1,314 @@
+"""Declarative multi-step user journeys, run by thousands of asyncio virtual users"""
+import asyncio
+import json
+import random
+import re
+from collections import Counter
+
+import aiohttp
+
+from petstore import metrics
+from petstore.client import TIMEOUT
+from petstore.live import live as live_metrics
+from petstore.metrics import Histogram
+from petstore.resources import resources as resource_sampler
+from petstore.schemas import schema_log
+
+# A string that is nothing but one placeholder is replaced by the value itself, so ids stay integers
+PLACEHOLDER = re.compile(r"\{(\w+)\}")
+
+
+class StepFailed(Exception):
+    """A step got an unexpected status or couldn't fill in or extract its data"""
+
+
+def render(value, context):
+    """Fill {name} placeholders in a string, or in every string inside a dict or list"""
+    if isinstance(value, str):
+        match = PLACEHOLDER.fullmatch(value)
+        try:
+            return context[match.group(1)] if match else value.format_map(context)
+        except KeyError as exc:
+            raise StepFailed(f"no value for {exc.args[0]!r} in {value!r}") from None
+        except (IndexError, ValueError, AttributeError) as exc:
+            # A stray brace or a positional field, e.g. in a JSON-ish name
+            raise StepFailed(f"can't fill in {value!r}: {exc}") from None
+    if isinstance(value, dict):
+        return {key: render(item, context) for key, item in value.items()}
+    if isinstance(value, list):
+        return [render(item, context) for item in value]
+    return value
+
+
+def extract(body, path):
+    """Value at a dotted path such as "0.id" in a decoded JSON body"""
+    value = body
+    for part in path.split("."):
+        try:
+            value = value[int(part)] if isinstance(value, list) else value[part]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise StepFailed(f"response has nothing at {path!r}") from None
+    return value
+
+
+class Step:
+    """One request of a journey
+
+    path, params, json and data may hold {name} placeholders, filled from the
+    virtual user's data and from values earlier steps extracted. extract maps
+    a name to a dotted path into the JSON response, or to a function of it.
+    check is a function of the JSON response, after extraction, that is false
+    when the step got the wrong answer. think is the pause after the step, in
+    seconds or as a (low, high) range. A cleanup step still runs when an
+    earlier step of its journey failed.
+    """
+
+    def __init__(
+        self, name, method, path, params=None, json=None, data=None, expect=200, extract=None, think=0, check=None,
+        cleanup=False,
+    ):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.params = params
+        self.json = json
+        self.data = data
+        self.expect = (expect,) if isinstance(expect, int) else tuple(expect)
+        self.extract = extract or {}
+        self.think = think
+        self.check = check
+        self.cleanup = cleanup
+
+    @classmethod
+    def from_dict(cls, data):
+        data = dict(data)
+        data.setdefault("name", f"{data['method']} {data['path']}")
+        return cls(**data)
+
+    def request(self, context):
+        """Method, path and aiohttp keyword arguments for this step, filled in for one user"""
+        kwargs = {}
+        for name in ("params", "json", "data"):
+            value = getattr(self, name)
+            if value is not None:
+                kwargs[name] = render(value, context)
+        return self.method, render(self.path, context), kwargs
+
+    def pause(self, rng):
+        if isinstance(self.think, (tuple, list)):
+            return rng.uniform(*self.think)
+        return self.think
+
+
+class Scenario:
+    """A named journey: steps run in order by every virtual user"""
+
+    def __init__(self, name, steps):
+        names = [step.name for step in steps]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Step names in {name!r} must be unique, got {names}")
+        self.name = name
+        self.steps = steps
+
+    @classmethod
+    def from_dict(cls, data):
+        """Scenario from plain data, e.g. a JSON file: {"name": ..., "steps": [{"method": ..., "path": ...}]}"""
+        return cls(data["name"], [Step.from_dict(step) for step in data["steps"]])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as file:
+            return cls.from_dict(json.load(file))
+
+
+# Register, log in, browse, buy, check stock, then clean up after itself. Each user needs
+# username and order_id, and status naming pets that exist.
+SHOPPER = {
+    "name": "shopper",
+    "steps": [
+        {"name": "register", "method": "POST", "path": "/user", "think": [0.05, 0.2],
+         "json": {"id": "{user_id}", "username": "{username}", "password": "secret", "userStatus": 1}},
+        {"name": "login", "method": "GET", "path": "/user/login", "think": [0.05, 0.2],
+         "params": {"username": "{username}", "password": "secret"}},
+        {"name": "browse", "method": "GET", "path": "/pet/findByStatus", "think": [0.1, 0.5],
+         "params": {"status": "{status}"}, "extract": {"pet_id": "0.id"}},
+        {"name": "order", "method": "POST", "path": "/store/order", "think": [0.05, 0.2],
+         "json": {"id": "{order_id}", "petId": "{pet_id}", "quantity": 1, "status": "placed", "complete": False}},
+        {"name": "inventory", "method": "GET", "path": "/store/inventory", "think": [0.05, 0.2]},
+        {"name": "cancel order", "method": "DELETE", "path": "/store/order/{order_id}", "cleanup": True},
+        {"name": "logout", "method": "GET", "path": "/user/logout"},
+        {"name": "unregister", "method": "DELETE", "path": "/user/{username}", "cleanup": True},
+    ],
+}
+
+
+class ScenarioResult:
+    """Latency per step and per journey, and where journeys failed"""
+
+    def __init__(self, scenario, users):
+        self.scenario = scenario
+        self.users = users
+        self.elapsed = 0.0
+        self.steps = {step.name: Histogram() for step in scenario.steps}
+        # Time spent waiting on the server over a whole journey; think time is configured, not measured
+        self.journeys = Histogram()
+        self.started = 0
+        self.completed = 0
+        self.failures = Counter()
+        self.examples = []
+        self.statuses = Counter()
+        self.active = 0
+        self.max_active = 0
+
+    @property
+    def failed(self):
+        return sum(self.failures.values())
+
+    @property
+    def requests(self):
+        return sum(self.statuses.values())
+
+    def fail(self, step, reason):
+        self.failures[step.name] += 1
+        if len(self.examples) < 5:
+            self.examples.append(f"{step.name}: {reason}")
+
+    def summary(self):
+        journey = self.journeys
+        return (
+            f"{self.scenario.name}: {self.users} users, {self.completed}/{self.started} journeys completed in "
+            f"{self.elapsed:.2f}s, {self.requests} requests, journey p50 {journey.percentile(50) * 1000:.1f}ms, "
+            f"p99 {journey.percentile(99) * 1000:.1f}ms, failures {dict(self.failures)}, "
+            f"peak {self.max_active} active users"
+        )
+
+    def step_lines(self):
+        width = max(len("journey"), *(len(name) for name in self.steps))
+        lines = [f"{'step':<{width}} {'count':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'failed':>7}"]
+        rows = [(name, histogram, self.failures[name]) for name, histogram in self.steps.items()]
+        rows.append(("journey", self.journeys, self.failed))
+        for name, histogram, failed in rows:
+            cells = " ".join(f"{histogram.percentile(pct) * 1000:>6.1f}ms" for pct in (50, 90, 99))
+            lines.append(f"{name:<{width}} {histogram.count:>7} {cells} {failed:>7}")
+        return lines + [f"e.g. {example[:200]}" for example in self.examples]
+
+
+class ScenarioRunner:
+    """Runs a scenario as many concurrent virtual users, each with its own data
+
+    Users start evenly over ramp_up seconds and run the journey iterations
+    times. They share a pool of `connections` connections, so thousands of
+    users who spend most of their time thinking need only a few sockets. A
+    journey stops at its first failed step.
+    """
+
+    def __init__(
+        self, base_url, scenario, users, iterations=1, ramp_up=0.0, connections=100, data=None, seed=None,
+        recorder=None, live=None, resources=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.scenario = scenario
+        self.users = users
+        self.iterations = iterations
+        self.ramp_up = ramp_up
+        self.connections = connections
+        # Function of the user number returning that user's starting data, e.g. its username
+        self.data = data if data is not None else (lambda number: {})
+        self.seed = seed
+        self.recorder = recorder if recorder is not None else metrics.recorder
+        self.live = live if live is not None else live_metrics
+        self.resources = resources if resources is not None else resource_sampler
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        result = ScenarioResult(self.scenario, self.users)
+        connector = aiohttp.TCPConnector(limit=self.connections, limit_per_host=self.connections)
+        timeout = aiohttp.ClientTimeout(sock_connect=TIMEOUT[0], sock_read=TIMEOUT[1])
+        self.resources.watch(loop)
+        try:
+            async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+                start = loop.time()
+                await asyncio.gather(*(self.user(session, number, result) for number in range(self.users)))
+                result.elapsed = loop.time() - start
+        finally:
+            self.resources.unwatch(loop)
+        return result
+
+    async def user(self, session, number, result):
+        if self.ramp_up:
+            await asyncio.sleep(self.ramp_up * number / self.users)
+        rng = random.Random(None if self.seed is None else self.seed * 1000003 + number)
+        data = {"vu": number, **self.data(number)}
+        result.active += 1
+        result.max_active = max(result.max_active, result.active)
+        try:
+            for iteration in range(self.iterations):
+                # Extracted values only live for one journey
+                await self.journey(session, {**data, "iteration": iteration}, rng, result)
+        finally:
+            result.active -= 1
+
+    async def journey(self, session, context, rng, result):
+        result.started += 1
+        waited = 0.0
+        steps = iter(self.scenario.steps)
+        try:
+            for step in steps:
+                try:
+                    waited += await self.send(session, step, context, result)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+                    result.fail(step, f"{type(exc).__name__}: {exc}")
+                    return
+                except StepFailed as exc:
+                    result.fail(step, str(exc))
+                    return
+                pause = step.pause(rng)
+                if pause:
+                    await asyncio.sleep(pause)
+            result.completed += 1
+            result.journeys.record(waited)
+        finally:
+            # After a failed step, the cleanup steps after it still run, so failed journeys don't leave data behind
+            for step in steps:
+                if step.cleanup:
+                    try:
+                        await self.send(session, step, context, result)
+                    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, StepFailed):
+                        pass
+
+    async def send(self, session, step, context, result):
+        """Send one step, returning its latency; raises StepFailed on a wrong answer"""
+        loop = asyncio.get_running_loop()
+        method, path, kwargs = step.request(context)
+        started = loop.time()
+        self.live.started()
+        try:
+            async with session.request(method, self.base_url + path, **kwargs) as response:
+                body = await response.read()
+                status = response.status
+                content_type = response.content_type
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc:
+            self.live.finished(method, path, type(exc).__name__, loop.time() - started)
+            self.recorder.record(method, path, loop.time() - started, type(exc).__name__)
+            raise
+        elapsed = loop.time() - started
+        self.live.finished(method, path, status, elapsed)
+        result.steps[step.name].record(elapsed)
+        result.statuses[status] += 1
+        self.recorder.record(method, path, elapsed, status)
+        if body and "json" in content_type:
+            schema_log.check(method, path, status, body)
+        if status not in step.expect:
+            raise StepFailed(f"{method} {path} answered {status}")
+        if step.extract or step.check:
+            decoded = json.loads(body)
+            for name, where in step.extract.items():
+                context[name] = where(decoded) if callable(where) else extract(decoded, where)
+            if step.check is not None and not step.check(decoded):
+                raise StepFailed(f"{method} {path} answered {body[:200]!r}, which failed its check")
+        return elapsed
+
+
+def run_scenario(base_url, scenario, users, **kwargs):
+    """Run a scenario to completion from synchronous test code"""
+    return asyncio.run(ScenarioRunner(base_url, scenario, users, **kwargs).run())
@@ -0,0 +1,263 @@
+"""Petstore v2 response schemas, compiled once into plain Python validator functions"""
+import json
+import re
+import threading
+from collections import Counter
+
+from petstore.metrics import endpoint_template
+
+INT32 = (-2**31, 2**31 - 1)
+INT64 = (-2**63, 2**63 - 1)
+
+# Same shapes as the definitions in https://petstore.swagger.io/v2/swagger.json. The status enums are
+# left out: the API stores any string, and the suite namespaces statuses per worker.
+DEFINITIONS = {
+    "Category": {
+        "type": "object",
+        "properties": {"id": {"type": "integer", "format": "int64"}, "name": {"type": "string"}},
+    },
+    "Tag": {
+        "type": "object",
+        "properties": {"id": {"type": "integer", "format": "int64"}, "name": {"type": "string"}},
+    },
+    "Pet": {
+        "type": "object",
+        "required": ["name", "photoUrls"],
+        "properties": {
+            "id": {"type": "integer", "format": "int64"},
+            "category": {"$ref": "Category"},
+            "name": {"type": "string"},
+            "photoUrls": {"type": "array", "items": {"type": "string"}},
+            "tags": {"type": "array", "items": {"$ref": "Tag"}},
+            "status": {"type": "string"},
+        },
+    },
+    "PetList": {"type": "array", "items": {"$ref": "Pet"}},
+    "Order": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer", "format": "int64"},
+            "petId": {"type": "integer", "format": "int64"},
+            "quantity": {"type": "integer", "format": "int32"},
+            "shipDate": {"type": "string", "format": "date-time"},
+            "status": {"type": "string"},
+            "complete": {"type": "boolean"},
+        },
+    },
+    "Inventory": {"type": "object", "additionalProperties": {"type": "integer", "format": "int32"}},
+    "User": {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer", "format": "int64"},
+            "username": {"type": "string"},
+            "firstName": {"type": "string"},
+            "lastName": {"type": "string"},
+            "email": {"type": "string"},
+            "password": {"type": "string"},
+            "phone": {"type": "string"},
+            "userStatus": {"type": "integer", "format": "int32"},
+        },
+    },
+    "ApiResponse": {
+        "type": "object",
+        "properties": {
+            "code": {"type": "integer", "format": "int32"},
+            "type": {"type": "string"},
+            "message": {"type": "string"},
+        },
+    },
+}
+
+# Definition each endpoint returns with a 200; every other JSON body is an ApiResponse
+RESPONSES = {
+    ("POST", "/pet"): "Pet",
+    ("PUT", "/pet"): "Pet",
+    ("GET", "/pet/findByStatus"): "PetList",
+    ("GET", "/pet/{petId}"): "Pet",
+    ("POST", "/pet/{petId}"): "ApiResponse",
+    ("DELETE", "/pet/{petId}"): "ApiResponse",
+    ("GET", "/store/inventory"): "Inventory",
+    ("POST", "/store/order"): "Order",
+    ("GET", "/store/order/{orderId}"): "Order",
+    ("DELETE", "/store/order/{orderId}"): "ApiResponse",
+    ("POST", "/user"): "ApiResponse",
+    ("POST", "/user/createWithList"): "ApiResponse",
+    ("POST", "/user/createWithArray"): "ApiResponse",
+    ("GET", "/user/login"): "ApiResponse",
+    ("GET", "/user/logout"): "ApiResponse",
+    ("GET", "/user/{username}"): "User",
+    ("PUT", "/user/{username}"): "ApiResponse",
+    ("DELETE", "/user/{username}"): "ApiResponse",
+}
+
+DATE_TIME = re.compile(r"\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?(Z|[+-]\d\d:?\d\d)$")
+FORMATS = {"int32": INT32, "int64": INT64}
+
+
+class SchemaCompiler:
+    """Turns schema definitions into Python source with one function per definition
+
+    Each generated function takes a decoded JSON value and returns None when it
+    matches, or a message such as ".tags[0].id: expected int64" for the first
+    mismatch. Errors are only formatted on the failure path, so a valid
+    response costs little more than the type checks themselves.
+    """
+
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.lines = []
+        self.names = 0
+
+    def variable(self):
+        self.names += 1
+        return f"v{self.names}"
+
+    def emit(self, indent, line):
+        self.lines.append("    " * indent + line)
+
+    def node(self, schema, var, where, indent):
+        """Emit checks for var, where where is an f-string fragment naming its location"""
+        if "$ref" in schema:
+            error = self.variable()
+            self.emit(indent, f"{error} = check_{schema['$ref']}({var})")
+            self.emit(indent, f"if {error} is not None:")
+            self.emit(indent + 1, f"return f\"{where}\" + {error}")
+            return
+        kind = schema["type"]
+        if kind == "object":
+            self.emit(indent, f"if type({var}) is not dict:")
+            self.emit(indent + 1, f"return f\"{where}: expected object, got {{type({var}).__name__}}\"")
+            for name in schema.get("required", ()):
+                self.emit(indent, f"if {name!r} not in {var}:")
+                self.emit(indent + 1, f"return f\"{where}.{name}: missing\"")
+            for name, prop in schema.get("properties", {}).items():
+                value = self.variable()
+                self.emit(indent, f"{value} = {var}.get({name!r}, MISSING)")
+                self.emit(indent, f"if {value} is not MISSING:")
+                self.node(prop, value, f"{where}.{name}", indent + 1)
+            if "additionalProperties" in schema:
+                key, value = self.variable(), self.variable()
+                self.emit(indent, f"for {key}, {value} in {var}.items():")
+                self.node(schema["additionalProperties"], value, f"{where}[{{{key}!r}}]", indent + 1)
+        elif kind == "array":
+            self.emit(indent, f"if type({var}) is not list:")
+            self.emit(indent + 1, f"return f\"{where}: expected array, got {{type({var}).__name__}}\"")
+            index, item = self.variable(), self.variable()
+            self.emit(indent, f"for {index}, {item} in enumerate({var}):")
+            self.node(schema["items"], item, f"{where}[{{{index}}}]", indent + 1)
+        elif kind == "integer":
+            low, high = FORMATS[schema.get("format", "int64")]
+            # type() rather than isinstance(), so True isn't taken for 1
+            self.emit(indent, f"if type({var}) is not int or not {low} <= {var} <= {high}:")
+            self.emit(indent + 1, f"return f\"{where}: expected {schema.get('format', 'int64')}, got {{{var}!r:.40}}\"")
+        elif kind == "string":
+            self.emit(indent, f"if type({var}) is not str:")
+            self.emit(indent + 1, f"return f\"{where}: expected string, got {{{var}!r:.40}}\"")
+            if schema.get("format") == "date-time":
+                self.emit(indent, f"if DATE_TIME.match({var}) is None:")
+                self.emit(indent + 1, f"return f\"{where}: expected date-time, got {{{var}!r:.40}}\"")
+        elif kind == "boolean":
+            self.emit(indent, f"if type({var}) is not bool:")
+            self.emit(indent + 1, f"return f\"{where}: expected boolean, got {{{var}!r:.40}}\"")
+        else:
+            raise ValueError(f"Unsupported schema type {kind!r}")
+
+    def compile(self):
+        """Return a dict of validator functions keyed by definition name"""
+        for name, schema in self.definitions.items():
+            self.emit(0, f"def check_{name}(value):")
+            self.node(schema, "value", "", 1)
+            self.emit(1, "return None")
+        namespace = {"MISSING": object(), "DATE_TIME": DATE_TIME}
+        exec(compile("\n".join(self.lines), "<petstore schemas>", "exec"), namespace)
+        return {name: namespace[f"check_{name}"] for name in self.definitions}
+
+
+VALIDATORS = SchemaCompiler(DEFINITIONS).compile()
+
+
+def response_validator(method, path, status):
+    """Validator for a response body, or None when the endpoint isn't in the spec"""
+    if status != 200:
+        return VALIDATORS["ApiResponse"]
+    name = RESPONSES.get((method, endpoint_template(path)))
+    return VALIDATORS[name] if name else None
+
+
+def check_body(method, path, status, body):
+    """Validate a raw JSON response body and return the first problem, or None"""
+    validator = response_validator(method, path, status)
+    if validator is None:
+        return None
+    try:
+        value = json.loads(body)
+    except ValueError:
+        return "$: not valid JSON"
+    error = validator(value)
+    return None if error is None else "$" + error
+
+
+def checked_items(method, path, check=None):
+    """Wrap a per-item check for a streamed array so each item is also validated against the schema"""
+    name = RESPONSES[(method, endpoint_template(path))]
+    validator = VALIDATORS[DEFINITIONS[name]["items"]["$ref"]]
+
+    def check_item(item):
+        error = validator(item)
+        if error is not None:
+            schema_log.record(method, path, "$[]" + error)
+            return False
+        return check is None or check(item)
+
+    return check_item
+
+
+class SchemaLog:
+    """Responses that didn't match the schema, per endpoint with a few examples"""
+
+    EXAMPLES = 5
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.examples = []
+        self.total = 0
+
+    def record(self, method, path, error):
+        key = (method, endpoint_template(path))
+        with self.lock:
+            self.counts[key] += 1
+            self.total += 1
+            if len(self.examples) < self.EXAMPLES:
+                self.examples.append(f"{method} {path}: {error}")
+
+    def check(self, method, path, status, body):
+        """Validate a response body, logging it if it breaks the schema"""
+        error = check_body(method, path, status, body)
+        if error is not None:
+            self.record(method, path, error)
+        return error
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "counts": [[method, template, count] for (method, template), count in self.counts.items()],
+                "examples": list(self.examples),
+            }
+
+    def absorb(self, data):
+        """Add violations recorded elsewhere, e.g. by another worker process"""
+        with self.lock:
+            for method, template, count in data["counts"]:
+                self.counts[(method, template)] += count
+                self.total += count
+            self.examples.extend(data["examples"][:self.EXAMPLES - len(self.examples)])
+
+    def report_lines(self):
+        with self.lock:
+            lines = [f"{method + ' ' + template:<30} {count:>6} responses" for (method, template), count in
+                     sorted(self.counts.items())]
+            return lines + [f"e.g. {example[:200]}" for example in self.examples]
+
+
+schema_log = SchemaLog()
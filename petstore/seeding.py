@@ -0,0 +1,95 @@
+"""Bulk seeding and teardown of a known Petstore dataset"""
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from petstore.client import POOL_SIZE
+
+BULK_USER_ENDPOINTS = ("/user/createWithList", "/user/createWithArray")
+
+
+class Dataset:
+    """Declares how much data to seed: pets per status, orders and users"""
+
+    def __init__(self, pets_per_status, orders=0, users=0, user_batch_size=500):
+        self.pets_per_status = pets_per_status
+        self.orders = orders
+        self.users = users
+        self.user_batch_size = user_batch_size
+
+
+class SeededData:
+    """What was seeded, so tests can check exact counts instead of whatever is there"""
+
+    def __init__(self):
+        # Keyed by the base status, e.g. "available", holding the namespaced status actually used
+        self.statuses = {}
+        self.pets = {}
+        self.orders = []
+        self.users = []
+        self.round_trips = 0
+
+
+def run_all(calls, workers):
+    """Run (client method, path, kwargs) calls on a bounded thread pool"""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda call: call[0](call[1], **call[2]), calls))
+
+
+def check(responses, what, allowed=(200,)):
+    failed = [response for response in responses if response.status_code not in allowed]
+    if failed:
+        raise RuntimeError(
+            f"{len(failed)} of {len(responses)} {what} calls failed, first with "
+            f"{failed[0].status_code}: {failed[0].text[:200]}"
+        )
+
+
+def seed(client, allocator, dataset, workers=POOL_SIZE):
+    """Create the dataset with batched user imports and concurrent pet and order creation"""
+    seeded = SeededData()
+
+    for status, count in dataset.pets_per_status.items():
+        seeded.statuses[status] = allocator.name(status)
+        seeded.pets[status] = [
+            {"id": allocator.next_id(), "name": f"seed-{status}-{index}", "status": seeded.statuses[status]}
+            for index in range(count)
+        ]
+    all_pets = [pet for pets in seeded.pets.values() for pet in pets]
+    calls = [(client.post, "/pet", {"json": pet}) for pet in all_pets]
+
+    pets = itertools.cycle(all_pets)
+    for index in range(dataset.orders if all_pets else 0):
+        order = {
+            "id": allocator.next_id(), "petId": next(pets)["id"], "quantity": 1 + index % 5,
+            "status": "placed", "complete": False,
+        }
+        seeded.orders.append(order)
+        calls.append((client.post, "/store/order", {"json": order}))
+
+    seeded.users = [
+        {
+            "id": allocator.next_id(), "username": allocator.name(f"seed{index}"), "firstName": "Seed",
+            "lastName": str(index), "email": f"seed{index}@test.com", "password": "root", "userStatus": 0,
+        }
+        for index in range(dataset.users)
+    ]
+    # Users go in large batches, alternating between the two bulk endpoints
+    for number, start in enumerate(range(0, dataset.users, dataset.user_batch_size)):
+        batch = seeded.users[start:start + dataset.user_batch_size]
+        calls.append((client.post, BULK_USER_ENDPOINTS[number % 2], {"json": batch}))
+
+    responses = run_all(calls, workers)
+    check(responses, "seeding")
+    seeded.round_trips += len(responses)
+    return seeded
+
+
+def teardown(client, seeded, workers=POOL_SIZE):
+    """Delete everything seeded in one concurrent pass"""
+    paths = [f"/pet/{pet['id']}" for pets in seeded.pets.values() for pet in pets]
+    paths += [f"/store/order/{order['id']}" for order in seeded.orders]
+    paths += [f"/user/{user['username']}" for user in seeded.users]
+    responses = run_all([(client.delete, path, {}) for path in paths], workers)
+    # A test may already have deleted what it was given
+    check(responses, "teardown", allowed=(200, 404))
+    seeded.round_trips += len(responses)
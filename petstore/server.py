@@ -0,0 +1,587 @@
+"""Local in-process stand-in for the Petstore v2 API"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+import time
+from http import HTTPStatus
+from urllib.parse import parse_qs, unquote, urlsplit
+
+PREFIX = "/v2"
+
+INT32 = (-2**31, 2**31 - 1)
+INT64 = (-2**63, 2**63 - 1)
+
+# Largest request head and body the server will read before giving up on a client
+MAX_HEAD = 64 * 1024
+MAX_BODY = 256 * 1024 * 1024
+
+
+class BadInput(Exception):
+    """Raised when a request body can't be turned into a Petstore model"""
+
+
+class UnsupportedMediaType(Exception):
+    """Raised when a request body is sent with a content type the endpoint doesn't consume"""
+
+
+def api_response(code, message, type_="unknown"):
+    """Body of the ApiResponse model the real API returns for most writes and errors"""
+    return {"code": code, "type": type_, "message": message}
+
+
+def as_int(value, bounds):
+    """Coerce a JSON value to an integer the way the Java API does, within bounds"""
+    if isinstance(value, bool) or value is None:
+        raise BadInput(value)
+    if isinstance(value, str):
+        try:
+            value = int(value)
+        except ValueError as exc:
+            raise BadInput(value) from exc
+    if not isinstance(value, int) or not bounds[0] <= value <= bounds[1]:
+        raise BadInput(value)
+    return value
+
+
+def as_str(value):
+    """Coerce a JSON scalar to a string the way the Java API does"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        raise BadInput(value)
+    return json.dumps(value)
+
+
+def without_nulls(model):
+    """Match the real API, which leaves unset fields out of the JSON it returns"""
+    return {key: value for key, value in model.items() if value is not None}
+
+
+class PetstoreData:
+    """In-memory Petstore data, indexed for every lookup the API offers"""
+
+    def __init__(self):
+        self.pets = {}
+        self.pets_by_status = {}
+        self.orders = {}
+        self.users = {}
+        # The real API hands out large ids when a model is posted without one
+        self.next_id = itertools.count(9223372036854000000)
+
+    # Pets
+    def pet_from_json(self, body):
+        if not isinstance(body, dict):
+            raise BadInput(body)
+        pet = {"id": as_int(body["id"], INT64) if body.get("id") else next(self.next_id)}
+        category = body.get("category")
+        if category is not None:
+            if not isinstance(category, dict):
+                raise BadInput(category)
+            pet["category"] = without_nulls({
+                "id": as_int(category.get("id", 0), INT64),
+                "name": as_str(category.get("name")),
+            })
+        pet["name"] = as_str(body.get("name"))
+        photo_urls = body.get("photoUrls") or []
+        if not isinstance(photo_urls, list):
+            raise BadInput(photo_urls)
+        pet["photoUrls"] = [as_str(url) for url in photo_urls]
+        tags = body.get("tags") or []
+        if not isinstance(tags, list) or not all(isinstance(tag, dict) for tag in tags):
+            raise BadInput(tags)
+        pet["tags"] = [
+            without_nulls({"id": as_int(tag.get("id", 0), INT64), "name": as_str(tag.get("name"))}) for tag in tags
+        ]
+        pet["status"] = as_str(body.get("status"))
+        return without_nulls(pet)
+
+    def put_pet(self, pet):
+        self.delete_pet(pet["id"])
+        self.pets[pet["id"]] = pet
+        self.pets_by_status.setdefault(pet.get("status"), {})[pet["id"]] = pet
+
+    def delete_pet(self, pet_id):
+        pet = self.pets.pop(pet_id, None)
+        if pet is not None:
+            same_status = self.pets_by_status[pet.get("status")]
+            del same_status[pet_id]
+            if not same_status:
+                del self.pets_by_status[pet.get("status")]
+        return pet
+
+    def find_pets(self, statuses):
+        found = []
+        for status in statuses:
+            found.extend(self.pets_by_status.get(status, {}).values())
+        return found
+
+    def inventory(self):
+        return {status: len(pets) for status, pets in self.pets_by_status.items() if status is not None}
+
+    # Orders
+    def order_from_json(self, body):
+        if not isinstance(body, dict):
+            raise BadInput(body)
+        order = {
+            "id": as_int(body["id"], INT64) if body.get("id") else next(self.next_id),
+            "petId": as_int(body.get("petId", 0), INT64),
+            "quantity": as_int(body.get("quantity", 0), INT32),
+            "shipDate": as_str(body.get("shipDate")),
+            "status": as_str(body.get("status")),
+            "complete": bool(body.get("complete", False)),
+        }
+        return without_nulls(order)
+
+    # Users
+    def user_from_json(self, body):
+        if not isinstance(body, dict):
+            raise BadInput(body)
+        user = {
+            "id": as_int(body["id"], INT64) if body.get("id") else next(self.next_id),
+            "username": as_str(body.get("username")),
+            "firstName": as_str(body.get("firstName")),
+            "lastName": as_str(body.get("lastName")),
+            "email": as_str(body.get("email")),
+            "password": as_str(body.get("password")),
+            "phone": as_str(body.get("phone")),
+            "userStatus": as_int(body.get("userStatus", 0), INT32),
+        }
+        return without_nulls(user)
+
+
+class Request:
+    """Parsed HTTP request handed to the route handlers"""
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+        self.params = {}
+
+    @property
+    def content_type(self):
+        return self.headers.get("content-type", "").split(";")[0].strip().lower()
+
+    def json(self):
+        if self.content_type != "application/json":
+            raise UnsupportedMediaType()
+        try:
+            return json.loads(self.body)
+        except ValueError as exc:
+            raise BadInput(self.body) from exc
+
+    def form(self):
+        if self.content_type != "application/x-www-form-urlencoded":
+            raise UnsupportedMediaType()
+        try:
+            text = self.body.decode()
+        except UnicodeDecodeError as exc:
+            raise BadInput(self.body) from exc
+        return {key: values[-1] for key, values in parse_qs(text).items()}
+
+
+class PetstoreApp:
+    """Routes Petstore v2 requests onto a PetstoreData instance"""
+
+    def __init__(self, data=None, rate_limit=None, burst=10):
+        self.data = data if data is not None else PetstoreData()
+        # Optional requests per second to allow, answering the rest with 429 like a rate-limited public API
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.tokens = float(burst)
+        self.refilled = time.monotonic()
+        routes = [
+            ("/pet", {"POST": self.add_pet, "PUT": self.update_pet}),
+            ("/pet/findByStatus", {"GET": self.find_pets_by_status}),
+            ("/pet/{petId}", {"GET": self.get_pet, "POST": self.update_pet_form, "DELETE": self.delete_pet}),
+            ("/store/inventory", {"GET": self.get_inventory}),
+            ("/store/order", {"POST": self.place_order}),
+            ("/store/order/{orderId}", {"GET": self.get_order, "DELETE": self.delete_order}),
+            ("/user", {"POST": self.create_user}),
+            ("/user/createWithList", {"POST": self.create_users}),
+            ("/user/createWithArray", {"POST": self.create_users}),
+            ("/user/login", {"GET": self.login}),
+            ("/user/logout", {"GET": self.logout}),
+            ("/user/{username}", {"GET": self.get_user, "PUT": self.update_user, "DELETE": self.delete_user}),
+        ]
+        # Literal routes are indexed by path so only templated ones need matching
+        self.literal = {}
+        self.templated = []
+        for template, handlers in routes:
+            if "{" in template:
+                self.templated.append((template.strip("/").split("/"), handlers))
+            else:
+                self.literal[template] = handlers
+
+    def handle(self, request):
+        """Dispatch a request and return (status, body, headers)"""
+        if not request.path.startswith(PREFIX + "/"):
+            return 404, api_response(404, "HTTP 404 Not Found"), {}
+        if self.rate_limit is not None and not self.take_token():
+            return 429, api_response(429, "Too Many Requests"), {}
+        path = request.path[len(PREFIX):]
+        allowed = False
+        for handlers, params in self.match(path):
+            allowed = True
+            handler = handlers.get(request.method)
+            if handler is None:
+                continue
+            request.params = params
+            try:
+                return handler(request)
+            except UnsupportedMediaType:
+                return 415, api_response(415, "HTTP 415 Unsupported Media Type"), {}
+            except (BadInput, KeyError):
+                return 500, api_response(500, "something bad happened"), {}
+        if allowed:
+            return 405, api_response(405, "HTTP 405 Method Not Allowed"), {}
+        return 404, api_response(404, "HTTP 404 Not Found"), {}
+
+    def take_token(self):
+        # Only ever called from the server's event loop thread, so no lock is needed
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate_limit)
+        self.refilled = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+    def match(self, path):
+        if path in self.literal:
+            yield self.literal[path], {}
+        segments = path.strip("/").split("/")
+        for template, handlers in self.templated:
+            if len(template) != len(segments):
+                continue
+            params = {}
+            for expected, actual in zip(template, segments):
+                if expected.startswith("{"):
+                    params[expected[1:-1]] = unquote(actual)
+                elif expected != actual:
+                    break
+            else:
+                yield handlers, params
+
+    @staticmethod
+    def path_id(value):
+        try:
+            return as_int(value, INT64)
+        except BadInput:
+            return None
+
+    def not_a_number(self, value):
+        message = f'java.lang.NumberFormatException: For input string: "{value}"'
+        return 404, api_response(404, message), {}
+
+    # Pet endpoints
+    def add_pet(self, request):
+        try:
+            body = request.json()
+        except BadInput:
+            return 400, api_response(400, "bad input"), {}
+        pet = self.data.pet_from_json(body)
+        self.data.put_pet(pet)
+        return 200, pet, {}
+
+    def update_pet(self, request):
+        return self.add_pet(request)
+
+    def find_pets_by_status(self, request):
+        statuses = []
+        for value in request.query.get("status", []):
+            statuses.extend(status for status in value.split(",") if status)
+        return 200, self.data.find_pets(dict.fromkeys(statuses)), {}
+
+    def get_pet(self, request):
+        pet_id = self.path_id(request.params["petId"])
+        if pet_id is None:
+            return self.not_a_number(request.params["petId"])
+        pet = self.data.pets.get(pet_id)
+        if pet is None:
+            return 404, api_response(1, "Pet not found", "error"), {}
+        return 200, pet, {}
+
+    def update_pet_form(self, request):
+        pet_id = self.path_id(request.params["petId"])
+        if pet_id is None:
+            return self.not_a_number(request.params["petId"])
+        try:
+            form = request.form()
+        except BadInput:
+            return 400, api_response(400, "bad input"), {}
+        pet = self.data.pets.get(pet_id)
+        if pet is None:
+            return 404, api_response(404, "not found"), {}
+        pet = dict(pet)
+        for field in ("name", "status"):
+            if form.get(field):
+                pet[field] = form[field]
+        self.data.put_pet(pet)
+        return 200, api_response(200, str(pet_id)), {}
+
+    def delete_pet(self, request):
+        pet_id = self.path_id(request.params["petId"])
+        if pet_id is None:
+            return self.not_a_number(request.params["petId"])
+        if self.data.delete_pet(pet_id) is None:
+            return 404, None, {}
+        return 200, api_response(200, str(pet_id)), {}
+
+    # Store endpoints
+    def get_inventory(self, request):
+        return 200, self.data.inventory(), {}
+
+    def place_order(self, request):
+        try:
+            order = self.data.order_from_json(request.json())
+        except BadInput:
+            return 400, api_response(400, "Invalid Order"), {}
+        self.data.orders[order["id"]] = order
+        return 200, order, {}
+
+    def get_order(self, request):
+        order_id = self.path_id(request.params["orderId"])
+        if order_id is None:
+            return self.not_a_number(request.params["orderId"])
+        order = self.data.orders.get(order_id)
+        if order is None:
+            return 404, api_response(1, "Order not found", "error"), {}
+        return 200, order, {}
+
+    def delete_order(self, request):
+        order_id = self.path_id(request.params["orderId"])
+        if order_id is None:
+            return self.not_a_number(request.params["orderId"])
+        if self.data.orders.pop(order_id, None) is None:
+            return 404, api_response(404, "Order Not Found"), {}
+        return 200, api_response(200, str(order_id)), {}
+
+    # User endpoints
+    def create_user(self, request):
+        try:
+            body = request.json()
+        except BadInput:
+            return 400, api_response(400, "bad input"), {}
+        user = self.data.user_from_json(body)
+        self.data.users[user.get("username")] = user
+        return 200, api_response(200, str(user["id"])), {}
+
+    def create_users(self, request):
+        try:
+            body = request.json()
+        except BadInput:
+            return 400, api_response(400, "bad input"), {}
+        if not isinstance(body, list):
+            raise BadInput(body)
+        users = [self.data.user_from_json(item) for item in body]
+        for user in users:
+            self.data.users[user.get("username")] = user
+        return 200, api_response(200, "ok"), {}
+
+    def login(self, request):
+        expires = time.strftime("%a %b %d %H:%M:%S UTC %Y", time.gmtime(time.time() + 3600))
+        headers = {"X-Rate-Limit": "5000", "X-Expires-After": expires}
+        return 200, api_response(200, f"logged in user session:{time.time_ns() // 1000000}"), headers
+
+    def logout(self, request):
+        return 200, api_response(200, "ok"), {}
+
+    def get_user(self, request):
+        user = self.data.users.get(request.params["username"])
+        if user is None:
+            return 404, api_response(1, "User not found", "error"), {}
+        return 200, user, {}
+
+    def update_user(self, request):
+        try:
+            body = request.json()
+        except BadInput:
+            return 400, api_response(400, "bad input"), {}
+        user = self.data.user_from_json(body)
+        if user.get("username") != request.params["username"]:
+            self.data.users.pop(request.params["username"], None)
+        self.data.users[user.get("username")] = user
+        return 200, api_response(200, str(user["id"])), {}
+
+    def delete_user(self, request):
+        username = request.params["username"]
+        if self.data.users.pop(username, None) is None:
+            return 404, None, {}
+        return 200, api_response(200, username), {}
+
+
+def parse_length(text, base=10):
+    try:
+        length = int(text, base)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise ValueError("malformed body length")
+    return length
+
+
+async def read_body(reader, headers):
+    """Read a Content-Length or chunked request body"""
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        size = 0
+        while True:
+            line = await reader.readuntil(b"\r\n")
+            length = parse_length(line.split(b";")[0], 16)
+            if length == 0:
+                # Skip any trailers up to the blank line that ends the body
+                while await reader.readuntil(b"\r\n") != b"\r\n":
+                    pass
+                return b"".join(chunks)
+            size += length
+            if size > MAX_BODY:
+                raise ValueError("request body too large")
+            chunks.append(await reader.readexactly(length))
+            await reader.readexactly(2)
+    length = parse_length(headers.get("content-length", "0"))
+    if length > MAX_BODY:
+        raise ValueError("request body too large")
+    return await reader.readexactly(length) if length else b""
+
+
+class PetstoreServer:
+    """Serves a PetstoreApp over HTTP/1.1 keep-alive from a background event loop thread"""
+
+    def __init__(self, host="127.0.0.1", port=0, app=None):
+        self.host = host
+        self.port = port
+        self.app = app if app is not None else PetstoreApp()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.connections = set()
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}{PREFIX}"
+
+    async def handle_connection(self, reader, writer):
+        self.connections.add(writer)
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.reject(writer, "request head too large", 431)
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                parts = request_line.split(" ")
+                if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                    await self.reject(writer, "malformed request line")
+                    return
+                method, target, version = parts
+                headers = {}
+                for line in header_lines:
+                    if line:
+                        name, _, value = line.partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                try:
+                    body = await read_body(reader, headers)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self.reject(writer, "malformed body length")
+                    return
+                except ValueError as exc:
+                    # A bad length or chunk size leaves the rest of the stream unreadable
+                    await self.reject(writer, str(exc))
+                    return
+
+                url = urlsplit(target)
+                request = Request(method, url.path, parse_qs(url.query, keep_blank_values=True), headers, body)
+                status, payload, extra_headers = self.app.handle(request)
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection != "close" if version == "HTTP/1.1" else connection == "keep-alive"
+                writer.write(self.encode_response(status, payload, extra_headers, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    return
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    async def reject(self, writer, message, status=400):
+        """Answer a request that can't be parsed with 400, or the status given, and give up on the connection"""
+        writer.write(self.encode_response(status, api_response(status, message), {}, keep_alive=False))
+        await writer.drain()
+
+    @staticmethod
+    def encode_response(status, payload, extra_headers, keep_alive):
+        body = b"" if payload is None else json.dumps(payload, separators=(",", ":")).encode()
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Content-Length: {len(body)}"]
+        if payload is not None:
+            lines.append("Content-Type: application/json")
+        lines.extend(f"{name}: {value}" for name, value in extra_headers.items())
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+    async def serve(self):
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port, limit=MAX_HEAD, backlog=4096
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    def start(self):
+        """Start serving from a daemon thread and return once the port is bound"""
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.serve())
+        self.thread = threading.Thread(target=self.loop.run_forever, name="petstore-server", daemon=True)
+        self.thread.start()
+        return self
+
+    async def shutdown(self):
+        # Closing the sockets ends each keep-alive loop at its next read
+        self.server.close()
+        for writer in list(self.connections):
+            writer.close()
+        await self.server.wait_closed()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.loop = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """Run the stand-in server in the foreground"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--rate-limit", type=float, help="Answer requests beyond this many per second with 429")
+    args = parser.parse_args()
+
+    server = PetstoreServer(args.host, args.port, PetstoreApp(rate_limit=args.rate_limit))
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(server.serve())
+    print(f"Petstore stand-in serving {server.url}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Latency budgets and the baseline regression gate for the Petstore endpoints"""
+import json
+import math
+import re
+
+from petstore.metrics import dump_histograms, load_histograms
+
+# Per-endpoint latency budgets, each promised up to the given load
+BUDGETS = [
+    "p99 GET /pet/{petId} < 300ms at 50 RPS",
+    "p99 GET /pet/findByStatus < 1000ms at 100 RPS",
+    "p99 GET /store/order/{orderId} < 500ms at 100 RPS",
+    "p99 GET /store/inventory < 500ms at 50 RPS",
+    "p99 GET /user/{username} < 500ms at 100 RPS",
+    "p99 GET /user/login < 500ms at 50 RPS",
+]
+
+# A slowdown is only a regression when it is both significant and large enough to matter
+ALPHA = 0.01
+MIN_SLOWDOWN = 0.10
+MIN_SAMPLES = 20
+
+BUDGET_PATTERN = re.compile(
+    r"p(?P<pct>[\d.]+)\s+(?P<method>[A-Z]+)\s+(?P<template>\S+)\s*<\s*(?P<limit>[\d.]+)ms"
+    r"(?:\s+at\s+(?P<rate>[\d.]+)\s*RPS)?$",
+    re.IGNORECASE,
+)
+
+
+class Budget:
+    """Latency budget such as "p99 GET /pet/{petId} < 300ms at 50 RPS" """
+
+    def __init__(self, pct, method, template, limit_ms, rate=None):
+        self.pct = pct
+        self.method = method
+        self.template = template
+        self.limit_ms = limit_ms
+        self.rate = rate
+
+    @classmethod
+    def parse(cls, text):
+        match = BUDGET_PATTERN.match(text.strip())
+        if match is None:
+            raise ValueError(f"Can't parse latency budget {text!r}")
+        rate = match["rate"]
+        return cls(
+            float(match["pct"]), match["method"].upper(), match["template"], float(match["limit"]),
+            float(rate) if rate else None,
+        )
+
+    @property
+    def key(self):
+        return (self.method, self.template)
+
+    def __str__(self):
+        text = f"p{self.pct:g} {self.method} {self.template} < {self.limit_ms:g}ms"
+        return f"{text} at {self.rate:g} RPS" if self.rate else text
+
+
+def check_budgets(result, budgets=None):
+    """Describe every budget a load result breaks, for the endpoints it exercised"""
+    budgets = [Budget.parse(budget) if isinstance(budget, str) else budget for budget in budgets or BUDGETS]
+    violations = []
+    for budget in budgets:
+        histogram = result.endpoints.get(budget.key)
+        if histogram is None or not histogram.count:
+            continue
+        rate = histogram.count / result.elapsed if result.elapsed else 0.0
+        # A budget holds up to its stated load, so heavier runs aren't judged by it
+        if budget.rate and rate > budget.rate * 1.05:
+            continue
+        measured = histogram.percentile(budget.pct) * 1000
+        if measured >= budget.limit_ms:
+            violations.append(f"{budget}: measured {measured:.1f}ms at {rate:.0f} RPS")
+    return violations
+
+
+def assert_budgets(result, budgets=None):
+    """Fail the calling test if the load result breaks any latency budget"""
+    violations = check_budgets(result, budgets)
+    assert not violations, "Latency budget exceeded:\n" + "\n".join(violations)
+
+
+def slower_probability(baseline, current):
+    """One-sided Mann-Whitney U p-value that current latencies are larger than the baseline's
+
+    Both histograms share bucket boundaries, so values in the same bucket are
+    treated as ties and the ranks come straight from the bucket counts.
+    """
+    n1, n2 = baseline.count, current.count
+    below = 0
+    u_stat = 0.0
+    ties = 0
+    for base_count, current_count in zip(baseline.counts, current.counts):
+        if base_count or current_count:
+            u_stat += current_count * (below + base_count / 2)
+            tied = base_count + current_count
+            ties += tied ** 3 - tied
+            below += base_count
+    total = n1 + n2
+    variance = n1 * n2 / 12 * ((total + 1) - ties / (total * (total - 1)))
+    if variance <= 0:
+        return 1.0
+    z_score = (u_stat - n1 * n2 / 2) / math.sqrt(variance)
+    return 0.5 * math.erfc(z_score / math.sqrt(2))
+
+
+def find_regressions(baseline, current, alpha=ALPHA, min_slowdown=MIN_SLOWDOWN):
+    """Compare per-endpoint histograms against a baseline and describe the regressions"""
+    regressions = []
+    for key, histogram in sorted(current.items()):
+        before = baseline.get(key)
+        if before is None or before.count < MIN_SAMPLES or histogram.count < MIN_SAMPLES:
+            continue
+        p_value = slower_probability(before, histogram)
+        old, new = before.percentile(50), histogram.percentile(50)
+        if p_value < alpha and new > old * (1 + min_slowdown):
+            regressions.append(
+                f"{key[0]} {key[1]}: p50 {old * 1000:.1f}ms -> {new * 1000:.1f}ms, "
+                f"p99 {before.percentile(99) * 1000:.1f}ms -> {histogram.percentile(99) * 1000:.1f}ms "
+                f"(p={p_value:.2g})"
+            )
+    return regressions
+
+
+def save_baseline(path, histograms):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(dump_histograms(histograms), file, indent=1, sort_keys=True)
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as file:
+        return load_histograms(json.load(file))
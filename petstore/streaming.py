@@ -0,0 +1,169 @@
+"""Incremental parsing and validation of JSON array responses such as /pet/findByStatus"""
+import codecs
+import json
+import threading
+import time
+from collections import Counter
+
+from petstore.metrics import Recorder, dump_histograms, endpoint_template, load_histograms
+from petstore.schemas import checked_items
+
+CHUNK_SIZE = 16 * 1024
+WHITESPACE = " \t\n\r"
+
+
+class JsonArrayParser:
+    """Yields the items of a top-level JSON array as its bytes arrive
+
+    Only the item currently being received is buffered, so memory stays flat
+    however long the array is.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.state = "start"
+
+    @property
+    def done(self):
+        return self.state == "end"
+
+    def feed(self, chunk):
+        """Add the next chunk of bytes and return the items it completed"""
+        self.buffer += self.text.decode(chunk)
+        items = []
+        buffer = self.buffer
+        pos = 0
+        while True:
+            while pos < len(buffer) and buffer[pos] in WHITESPACE:
+                pos += 1
+            if pos == len(buffer) or self.state == "end":
+                break
+            char = buffer[pos]
+            if self.state == "start":
+                if char != "[":
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                self.state = "first"
+                pos += 1
+            elif self.state == "first" and char == "]":
+                self.state = "end"
+                pos += 1
+            elif self.state in ("first", "item"):
+                try:
+                    item, end = self.decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    # Most likely the item isn't complete yet; close() reports real garbage
+                    break
+                if end == len(buffer) and isinstance(item, (int, float)) and not isinstance(item, bool):
+                    # A number at the end of the buffer may still have digits to come
+                    break
+                pos = end
+                items.append(item)
+                self.state = "after"
+            elif char == ",":
+                self.state = "item"
+                pos += 1
+            elif char == "]":
+                self.state = "end"
+                pos += 1
+            else:
+                raise ValueError(f"Expected ',' or ']' after an array item, got {char!r}")
+        self.buffer = buffer[pos:]
+        return items
+
+    def close(self):
+        self.buffer += self.text.decode(b"", final=True)
+        if not self.done or self.buffer.strip():
+            raise ValueError(f"Truncated or malformed JSON array near {self.buffer[:80]!r}")
+
+
+class StreamStats:
+    """What it cost to parse one streamed response"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.items = 0
+        self.parse_seconds = 0.0
+        self.violation = None
+
+    @property
+    def ok(self):
+        return self.violation is None
+
+
+class ParseLog:
+    """Per-endpoint parse times and payload sizes, reported separately from server latency"""
+
+    def __init__(self):
+        self.times = Recorder()
+        self.lock = threading.Lock()
+        self.bytes = Counter()
+
+    def record(self, method, path, stats):
+        self.times.record(method, path, stats.parse_seconds)
+        with self.lock:
+            self.bytes[(method, endpoint_template(path))] += stats.bytes
+
+    def to_dict(self):
+        with self.lock:
+            data = {"bytes": [[method, template, count] for (method, template), count in self.bytes.items()]}
+        data["times"] = dump_histograms(self.times.snapshot())
+        return data
+
+    def absorb(self, data):
+        """Add parse times recorded elsewhere, e.g. by another worker process"""
+        self.times.absorb(load_histograms(data["times"]))
+        with self.lock:
+            for method, template, count in data["bytes"]:
+                self.bytes[(method, template)] += count
+
+    def report_lines(self):
+        snapshot = self.times.snapshot()
+        if not snapshot:
+            return []
+        lines = [f"{'endpoint':<30} {'responses':>9} {'avg bytes':>10} {'p50 parse':>10} {'p99 parse':>10}"]
+        for key, histogram in sorted(snapshot.items()):
+            lines.append(
+                f"{key[0] + ' ' + key[1]:<30} {histogram.count:>9} {self.bytes[key] // histogram.count:>10} "
+                f"{histogram.percentile(50) * 1000:>8.2f}ms {histogram.percentile(99) * 1000:>8.2f}ms"
+            )
+        return lines
+
+
+parse_log = ParseLog()
+
+
+def check_items(chunks, check, stats=None):
+    """Parse a chunked JSON array and check each item as it arrives, stopping at the first failure"""
+    stats = stats if stats is not None else StreamStats()
+    parser = JsonArrayParser()
+    for chunk in chunks:
+        stats.bytes += len(chunk)
+        started = time.perf_counter()
+        try:
+            for item in parser.feed(chunk):
+                stats.items += 1
+                if not check(item):
+                    stats.violation = item
+                    return stats
+        finally:
+            stats.parse_seconds += time.perf_counter() - started
+    started = time.perf_counter()
+    parser.close()
+    stats.parse_seconds += time.perf_counter() - started
+    return stats
+
+
+def stream_check(client, path, check, **kwargs):
+    """GET a JSON array endpoint and validate it item by item without holding the whole body"""
+    response = client.get(path, stream=True, **kwargs)
+    try:
+        if response.status_code != 200:
+            raise AssertionError(f"GET {path} returned {response.status_code}")
+        stats = check_items(response.iter_content(CHUNK_SIZE), checked_items("GET", path, check))
+    finally:
+        # Returns the connection to the pool, or drops it if we stopped before the end of the body
+        response.close()
+    parse_log.record("GET", path, stats)
+    return stats
@@ -0,0 +1,200 @@
+"""Client-side rate limiting and retries, shared by every thread using a PetstoreClient"""
+import email.utils
+import random
+import threading
+import time
+from collections import Counter
+
+from petstore.metrics import endpoint_template
+
+# Methods that are safe to send twice; other methods are only retried on 429,
+# which means the server turned the request away without acting on it
+IDEMPOTENT = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+# The Petstore's own 500 is a deterministic "something bad happened" for bad input, so it isn't retried
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# Every 429 from one burst of in-flight requests counts as a single slowdown
+COOLDOWN = 0.2
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header holding either seconds or an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class TokenBucket:
+    """Thread-safe token bucket that finds the server's limit by AIMD
+
+    With no starting rate it lets everything through until the first 429, then
+    halves the rate it was seeing. Each later 429 halves it again, and while
+    requests succeed the rate grows by about `growth` of itself each second.
+    """
+
+    def __init__(self, rate=None, burst=10, min_rate=1.0, max_rate=None, growth=0.5, decrease=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.growth = growth
+        self.decrease = decrease
+        self.lock = threading.Lock()
+        now = time.monotonic()
+        self.tokens = float(burst)
+        self.updated = now
+        self.paused_until = now
+        self.slowed_at = None
+        # Rate actually sent, measured over about a second, for the first slowdown
+        self.window_start = now
+        self.window_count = 0
+        self.observed = 0.0
+
+    def acquire(self):
+        """Take a token, sleeping until one is free, and return the seconds spent waiting"""
+        with self.lock:
+            now = time.monotonic()
+            self.window_count += 1
+            if now - self.window_start >= 1.0:
+                self.observed = self.window_count / (now - self.window_start)
+                self.window_start = now
+                self.window_count = 0
+            wait = max(0.0, self.paused_until - now)
+            if self.rate is not None:
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                # Tokens may go negative: each caller reserves its place in the queue
+                self.tokens -= 1
+                if self.tokens < 0:
+                    wait = max(wait, -self.tokens / self.rate)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after=None):
+        """Slow down after the server said we are sending too fast"""
+        with self.lock:
+            now = time.monotonic()
+            if retry_after:
+                # Every thread holds off until the server said it would take requests again
+                self.paused_until = max(self.paused_until, now + retry_after)
+            if self.slowed_at is not None and now - self.slowed_at < COOLDOWN:
+                return
+            self.slowed_at = now
+            if self.rate is None:
+                elapsed = now - self.window_start
+                self.rate = max(self.window_count / max(elapsed, 0.01), self.observed)
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = now
+
+    def succeeded(self):
+        with self.lock:
+            if self.rate is not None:
+                # About `rate` successes a second, so this compounds to `growth` a second
+                self.rate += self.growth
+                if self.max_rate is not None:
+                    self.rate = min(self.rate, self.max_rate)
+
+
+class RetryPolicy:
+    """When to retry a request and how long to back off first"""
+
+    def __init__(self, retries=5, backoff=0.1, max_backoff=30.0, statuses=RETRY_STATUSES, methods=IDEMPOTENT):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.statuses = statuses
+        self.methods = methods
+
+    def should_retry(self, method, status):
+        if status == 429:
+            return True
+        return status in self.statuses and method in self.methods
+
+    def delay(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt (from 0), honouring Retry-After"""
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # Full jitter, so threads that failed together don't all come back together
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+
+class ThrottleLog:
+    """Retries and time spent throttled, reported separately from server latency"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.retries = Counter()
+        self.reasons = Counter()
+        self.gave_up = 0
+        self.limited_seconds = 0.0
+        self.backoff_seconds = 0.0
+
+    def limited(self, seconds):
+        if seconds:
+            with self.lock:
+                self.limited_seconds += seconds
+
+    def retried(self, method, path, reason, delay):
+        with self.lock:
+            self.retries[(method, endpoint_template(path))] += 1
+            self.reasons[str(reason)] += 1
+            self.backoff_seconds += delay
+
+    def exhausted(self):
+        with self.lock:
+            self.gave_up += 1
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "retries": [[method, template, count] for (method, template), count in self.retries.items()],
+                "reasons": dict(self.reasons),
+                "gave_up": self.gave_up,
+                "limited_seconds": self.limited_seconds,
+                "backoff_seconds": self.backoff_seconds,
+            }
+
+    def absorb(self, data):
+        """Add counts recorded elsewhere, e.g. by another worker process"""
+        with self.lock:
+            for method, template, count in data["retries"]:
+                self.retries[(method, template)] += count
+            self.reasons.update(data["reasons"])
+            self.gave_up += data["gave_up"]
+            self.limited_seconds += data["limited_seconds"]
+            self.backoff_seconds += data["backoff_seconds"]
+
+    def clear(self):
+        with self.lock:
+            self.retries.clear()
+            self.reasons.clear()
+            self.gave_up = 0
+            self.limited_seconds = 0.0
+            self.backoff_seconds = 0.0
+
+    def report_lines(self):
+        with self.lock:
+            if not self.retries and not self.limited_seconds:
+                return []
+            reasons = ", ".join(f"{reason}: {count}" for reason, count in sorted(self.reasons.items()))
+            lines = [
+                f"{sum(self.retries.values())} retries ({reasons or 'none'}), {self.gave_up} gave up, "
+                f"{self.limited_seconds:.2f}s waiting on the rate limiter and {self.backoff_seconds:.2f}s backing off "
+                "(summed over threads)"
+            ]
+            for (method, template), count in sorted(self.retries.items()):
+                lines.append(f"{method + ' ' + template:<30} {count:>6} retries")
+            return lines
+
+
+throttle_log = ThrottleLog()
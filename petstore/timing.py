@@ -0,0 +1,200 @@
+"""Per-request phase timings: DNS, TCP connect, TLS, time to first byte and body transfer"""
+import socket
+import time
+
+import aiohttp
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+
+from petstore import metrics
+
+PHASES = ("dns", "connect", "tls", "ttfb", "transfer")
+# Only a request that opened its own connection spends time in these
+CONNECT_PHASES = ("dns", "connect", "tls")
+
+
+class PhaseTimer:
+    """Connection mixin that times each phase of a request and hangs the timings on the urllib3 response
+
+    Phases that didn't happen are None: the connect phases on a reused
+    connection, and TLS over plain HTTP.
+    """
+
+    tls = False
+    connect_phases = None
+    ready_at = 0.0
+    request_at = 0.0
+
+    def _new_conn(self):
+        started = time.perf_counter()
+        host = self._dns_host
+        try:
+            addresses = socket.getaddrinfo(host, self.port, allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror:
+            # Let urllib3 raise its usual NameResolutionError
+            return super()._new_conn()
+        resolved = time.perf_counter()
+        # Connect to the resolved addresses in turn, as urllib3 would, without looking the name up again
+        try:
+            for index, address in enumerate(addresses):
+                self._dns_host = address[4][0]
+                try:
+                    sock = super()._new_conn()
+                    break
+                except NewConnectionError:
+                    if index == len(addresses) - 1:
+                        raise
+        finally:
+            self._dns_host = host
+        self.dns_seconds = resolved - started
+        self.tcp_seconds = time.perf_counter() - resolved
+        return sock
+
+    def connect(self):
+        started = time.perf_counter()
+        self.dns_seconds = self.tcp_seconds = 0.0
+        super().connect()
+        self.ready_at = time.perf_counter()
+        tls = self.ready_at - started - self.dns_seconds - self.tcp_seconds
+        self.connect_phases = {"dns": self.dns_seconds, "connect": self.tcp_seconds, "tls": tls if self.tls else None}
+
+    def request(self, *args, **kwargs):
+        self.request_at = time.perf_counter()
+        return super().request(*args, **kwargs)
+
+    def getresponse(self):
+        response = super().getresponse()
+        response.first_byte_at = time.perf_counter()
+        # Plain HTTP connects inside request(), so the wait for a reply starts once it is connected
+        waited = response.first_byte_at - max(self.request_at, self.ready_at)
+        response.phases = dict(self.connect_phases or dict.fromkeys(CONNECT_PHASES), ttfb=waited, transfer=None)
+        self.connect_phases = None
+        return response
+
+
+class TimedHTTPConnection(PhaseTimer, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(PhaseTimer, HTTPSConnection):
+    tls = True
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedAdapter(HTTPAdapter):
+    """HTTPAdapter whose connections time every request's phases"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+
+def trace_config():
+    """aiohttp TraceConfig filling the dict passed as trace_request_ctx with a request's phases
+
+    aiohttp doesn't say when the TLS handshake starts, so over HTTPS it is
+    counted in connect. A name found in aiohttp's DNS cache takes no time.
+    """
+    config = aiohttp.TraceConfig()
+
+    def at(name):
+        async def mark(session, context, params):
+            if context.trace_request_ctx is not None:
+                context.trace_request_ctx[name] = time.perf_counter()
+        return mark
+
+    config.on_dns_resolvehost_start.append(at("dns_start"))
+    config.on_dns_resolvehost_end.append(at("dns_end"))
+    config.on_connection_create_start.append(at("connect_start"))
+    config.on_connection_create_end.append(at("connect_end"))
+    config.on_request_headers_sent.append(at("sent"))
+    config.on_request_end.append(at("first_byte"))
+    return config
+
+
+def traced_phases(marks, finished):
+    """Phase timings from the marks trace_config() left, given when the body had been read"""
+    if "first_byte" not in marks:
+        return None
+    phases = dict.fromkeys(CONNECT_PHASES)
+    if "connect_end" in marks:
+        dns = marks.get("dns_end", 0.0) - marks.get("dns_start", 0.0)
+        phases["dns"] = dns
+        phases["connect"] = marks["connect_end"] - marks["connect_start"] - dns
+    phases["ttfb"] = marks["first_byte"] - marks.get("sent", marks["first_byte"])
+    phases["transfer"] = finished - marks["first_byte"]
+    return phases
+
+
+class PhaseLog:
+    """Histograms of each request phase per endpoint, with one lock-free Recorder per phase"""
+
+    def __init__(self):
+        self.recorders = {phase: metrics.Recorder() for phase in PHASES}
+
+    def record(self, method, path, phases):
+        for phase, seconds in phases.items():
+            if seconds is not None:
+                self.recorders[phase].record(method, path, seconds)
+
+    def snapshot(self):
+        return {phase: recorder.snapshot() for phase, recorder in self.recorders.items()}
+
+    def to_dict(self):
+        return {phase: metrics.dump_histograms(histograms) for phase, histograms in self.snapshot().items()}
+
+    def absorb(self, data):
+        """Add timings recorded elsewhere, e.g. by another worker process"""
+        for phase, histograms in data.items():
+            self.recorders[phase].absorb(metrics.load_histograms(histograms))
+
+    def clear(self):
+        for recorder in self.recorders.values():
+            recorder.clear()
+
+    def report_lines(self):
+        snapshot = self.snapshot()
+        if not snapshot["ttfb"]:
+            return []
+        empty = metrics.Histogram()
+
+        def ms(histogram, pct=50):
+            return f"{histogram.percentile(pct) * 1000:>6.1f}ms" if histogram.count else f"{'-':>8}"
+
+        names = {key: f"{key[0]} {key[1]}" for key in snapshot["ttfb"]}
+        width = max(len("all endpoints"), *(len(name) for name in names.values()))
+        lines = [
+            f"{'endpoint':<{width}} {'count':>7} {'new conn':>8} {'dns':>8} {'connect':>8} {'tls':>8} "
+            f"{'ttfb p50':>8} {'ttfb p99':>8} {'transfer':>8}"
+        ]
+        totals = {phase: metrics.Histogram() for phase in PHASES}
+        rows = []
+        for key in sorted(names, key=lambda key: (key[1], key[0])):
+            row = {phase: snapshot[phase].get(key, empty) for phase in PHASES}
+            for phase, histogram in row.items():
+                totals[phase].merge(histogram)
+            rows.append((names[key], row))
+        rows.append(("all endpoints", totals))
+        for name, row in rows:
+            # Every new connection records a connect time, so its count is the number of connections opened
+            lines.append(
+                f"{name:<{width}} {row['ttfb'].count:>7} {row['connect'].count:>8} {ms(row['dns'])} "
+                f"{ms(row['connect'])} {ms(row['tls'])} {ms(row['ttfb'])} {ms(row['ttfb'], 99)} "
+                f"{ms(row['transfer'])}"
+            )
+        lines.append("dns, connect and tls are medians over new connections only; other columns are p50 unless named")
+        return lines
+
+
+# Shared by the client and the load engine so every request's phases land in one report
+phase_log = PhaseLog()
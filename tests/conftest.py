@@ -0,0 +1,389 @@
+"""Shared fixtures for the Petstore API tests"""
+import contextlib
+import itertools
+import sys
+import time
+from collections import Counter
+import pytest
+from petstore import cache, metrics
+from petstore.cache import CachingClient, ResponseCache
+from petstore.client import PetstoreClient
+from petstore.history import ReportStore, build_report, environment, load_log
+from petstore.ids import IdAllocator, Namespace, new_run_id
+from petstore.live import LiveReporter, MetricsServer, live
+from petstore.proxy import FaultProxy, load_faults
+from petstore.replay import TrafficCapture
+from petstore.resources import resources
+from petstore.schemas import schema_log
+from petstore.seeding import Dataset, seed, teardown
+from petstore.server import PetstoreServer
+from petstore.streaming import parse_log
+from petstore.throttle import throttle_log
+from petstore.timing import phase_log
+from petstore.slo import find_regressions, load_baseline, save_baseline
+
+STATS_KEY = pytest.StashKey()
+REGRESSIONS_KEY = pytest.StashKey()
+RUN_KEY = pytest.StashKey()
+SLOTS_KEY = pytest.StashKey()
+LIVE_KEY = pytest.StashKey()
+FAULTS_KEY = pytest.StashKey()
+STARTED_KEY = pytest.StashKey()
+REPORT_KEY = pytest.StashKey()
+
+# Seeded once per session (per worker under xdist) for tests that need known data
+SEED_DATASET = Dataset(
+    pets_per_status={"available": 30, "pending": 20, "sold": 10}, orders=30, users=200, user_batch_size=100
+)
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--petstore-url",
+        default="local",
+        help="Petstore API base URL, or 'local' (default) to start the in-process stand-in "
+             "server. Use https://petstore.swagger.io/v2 to test the public API.",
+    )
+    parser.addoption(
+        "--baseline",
+        help="Latency baseline JSON to compare this run against; a significant slowdown fails the run",
+    )
+    parser.addoption("--save-baseline", help="Write this run's latency histograms to a baseline JSON file")
+    parser.addoption(
+        "--record",
+        help="Record every request and response the shared client makes to this JSON Lines file "
+             "(one file per worker under xdist); replay it with python -m petstore.replay",
+    )
+    parser.addoption(
+        "--fuzz-cases", type=int, default=300, help="Generated payloads per model in the fuzz tests (default 300)"
+    )
+    parser.addoption("--soak", type=float, default=0, help="Run the soak profile tests for this many seconds")
+    parser.addoption(
+        "--inventory-sizes", default="500,2000",
+        help="Dataset sizes the inventory scaling test grows through, e.g. 1000,10000,100000 (default 500,2000)",
+    )
+    parser.addoption(
+        "--metrics-port", type=int,
+        help="Serve live Prometheus-style metrics at http://127.0.0.1:PORT/metrics while the tests run "
+             "(PORT plus the worker number under xdist)",
+    )
+    parser.addoption(
+        "--live-every", type=float, default=0,
+        help="Print in-flight requests, req/s, error rate and rolling p50/p99 to stderr every this many seconds",
+    )
+    parser.addoption(
+        "--report",
+        help="Append this run's performance report to a SQLite store; see python -m petstore.history "
+             "for trends and comparisons",
+    )
+    parser.addoption("--report-label", help="Label for this run in the report store, e.g. a branch or build")
+    parser.addoption(
+        "--profile-client", action="store_true",
+        help="Sample the stacks of the tests' own busy threads and list the hottest client functions",
+    )
+    parser.addoption(
+        "--faults",
+        help="Send the tests through petstore.proxy, injecting the delays, resets and errors listed in this "
+             'JSON file, e.g. [{"pattern": "/store/order/*", "delay": 0.5, "error_rate": 0.05}]',
+    )
+
+
+def is_worker(config):
+    """Whether this process is a pytest-xdist worker rather than the controller or a plain run"""
+    return hasattr(config, "workerinput")
+
+
+def pytest_configure(config):
+    config.stash[STARTED_KEY] = time.time()
+    if not is_worker(config):
+        config.stash[RUN_KEY] = new_run_id()
+        config.stash[SLOTS_KEY] = itertools.count()
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    """Reserve a non-overlapping id range and name prefix for each xdist worker"""
+    node.workerinput["petstore_run"] = node.config.stash[RUN_KEY]
+    node.workerinput["petstore_slot"] = next(node.config.stash[SLOTS_KEY])
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    """Merge a finished worker's latency histograms, phases, retries and connection counts into the controller's"""
+    output = getattr(node, "workeroutput", {})
+    metrics.recorder.absorb(
+        metrics.load_histograms(output.get("petstore_latency", {})),
+        metrics.load_statuses(output.get("petstore_statuses", [])),
+    )
+    if "petstore_throttle" in output:
+        throttle_log.absorb(output["petstore_throttle"])
+    if "petstore_schema" in output:
+        schema_log.absorb(output["petstore_schema"])
+    if "petstore_phases" in output:
+        phase_log.absorb(output["petstore_phases"])
+    cache.totals.update(output.get("petstore_cache", {}))
+    if "petstore_live" in output:
+        live.absorb(output["petstore_live"])
+    if "petstore_loads" in output:
+        load_log.absorb(output["petstore_loads"])
+    if "petstore_resources" in output:
+        resources.absorb(output["petstore_resources"])
+    if "petstore_faults" in output:
+        node.config.stash.setdefault(FAULTS_KEY, Counter()).update(output["petstore_faults"])
+    stats = output.get("petstore_connections")
+    if stats:
+        totals = node.config.stash.setdefault(STATS_KEY, dict.fromkeys(stats, 0))
+        for key, value in stats.items():
+            totals[key] += value
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    """Fail any test during which a response broke the Petstore schema, even if it never looked"""
+    before = schema_log.total
+    examples = len(schema_log.examples)
+    result = yield
+    broken = schema_log.total - before
+    if broken:
+        details = "\n".join(schema_log.examples[examples:]) or "see the schema section of the summary"
+        raise AssertionError(f"{broken} responses broke the Petstore schema:\n{details}")
+    return result
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_pyfunc_call(pyfuncitem):
+    """Sample the test process's CPU, memory, sockets, threads and event loop lag while a test runs"""
+    resources.begin(pyfuncitem.nodeid)
+    try:
+        return (yield)
+    finally:
+        flags = resources.end().flags(resources.thresholds, resources.limit)
+        if flags:
+            pyfuncitem.add_report_section(
+                "call", "client resources", f"CLIENT-BOUND: {', '.join(flags)}; the numbers may not be the server's"
+            )
+
+
+@pytest.fixture(name="allocator", scope="session")
+def id_allocator(request):
+    """Id range reserved for this worker"""
+    config = request.config
+    if is_worker(config):
+        return IdAllocator(config.workerinput["petstore_run"], config.workerinput["petstore_slot"])
+    return IdAllocator(config.stash[RUN_KEY], 0)
+
+
+@pytest.fixture(name="ids")
+def id_namespace(allocator, client):
+    """Fresh ids and names for one test, cleaned up after it"""
+    namespace = Namespace(allocator)
+    yield namespace
+    namespace.cleanup(client)
+
+
+@pytest.fixture(name="seeded", scope="session")
+def seeded_data(client, allocator):
+    """Known pets, orders and users, deleted in one batched pass at the end of the session"""
+    data = seed(client, allocator, SEED_DATASET)
+    yield data
+    teardown(client, data)
+
+
+@pytest.fixture(name="base_url", scope="session")
+def petstore_base_url(request):
+    """Base URL of the Petstore API under test, behind the fault injecting proxy if asked for"""
+    base_url = request.config.getoption("--petstore-url")
+    with contextlib.ExitStack() as stack:
+        if base_url == "local":
+            base_url = stack.enter_context(PetstoreServer()).url
+        if request.config.getoption("--faults"):
+            proxy = stack.enter_context(FaultProxy(base_url, load_faults(request.config.getoption("--faults"))))
+            request.config.stash[FAULTS_KEY] = proxy.stats
+            base_url = proxy.url
+        yield base_url
+
+
+@pytest.fixture(name="client", scope="session")
+def petstore_client(request, base_url):
+    """Pooled client shared by every test in the session"""
+    capture = None
+    if request.config.getoption("--record"):
+        path = request.config.getoption("--record")
+        if is_worker(request.config):
+            path = f"{path}.{request.config.workerinput['workerid']}"
+        capture = TrafficCapture(path)
+    with PetstoreClient(base_url, capture=capture) as client:
+        yield client
+        request.config.stash[STATS_KEY] = client.connection_stats()
+
+
+@pytest.fixture(name="cached_client")
+def caching_client(request, client):
+    """Shared client with a per-test cache for repeated setup and verification GETs
+
+    Mark a test with @pytest.mark.measures("/pet/{petId}") to always send its
+    reads of that endpoint to the server.
+    """
+    marker = request.node.get_closest_marker("measures")
+    cached = CachingClient(client, ResponseCache(), marker.args if marker else ())
+    yield cached
+    cache.totals.update(cached.cache.stats)
+
+
+def pytest_sessionstart(session):
+    """Start the resource sampler, and the live metrics endpoint and terminal summary if asked for"""
+    config = session.config
+    started = []
+    config.stash[LIVE_KEY] = started
+    live.enabled = config.getoption("--metrics-port") is not None or bool(config.getoption("--live-every"))
+    if not is_worker(config) and config.getoption("numprocesses", None):
+        # The xdist controller sends no requests; each worker serves and samples its own
+        return
+    resources.profile = config.getoption("--profile-client")
+    started.append(resources.start())
+    worker = config.workerinput["workerid"] if is_worker(config) else None
+    if config.getoption("--metrics-port") is not None:
+        port = config.getoption("--metrics-port") + (int(worker[2:]) if worker else 0)
+        started.append(MetricsServer(live, port=port).start())
+    if config.getoption("--live-every"):
+        capture = config.pluginmanager.getplugin("capturemanager")
+        terminal = config.pluginmanager.getplugin("terminalreporter")
+
+        def write(line):
+            if worker:
+                # xdist passes a worker's stderr through to the controller's terminal
+                sys.__stderr__.write(f"\n[{worker}] {line}\n")
+                sys.__stderr__.flush()
+                return
+            # Past pytest's capturing of the running test's output, as its live logging does
+            with capture.global_and_fixture_disabled():
+                terminal.write_line("")
+                terminal.write_line(line)
+
+        started.append(LiveReporter(live, config.getoption("--live-every"), write).start())
+
+
+def pytest_sessionfinish(session):
+    """Save or gate on the latency baseline once every test has run"""
+    config = session.config
+    for running in config.stash.get(LIVE_KEY, []):
+        running.stop()
+    histograms = metrics.recorder.snapshot()
+    if is_worker(config):
+        # The controller merges these and runs the baseline checks for the whole run
+        config.workeroutput["petstore_latency"] = metrics.dump_histograms(histograms)
+        config.workeroutput["petstore_statuses"] = metrics.dump_statuses(metrics.recorder.statuses())
+        config.workeroutput["petstore_connections"] = config.stash.get(STATS_KEY, None)
+        config.workeroutput["petstore_throttle"] = throttle_log.to_dict()
+        config.workeroutput["petstore_schema"] = schema_log.to_dict()
+        config.workeroutput["petstore_phases"] = phase_log.to_dict()
+        config.workeroutput["petstore_cache"] = dict(cache.totals)
+        config.workeroutput["petstore_resources"] = resources.to_dict()
+        config.workeroutput["petstore_live"] = live.to_dict()
+        config.workeroutput["petstore_loads"] = load_log.to_dict()
+        if FAULTS_KEY in config.stash:
+            config.workeroutput["petstore_faults"] = dict(config.stash[FAULTS_KEY])
+        return
+    if config.getoption("--save-baseline"):
+        save_baseline(config.getoption("--save-baseline"), histograms)
+    if config.getoption("--baseline"):
+        regressions = find_regressions(load_baseline(config.getoption("--baseline")), histograms)
+        config.stash[REGRESSIONS_KEY] = regressions
+        if regressions:
+            session.exitstatus = pytest.ExitCode.TESTS_FAILED
+    if config.getoption("--report"):
+        config.stash[REPORT_KEY] = save_report(config, histograms)
+
+
+def save_report(config, histograms):
+    """Append this run's report to the store and return its run id"""
+    stats = config.pluginmanager.getplugin("terminalreporter").stats
+    outcome = {kind: len(stats.get(kind, [])) for kind in ("passed", "failed", "skipped", "error")}
+    env = environment(
+        config.getoption("--petstore-url"), config.getoption("numprocesses", None), config.invocation_params.args
+    )
+    report = build_report(
+        histograms, metrics.recorder.statuses(), config.stash[STARTED_KEY], time.time(), env, load_log.runs, outcome,
+        config.getoption("--report-label"),
+    )
+    with ReportStore(config.getoption("--report")) as store:
+        return store.add(report)
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    """Report how well the shared client reused its connections"""
+    stats = config.stash.get(STATS_KEY, None)
+    if stats is None:
+        return
+    terminalreporter.write_sep("-", "petstore client")
+    terminalreporter.write_line(
+        f"{stats['requests']} requests over {stats['connections']} connections "
+        f"({stats['reused']} reused)"
+    )
+    if cache.totals:
+        terminalreporter.write_line(
+            f"response cache: {cache.totals['hits']} hits, {cache.totals['misses']} misses, "
+            f"{cache.totals['invalidated']} invalidated"
+        )
+
+    faults = config.stash.get(FAULTS_KEY, None)
+    if faults:
+        terminalreporter.write_line(
+            "through fault proxy: " + ", ".join(f"{kind} {count}" for kind, count in sorted(faults.items()))
+        )
+
+    lines = metrics.recorder.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore latency")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = phase_log.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore request phases")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = resources.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore client resources")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = throttle_log.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore retries and throttling")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = schema_log.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore schema violations")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = parse_log.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore response parsing")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    lines = load_log.report_lines()
+    if lines:
+        terminalreporter.write_sep("-", "petstore load runs")
+        for line in lines:
+            terminalreporter.write_line(line)
+
+    run_id = config.stash.get(REPORT_KEY, None)
+    if run_id is not None:
+        terminalreporter.write_sep("-", "petstore report")
+        path = config.getoption("--report")
+        terminalreporter.write_line(
+            f"saved as run {run_id} in {path}; see python -m petstore.history --db {path} trend / compare -2 -1"
+        )
+
+    regressions = config.stash.get(REGRESSIONS_KEY, None)
+    if regressions is not None:
+        terminalreporter.write_sep("-", "latency regressions against baseline")
+        for line in regressions or ["none"]:
+            terminalreporter.write_line(line)
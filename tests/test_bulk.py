@@ -0,0 +1,87 @@
+"""Test cases to test the bulk user import batch size sweep"""
+import json
+import pytest
+from petstore.bulk import JSON, BulkSweep, ChunkedBody, UserSource
+from petstore.client import PetstoreClient
+from petstore.proxy import Fault, FaultProxy
+from petstore.seeding import BULK_USER_ENDPOINTS
+from petstore.throttle import RetryPolicy, TokenBucket
+
+@pytest.fixture(name="user_data")
+def sample_user_data(ids):
+    """Sample user data"""
+    return {
+        "id": ids.user_id(),
+        "username": ids.username("template"),
+        "firstName": "First",
+        "lastName": "Last",
+        "email": "first_last@test.com",
+        "password": "root",
+        "phone": "987654321",
+        "userStatus": 0
+    }
+
+def test_body_is_streamed(client, ids, user_data):
+    """Test a bulk import is sent as a chunked body encoded a piece at a time"""
+    users = [{**user_data, "id": ids.user_id(), "username": ids.username(f"chunk{index}")} for index in range(50)]
+    body = ChunkedBody(users, chunk_size=1024)
+    chunks = list(body)
+    assert len(chunks) > 2 and json.loads(b"".join(chunks)) == users
+    assert list(body) == chunks and body.bytes == len(b"".join(chunks))
+    with pytest.raises(TypeError):
+        ChunkedBody(iter(users))
+
+    response = client.post("/user/createWithList", data=body, headers=JSON)
+    assert response.status_code == 200
+    assert response.request.headers["Transfer-Encoding"] == "chunked"
+    assert client.get(f"/user/{users[-1]["username"]}").json()["username"] == users[-1]["username"]
+
+def test_retried_batch_is_sent_whole(base_url, allocator):
+    """Test a batch retried after a 429 is sent again in full rather than as an empty array"""
+    source = UserSource(allocator, 100)
+    fault = Fault("/user/createWithList", throttle_rate=0.5, retry_after=0)
+    with FaultProxy(base_url, [fault], seed=1) as proxy:
+        client = PetstoreClient.isolated(
+            proxy.url, retry=RetryPolicy(retries=20, backoff=0.001),
+            limiter=TokenBucket(min_rate=500),
+        )
+        with client:
+            for start in range(0, 100, 10):
+                body = ChunkedBody(source.batch(range(start, start + 10), "retried"))
+                assert client.post("/user/createWithList", data=body, headers=JSON).status_code == 200
+            stored = [client.get(f"/user/{source.username(index)}").status_code for index in range(100)]
+            for index in range(100):
+                client.delete(f"/user/{source.username(index)}")
+    assert proxy.stats["throttled"] > 0
+    assert stored == [200] * 100
+
+def test_batch_sweep(base_url, allocator):
+    """Test both bulk endpoints store every user at every batch size, and large batches beat single calls"""
+    with PetstoreClient.isolated(base_url, retry=RetryPolicy(retries=0)) as client:
+        sweep = BulkSweep(client, allocator, users=100, seed=1)
+        try:
+            sweep.run(sizes=(1, 10, 100), concurrencies=(1, 4))
+        finally:
+            sweep.cleanup()
+    lines = sweep.report_lines()
+    assert lines[-3:-1] == [f"{endpoint} has no errors up to batch size 100" for endpoint in BULK_USER_ENDPOINTS]
+    assert lines[-1].startswith("best: /user/createWith")
+    assert len(sweep.trials) == 12 and not sweep.thresholds
+    assert all(trial.users == 100 and trial.checked and not trial.missing for trial in sweep.trials), "\n".join(lines)
+    for trial in sweep.trials:
+        if trial.batch_size == 100:
+            assert trial.users_per_second > sweep.singles[trial.concurrency].users_per_second
+
+def test_error_threshold(base_url, allocator):
+    """Test the sweep reports the smallest batch size an endpoint fails at and skips larger ones"""
+    with FaultProxy(base_url, [Fault("/user/createWithArray", error_rate=1, error_statuses=[413])]) as proxy:
+        with PetstoreClient.isolated(proxy.url, retry=RetryPolicy(retries=0)) as client:
+            sweep = BulkSweep(client, allocator, users=20, spot_checks=5)
+            try:
+                sweep.run(sizes=(5, 20), concurrencies=(2,))
+            finally:
+                sweep.cleanup()
+    failing = sweep.thresholds["/user/createWithArray"]
+    assert (failing.batch_size, failing.statuses) == (5, {413: 4})
+    assert [trial.batch_size for trial in sweep.trials if trial.endpoint == "/user/createWithArray"] == [5]
+    assert "/user/createWithArray fails from batch size 5 at concurrency 2: 413 x4" in sweep.report_lines()
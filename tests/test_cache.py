@@ -0,0 +1,82 @@
+"""Test cases to test the opt-in response cache"""
+import time
+import pytest
+from petstore import metrics
+from petstore.cache import CachingClient, ResponseCache
+
+PET = {"name": "Cached", "photoUrls": [], "status": "available"}
+
+def sent(method, template):
+    """Requests the shared client has actually sent to one endpoint"""
+    histogram = metrics.recorder.snapshot().get((method, template))
+    return histogram.count if histogram else 0
+
+def test_repeated_reads_hit_the_cache(cached_client, ids):
+    """Test repeated lookups of an unchanged pet make one round trip"""
+    pet = {**PET, "id": ids.pet_id()}
+    assert cached_client.post("/pet", json=pet).status_code == 200
+
+    before = sent("GET", "/pet/{petId}")
+    for _ in range(5):
+        assert cached_client.get(f"/pet/{pet["id"]}").json()["name"] == pet["name"]
+    assert sent("GET", "/pet/{petId}") - before == 1
+    assert cached_client.cache.stats["hits"] == 4
+
+def test_writes_invalidate(cached_client, ids):
+    """Test a write to a pet is seen by the next read, and also refreshes the inventory"""
+    pet = {**PET, "id": ids.pet_id(), "status": ids.name("cached")}
+    assert cached_client.post("/pet", json=pet).status_code == 200
+    assert cached_client.get(f"/pet/{pet["id"]}").json()["name"] == pet["name"]
+    assert cached_client.get("/store/inventory").json()[pet["status"]] == 1
+
+    assert cached_client.post(f"/pet/{pet["id"]}", data={"name": "Renamed"}).status_code == 200
+    assert cached_client.get(f"/pet/{pet["id"]}").json()["name"] == "Renamed"
+    assert cached_client.delete(f"/pet/{pet["id"]}").status_code == 200
+    assert cached_client.get(f"/pet/{pet["id"]}").status_code == 404
+    assert pet["status"] not in cached_client.get("/store/inventory").json()
+
+@pytest.mark.measures("/pet/{petId}")
+def test_measured_endpoint_is_never_cached(cached_client, ids):
+    """Test reads of the endpoint a test measures always reach the server"""
+    pet = {**PET, "id": ids.pet_id()}
+    assert cached_client.post("/pet", json=pet).status_code == 200
+    before = sent("GET", "/pet/{petId}")
+    for _ in range(3):
+        cached_client.get(f"/pet/{pet["id"]}")
+    assert sent("GET", "/pet/{petId}") - before == 3
+    assert not cached_client.cache.stats["hits"]
+
+def test_lru_and_ttl():
+    """Test the least recently used entry is evicted first and entries expire"""
+    cache = ResponseCache(max_entries=2, ttl=0.05)
+    cache.put(("/a", None), "a")
+    cache.put(("/b", None), "b")
+    assert cache.get(("/a", None)) == "a"
+    cache.put(("/c", None), "c")
+    assert cache.get(("/b", None)) is None
+    assert cache.get(("/a", None)) == "a"
+    time.sleep(0.06)
+    assert cache.get(("/a", None)) is None
+    assert cache.stats["evicted"] == 1 and cache.stats["expired"] == 1
+
+def test_invalidation_scope():
+    """Test a write only drops the collections it can change, and a racing read isn't cached"""
+    cache = ResponseCache()
+    for path in ("/pet/1", "/store/inventory", "/user/alice"):
+        cache.put((path, None), path)
+    cache.invalidate("/user/bob")
+    assert len(cache) == 2
+    cache.invalidate("/pet")
+    assert len(cache) == 0
+
+    generation = cache.generation
+    cache.invalidate("/store/order")
+    cache.put(("/store/inventory", None), "stale", generation)
+    assert len(cache) == 0
+
+def test_streamed_and_unusual_reads_bypass():
+    """Test streamed reads and reads with extra arguments always go to the server"""
+    client = CachingClient(None)
+    assert client.cacheable("/pet/1", {"params": {"a": 1}})
+    assert not client.cacheable("/pet/1", {"stream": True})
+    assert not client.cacheable("/pet/1", {"headers": {"Accept": "application/xml"}})
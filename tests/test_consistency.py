@@ -0,0 +1,88 @@
+"""Test cases to test the linearizability and lost write checker"""
+import random
+import time
+from petstore.consistency import History, check
+
+def history_of(*operations):
+    """History of one register from (kind, value, invoked, completed) tuples"""
+    history = History()
+    for process, (kind, value, invoked, completed, *ok) in enumerate(operations):
+        history.add(process, kind, "name", value, invoked, completed, ok[0] if ok else True)
+    return history
+
+def kinds(history):
+    return sorted(anomaly.kind for anomaly in check(history))
+
+def test_sequential_history():
+    """Test reads that always see the latest completed write pass"""
+    assert not kinds(history_of(("write", 1, 0, 1), ("read", 1, 2, 3), ("write", 2, 4, 5), ("read", 2, 6, 7)))
+
+def test_concurrent_writes_in_either_order():
+    """Test overlapping writes may take effect in either order"""
+    assert not kinds(history_of(("write", 1, 0, 10), ("write", 2, 1, 9), ("read", 2, 2, 3), ("read", 1, 4, 5)))
+    assert not kinds(history_of(("write", 1, 0, 10), ("write", 2, 1, 9), ("read", 1, 2, 3), ("read", 2, 4, 5)))
+
+def test_lost_write():
+    """Test an acknowledged write that was overwritten by an older value is reported as lost"""
+    assert kinds(history_of(("write", 1, 0, 1), ("write", 2, 2, 3), ("read", 1, 4, 5))) == ["lost write"]
+
+def test_stale_read():
+    """Test a value read while an earlier write must still have been current is reported"""
+    history = history_of(("write", 1, 0, 1), ("write", 2, 2, 8), ("read", 2, 3, 4), ("read", 1, 9, 10))
+    assert kinds(history) == ["stale read"]
+
+def test_reads_out_of_order():
+    """Test two values each read after the other was definitely current are reported"""
+    history = history_of(
+        ("write", 1, 0, 1), ("write", 2, 2, 3), ("read", 2, 4, 5), ("read", 1, 6, 7), ("read", 2, 8, 9)
+    )
+    assert "order" in kinds(history)
+
+def test_impossible_reads():
+    """Test reads of values nobody wrote, not yet written, or rejected are reported"""
+    assert kinds(history_of(("write", 1, 0, 1), ("read", 3, 2, 3))) == ["unknown value"]
+    assert "future read" in kinds(history_of(("read", 1, 0, 1), ("write", 1, 2, 3)))
+    assert "failed write visible" in kinds(history_of(("write", 1, 0, 1, False), ("read", 1, 2, 3)))
+
+def test_unacknowledged_writes():
+    """Test writes with an unknown outcome may or may not have happened"""
+    assert not kinds(history_of(("write", 1, 0, 1), ("write", 2, 2, 3, None), ("read", 1, 4, 5)))
+    assert not kinds(history_of(("write", 1, 0, 1), ("write", 2, 2, 3, None), ("read", 2, 9, 10)))
+
+def test_duplicate_creates():
+    """Test more than one acknowledged create of the same resource is reported"""
+    history = history_of(("create", 1, 0, 2), ("create", 2, 0, 2), ("create", 3, 0, 2, False), ("read", 2, 3, 4))
+    assert kinds(history) == ["duplicate create"]
+
+def random_history(size, rng):
+    """Linearizable history: each operation takes effect at a random instant inside its own span"""
+    history = History()
+    current = 0
+    point = 0.0
+    for index in range(size):
+        point += rng.expovariate(1000)
+        invoked, completed = point - rng.uniform(0, 0.01), point + rng.uniform(0, 0.01)
+        if rng.random() < 0.5:
+            current = index + 1
+            history.add(index % 20, "write", "name", current, invoked, completed)
+        else:
+            history.add(index % 20, "read", "name", current, invoked, completed)
+    return history
+
+def test_large_histories():
+    """Test histories of tens of thousands of operations are checked in well under a second"""
+    rng = random.Random(7)
+    history = random_history(20000, rng)
+    history.add(0, "write", "name", 0, -2.0, -1.0)
+    # CPU time, so other workers busy on the same cores don't count against the check
+    started = time.process_time()
+    anomalies = check(history)
+    elapsed = time.process_time() - started
+    assert not anomalies
+    assert elapsed < 1.0, f"{len(history)} operations checked in {elapsed * 1000:.0f}ms"
+
+    # A late write that a later read doesn't see is lost
+    last = max(operation.value for operation in history.operations if operation.kind == "write")
+    history.add(0, "write", "name", "lost", 100.0, 101.0)
+    history.add(0, "read", "name", last, 102.0, 103.0)
+    assert kinds(history) == ["lost write"]
@@ -0,0 +1,41 @@
+"""Test cases to test load generation coordinated across agent processes"""
+import pytest
+from petstore import metrics
+from petstore.distributed import run_distributed
+from petstore.load import Call
+from petstore.profiles import Constant
+
+class Unknown(Constant):
+    """Profile no agent knows how to rebuild"""
+
+    name = "unknown"
+
+def test_distributed_load(base_url, seeded):
+    """Test agents share the schedule, stream progress while running and merge into one report"""
+    mix = [
+        Call("GET", "/store/inventory"),
+        Call("GET", f"/store/order/{seeded.orders[0]["id"]}", weight=2),
+    ]
+    updates = []
+    before = sum(histogram.count for histogram in metrics.recorder.snapshot().values())
+    result = run_distributed(base_url, mix, agents=3, rate=150, duration=2, concurrency=30, seed=1, on_progress=updates.append)
+
+    assert result.requests == 300
+    assert not result.errors
+    assert result.statuses[200] == 300
+    assert [interval.sent for interval in result.intervals[:2]] == [150, 150]
+    assert sum(histogram.count for histogram in result.endpoints.values()) == 300
+    assert sum(histogram.count for histogram in metrics.recorder.snapshot().values()) - before == 300
+    # Every agent reported at least once while the run was going
+    assert updates and updates[-1]["agents"] == 3
+    assert 0 < updates[-1]["sent"] <= 300
+
+def test_agent_failure_is_reported(base_url):
+    """Test an agent that can't run its share fails the whole run with its reason"""
+    with pytest.raises(RuntimeError, match="unknown"):
+        run_distributed(base_url, [Call("GET", "/store/inventory")], agents=1, profile=Unknown(10, 1))
+
+def test_checks_stay_local(base_url):
+    """Test calls with a per-item check are refused, since functions can't be sent to another machine"""
+    with pytest.raises(ValueError):
+        run_distributed(base_url, [Call("GET", "/pet/findByStatus", check=bool)], agents=1, rate=10, duration=1)
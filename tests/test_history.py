@@ -0,0 +1,108 @@
+"""Test cases to test run reports and the report store"""
+import random
+import sqlite3
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+from petstore.history import LoadLog, ReportStore, build_report, compare_lines, environment, trend_lines
+from petstore.live import LiveMetrics
+from petstore.load import Call, run_load
+from petstore.metrics import Histogram, Recorder
+from petstore.timing import PhaseLog
+
+INVENTORY = ("GET", "/store/inventory")
+LOGIN = ("GET", "/user/login")
+
+def report(seed, slowdown=1.0, started=1000.0):
+    """Report of a 10 second run with lognormal latencies, /user/login slowed down by slowdown"""
+    rng = random.Random(seed)
+    histograms = {INVENTORY: Histogram(), LOGIN: Histogram()}
+    for _ in range(300):
+        histograms[INVENTORY].record(rng.lognormvariate(-4, 0.3))
+        histograms[LOGIN].record(rng.lognormvariate(-4, 0.3) * slowdown)
+    statuses = {INVENTORY: {200: 298, 503: 1, "ConnectionError": 1}, LOGIN: {200: 290, 400: 10}}
+    return build_report(histograms, statuses, started, started + 10, environment("local"), label=f"run {seed}")
+
+def test_build_report():
+    """Test a report has per-endpoint rates, percentiles and an error breakdown"""
+    data = report(1)
+    inventory, login = data["endpoints"]
+    assert (inventory["method"], inventory["endpoint"]) == INVENTORY
+    assert inventory["count"] == 300 and inventory["rate"] == 30
+    assert 0 < inventory["p50"] < inventory["p99"] <= inventory["max"]
+    assert inventory["statuses"] == {"200": 298, "503": 1, "ConnectionError": 1}
+    assert (inventory["errors"], inventory["client_errors"]) == (2, 0)
+    assert (login["errors"], login["client_errors"]) == (0, 10)
+    assert data["load"]["requests"] == 600
+    assert data["environment"]["python"] and data["environment"]["base_url"] == "local"
+
+def test_store_trend_and_compare(tmp_path):
+    """Test stored runs show a slow drift in one endpoint's trend and comparison"""
+    path = tmp_path / "reports.db"
+    with ReportStore(path) as store:
+        for run in range(1, 6):
+            assert store.add(report(run, slowdown=1 + run / 10, started=1000.0 * run)) == run
+    with ReportStore(path) as store:
+        assert [run["id"] for run in store.runs(last=3)] == [3, 4, 5]
+        assert store.resolve(-1) == 5 and store.resolve(2) == 2
+        trend = store.trend(*LOGIN)
+        assert [row["run_id"] for row in trend] == [1, 2, 3, 4, 5]
+        assert trend[-1]["p50"] > trend[0]["p50"]
+
+        lines = trend_lines(store, ["/user/login"], metric="p50")
+        assert len(lines) == 2 and lines[1].startswith("GET /user/login") and "(5 runs)" in lines[1]
+
+        lines = compare_lines(store.report(1), store.report(-1))
+        assert "significant slowdowns: " in lines[-2]
+        assert lines[-1].startswith("  GET /user/login")
+
+        with pytest.raises(LookupError):
+            store.report(-10)
+
+def test_store_is_append_only(tmp_path):
+    """Test stored runs can't be changed or removed"""
+    with ReportStore(tmp_path / "reports.db") as store:
+        store.add(report(1))
+        for statement in ("UPDATE runs SET label = 'x'", "DELETE FROM runs", "DELETE FROM endpoints"):
+            with pytest.raises(sqlite3.DatabaseError, match="append-only"):
+                store.db.execute(statement)
+
+def test_load_runs_are_logged(base_url):
+    """Test a load run is logged with its profile and the test that made it"""
+    log = LoadLog()
+    result = run_load(
+        base_url, [Call("GET", "/store/inventory")], rate=50, duration=0.5,
+        recorder=Recorder(), phases=PhaseLog(), live=LiveMetrics(enabled=False),
+    )
+    log.record(result)
+    run = log.runs[0]
+    assert run["test"] == "tests/test_history.py::test_load_runs_are_logged"
+    assert run["requests"] == 25 and run["params"]["rate"] == 50
+    header, line = log.report_lines()
+    assert header.split()[:2] == ["test", "requests"]
+    assert line.split()[:2] == ["tests/test_history.py::test_load_runs_are_logged", "25"]
+    assert line.endswith("  constant over 0.5s, peak 50/s")
+    merged = LoadLog()
+    merged.absorb(log.to_dict())
+    assert merged.runs == log.runs
+
+def test_session_report_counts_agree(request, tmp_path):
+    """Test a --report run counts the same calls it breaks down by status, leaving out clients with private recorders"""
+    path = tmp_path / "reports.db"
+    run = subprocess.run(
+        [
+            sys.executable, "-m", "pytest", "-q", "-p", "no:cacheprovider", "-p", "no:xdist",
+            f"--petstore-url={request.config.getoption('--petstore-url')}", f"--report={path}",
+            "tests/test_history.py::test_load_runs_are_logged", "tests/test_pet.py::test_flow",
+        ],
+        cwd=Path(__file__).parents[1], capture_output=True, text=True, timeout=120,
+    )
+    assert run.returncode == 0, run.stdout
+    with ReportStore(path) as store:
+        endpoints = store.report(-1)["endpoints"]
+    assert endpoints
+    for endpoint in endpoints:
+        assert endpoint["count"] == sum(endpoint["statuses"].values()), endpoint
+    # Only the load run, with its own recorder, read the inventory
+    assert INVENTORY not in {(endpoint["method"], endpoint["endpoint"]) for endpoint in endpoints}
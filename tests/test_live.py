@@ -0,0 +1,53 @@
+"""Test cases to test the live metrics endpoint and summary"""
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from petstore.client import PetstoreClient
+from petstore.live import LiveMetrics, LiveReporter, MetricsServer
+from petstore.load import Call, run_load
+
+def test_live_metrics_during_load(base_url):
+    """Test the endpoint shows counters, rates and rolling percentiles for a load run"""
+    live = LiveMetrics()
+    with MetricsServer(live) as server:
+        result = run_load(base_url, [Call("GET", "/store/inventory"), Call("GET", "/pet/0")], rate=100, duration=1, live=live)
+        text = requests.get(server.url, timeout=5).text
+        assert requests.get(server.url.replace("/metrics", "/other"), timeout=5).status_code == 404
+
+    assert live.in_flight == 0
+    assert 'petstore_requests_total{method="GET",endpoint="/store/inventory",status="200"}' in text
+    assert 'petstore_requests_total{method="GET",endpoint="/pet/{petId}",status="404"}' in text
+    assert 'petstore_latency_seconds{method="GET",endpoint="/store/inventory",quantile="0.99"}' in text
+    assert "petstore_in_flight 0" in text
+    snapshot = live.snapshot()
+    assert snapshot["requests"] == result.requests == 100
+    assert 0.3 < snapshot["error_rate"] < 0.7
+    assert snapshot["rps"] > 0
+
+def test_in_flight_and_errors(base_url):
+    """Test requests are counted in flight while waiting, and failed connections by error name"""
+    live = LiveMetrics()
+    with PetstoreClient(base_url, pool_size=10, live=live) as client:
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(lambda _: client.get("/store/inventory"), range(50)))
+    with PetstoreClient("http://127.0.0.1:9/v2", live=live, retry=None) as client:
+        client.retry.retries = 0
+        try:
+            client.get("/store/inventory")
+        except requests.ConnectionError:
+            pass
+
+    assert live.in_flight == 0
+    assert live.snapshot()["statuses"] == {"200": 50, "ConnectionError": 1}
+    lines = []
+    reporter = LiveReporter(live, every=0.05, write=lines.append)
+    with reporter:
+        reporter.stopped.wait(0.2)
+    assert lines and "req/s" in lines[0] and "ConnectionError: 1" in lines[0]
+
+def test_disabled_metrics_record_nothing(base_url):
+    """Test a disabled LiveMetrics, as the session's is unless asked for, ignores requests"""
+    live = LiveMetrics(enabled=False)
+    with PetstoreClient(base_url, live=live) as client:
+        client.get("/store/inventory")
+    assert live.in_flight == 0 and not live.statuses()
+    assert live.snapshot()["requests"] == 0
@@ -0,0 +1,45 @@
+"""Test cases to test the API under a mixed open-loop load"""
+from petstore import metrics
+from petstore.load import Call, run_load, run_load_processes
+from petstore.slo import assert_budgets
+
+def test_mixed_endpoint_load(base_url, seeded):
+    """Test a weighted mix of read endpoints at a fixed arrival rate"""
+    mix = [
+        Call("GET", "/pet/findByStatus", weight=2, params={"status": seeded.statuses["available"]}),
+        Call("GET", f"/store/order/{seeded.orders[0]["id"]}"),
+        Call("GET", f"/user/{seeded.users[0]["username"]}"),
+    ]
+    result = run_load(base_url, mix, rate=200, duration=2, concurrency=50, seed=1)
+
+    assert result.requests == 400
+    assert not result.errors
+    assert result.statuses[200] == result.requests
+    # Open-loop scheduling should keep the offered rate close to the target
+    assert result.elapsed < 3
+    assert_budgets(result)
+
+def is_pet(item):
+    """Streamed item check; module level so worker processes can unpickle it"""
+    return "name" in item
+
+def test_process_pool_load(base_url, seeded):
+    """Test a load run split across processes follows the schedule and merges into one result"""
+    mix = [
+        Call("GET", "/pet/findByStatus", params={"status": seeded.statuses["available"]}, check=is_pet),
+        Call("GET", f"/store/order/{seeded.orders[0]["id"]}"),
+    ]
+    before = sum(histogram.count for histogram in metrics.recorder.snapshot().values())
+    statuses_before = sum(counts.get(200, 0) for counts in metrics.recorder.statuses().values())
+    result = run_load_processes(base_url, mix, rate=200, duration=2, concurrency=40, processes=2, seed=1)
+
+    assert result.requests == 400
+    assert not result.errors
+    assert result.statuses[200] == 400
+    assert [interval.sent for interval in result.intervals[:2]] == [200, 200]
+    assert sum(histogram.count for histogram in result.endpoints.values()) == 400
+    assert result.latency.count == result.service_time.count == 400
+    assert result.violations == 0
+    # Histograms and status counts come back from the workers and join this process's report
+    assert sum(histogram.count for histogram in metrics.recorder.snapshot().values()) - before == 400
+    assert sum(counts.get(200, 0) for counts in metrics.recorder.statuses().values()) - statuses_before == 400
@@ -0,0 +1,65 @@
+"""Test cases to test latency recording"""
+import random
+from concurrent.futures import ThreadPoolExecutor
+from petstore import metrics
+from petstore.client import PetstoreClient
+from petstore.live import live
+from petstore.metrics import Histogram, Recorder, endpoint_template
+from petstore.schemas import schema_log
+from petstore.throttle import throttle_log
+from petstore.timing import phase_log
+
+def test_endpoint_template():
+    """Test concrete paths are grouped under their API path template"""
+    assert endpoint_template("/pet/12345") == "/pet/{petId}"
+    assert endpoint_template("/pet/678") == "/pet/{petId}"
+    assert endpoint_template("/pet/findByStatus") == "/pet/findByStatus"
+    assert endpoint_template("/store/order/2") == "/store/order/{orderId}"
+    assert endpoint_template("/user/login") == "/user/login"
+    assert endpoint_template("/user/Test1234") == "/user/{username}"
+
+def test_histogram_percentiles():
+    """Test percentiles stay within the histogram's precision"""
+    values = [random.uniform(0.0005, 2.0) for _ in range(20000)]
+    histogram = Histogram()
+    for value in values:
+        histogram.record(value)
+
+    values.sort()
+    for pct in (50, 90, 99, 99.9):
+        exact = values[round(len(values) * pct / 100) - 1]
+        assert abs(histogram.percentile(pct) - exact) / exact < 0.02
+    assert histogram.count == len(values)
+    assert histogram.max == int(values[-1] * 1000000)
+
+def test_recorder_merges_threads():
+    """Test every thread's recordings are merged into one histogram per endpoint"""
+    recorder = Recorder()
+
+    def record(_):
+        for pet_id in range(100):
+            recorder.record("GET", f"/pet/{pet_id}", 0.001)
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        list(executor.map(record, range(10)))
+
+    snapshot = recorder.snapshot()
+    assert list(snapshot) == [("GET", "/pet/{petId}")]
+    assert snapshot[("GET", "/pet/{petId}")].count == 1000
+
+def test_isolated_client_stays_out_of_session_reports(base_url):
+    """Test an isolated client's calls reach its own latency, status and phase logs and none of the session's"""
+    def session_state():
+        return (
+            metrics.dump_histograms(metrics.recorder.snapshot()), metrics.recorder.statuses(), phase_log.to_dict(),
+            schema_log.to_dict(), throttle_log.to_dict(), live.to_dict(),
+        )
+
+    before = session_state()
+    with PetstoreClient.isolated(base_url) as client:
+        client.get("/store/inventory")
+        client.get("/pet/0")
+    assert client.recorder.snapshot()[("GET", "/store/inventory")].count == 1
+    assert client.recorder.statuses()[("GET", "/pet/{petId}")] == {404: 1}
+    assert client.phases.to_dict()
+    assert session_state() == before
@@ -1,15 +1,16 @@
 """Test cases to test pet functionality"""
 import pytest
-import requests
 from concurrent.futures import ThreadPoolExecutor
-
-URL = "https://petstore.swagger.io/v2"
+from petstore.consistency import check, pet_workload
+from petstore.load import Call, run_load
+from petstore.slo import assert_budgets
+from petstore.streaming import stream_check
 
 @pytest.fixture(name="pet_data")
-def sample_pet_data():
+def sample_pet_data(ids):
     """Sample pet data"""
     return {
-        "id": 12345,
+        "id": ids.pet_id(),
         "category": {"id": 0, "name": "dog"},
         "name": "Oreo",
         "photoUrls":
@@ -19,95 +20,89 @@ def sample_pet_data():
     }
 
 # Basic Functionality
-def test_create_pet(pet_data):
+def test_create_pet(client, pet_data):
     """Test creating pet data from sample"""
-    response = requests.post(f"{URL}/pet", json=pet_data, timeout=10)
+    response = client.post("/pet", json=pet_data)
     assert response.status_code == 200
     assert response.json()["name"] == pet_data["name"]
-    print("Succesfully created pet data")
 
-def test_get_petid(pet_data):
+def test_get_petid(client, pet_data):
     """Test getting pet id"""
     pet_id = pet_data["id"]
 
     # Verify pet is created
-    requests.post(f"{URL}/pet", json=pet_data, timeout=10)
+    client.post("/pet", json=pet_data)
 
-    response = requests.get(f"{URL}/pet/{pet_id}", timeout=10)
+    response = client.get(f"/pet/{pet_id}")
 
     # Check pet id
     assert response.status_code == 200
     assert response.json()["id"] == pet_id
 
-def test_update_pet(pet_data):
+def test_update_pet(client, pet_data):
     """Test updating pet information"""
     # Create new pet
-    requests.post(f"{URL}/pet", json=pet_data, timeout=10)
+    client.post("/pet", json=pet_data)
     updated_data = pet_data.copy()
     updated_data["name"] = "Bolt"
 
     # Update pet with new pet
-    response = requests.put(f"{URL}/pet", json=updated_data, timeout=10)
+    response = client.put("/pet", json=updated_data)
     assert response.status_code == 200
     assert response.json()["name"] == "Bolt"
 
-def test_delete_pet(pet_data):
+def test_delete_pet(client, pet_data):
     """Test deleting pet"""
     pet_id = pet_data["id"]
     # Create pet
-    requests.post(f"{URL}/pet", json=pet_data, timeout=10)
+    client.post("/pet", json=pet_data)
 
-    response = requests.delete(f"{URL}/pet/{pet_id}", timeout=10)
+    response = client.delete(f"/pet/{pet_id}")
     assert response.status_code == 200
 
     # Verify pet doesn't exist
-    response = requests.get(f"{URL}/pet/{pet_id}", timeout=10)
+    response = client.get(f"/pet/{pet_id}")
     assert response.status_code == 404
 
-def test_find_pets_by_status(pet_data):
+def test_find_pets_by_status(client, ids, pet_data, seeded):
     """Test to find pets by different status's"""
     # First create pets with different statuses (available, pending, sold)
     pet_pending = pet_data.copy()
-    pet_pending["id"] = 71
+    pet_pending["id"] = ids.pet_id()
     pet_pending["status"] = "pending"
     
     pet_sold = pet_data.copy()
-    pet_sold["id"] = 72
+    pet_sold["id"] = ids.pet_id()
     pet_sold["status"] = "sold"
     
-    response = requests.post(f"{URL}/pet", json=pet_pending, timeout=10)
-    assert response.status_code == 200
-
-    response = requests.post(f"{URL}/pet", json=pet_sold, timeout=10)
+    response = client.post("/pet", json=pet_pending)
     assert response.status_code == 200
 
-    # Test for 'available' status
-    response = requests.get(f"{URL}/pet/findByStatus", params={"status": "available"})
+    response = client.post("/pet", json=pet_sold)
     assert response.status_code == 200
-    for pet in response.json():
-        assert pet["status"] == "available"
 
-    # Test for 'pending' status
-    response = requests.get(f"{URL}/pet/findByStatus", params={"status": "pending"})
-    assert response.status_code == 200
-    for pet in response.json():
-        assert pet["status"] == "pending"
+    # Test for 'available', 'pending' and 'sold' status, checking each pet as it streams in
+    for status in ("available", "pending", "sold"):
+        stats = stream_check(
+            client, "/pet/findByStatus", lambda pet: pet["status"] == status, params={"status": status}
+        )
+        assert stats.ok, f"Found pet with status {stats.violation['status']} looking for {status}"
 
-    # Test for 'sold' status
-    response = requests.get(f"{URL}/pet/findByStatus", params={"status": "sold"})
-    assert response.status_code == 200
-    for pet in response.json():
-        assert pet["status"] == "sold"
+    # Test the seeded statuses return exactly the seeded pets
+    for status, pets in seeded.pets.items():
+        response = client.get("/pet/findByStatus", params={"status": seeded.statuses[status]})
+        assert response.status_code == 200
+        assert sorted(pet["id"] for pet in response.json()) == sorted(pet["id"] for pet in pets)
 
     # Test for empty field
-    response = requests.get(f"{URL}/pet/findByStatus", params={"status": ""})
+    response = client.get("/pet/findByStatus", params={"status": ""})
     assert response.status_code == 200
 
     # Test for no status parameter
-    response = requests.get(f"{URL}/pet/findByStatus")
+    response = client.get("/pet/findByStatus")
     assert response.status_code == 200
 
-def test_special_characters(pet_data):
+def test_special_characters(client, pet_data):
     """Test creating a pet with special characters (symbols and unicode)"""
     special_names = [
         "!@#$%^",
@@ -120,138 +115,138 @@ def test_special_characters(pet_data):
     for name in special_names:
         new_pet = pet_data.copy()
         new_pet["name"] = name
-        response = requests.post(f"{URL}/pet", json=new_pet, timeout=10)
+        response = client.post("/pet", json=new_pet)
 
         assert response.status_code in {200, 201}
 
-def test_update_pet_form(pet_data):
+def test_update_pet_form(client, ids, pet_data):
     """Test updating a pet with form data"""
     
     # Create pet
     new_pet = pet_data.copy()
-    new_pet["id"] = 678
+    new_pet["id"] = ids.pet_id()
     
     new_data = {
         "name" : "NewName",
         "status": "sold"
     }
-    response = requests.post(f"{URL}/pet", json=new_pet)
+    response = client.post("/pet", json=new_pet)
     assert response.status_code == 200
     
     # Update pet with form data
-    response = requests.post(f"{URL}/pet/{new_pet["id"]}", data=new_data)
+    response = client.post(f"/pet/{new_pet["id"]}", data=new_data)
     assert response.status_code == 200
     
     # Verify pet new data
-    response = requests.get(f"{URL}/pet/{new_pet["id"]}", timeout=10)
+    response = client.get(f"/pet/{new_pet["id"]}")
     assert response.status_code == 200
     assert response.json()["name"] == new_data["name"]
     assert response.json()["status"] == new_data["status"]
 
-def test_flow():
+def test_flow(client, ids):
     """Test a start to finish creation, get, update, get and deletion of a pet"""
     
     # Create pet
     test_pet_data ={
-        "id": 54321,
+        "id": ids.pet_id(),
         "name": "Bolt",
         "category": {"id": 1, "name": "Dogs"},
         "status": "available"
     }
     
-    response = requests.post(f"{URL}/pet", json=test_pet_data)
+    response = client.post("/pet", json=test_pet_data)
     assert response.status_code == 200
     
     # Get pet details to confirm creation
-    response = requests.get(f"{URL}/pet/{test_pet_data['id']}", timeout=10)
+    response = client.get(f"/pet/{test_pet_data['id']}")
     assert response.json()["name"] == "Bolt"
     
     # Update pet details
     new_pet = test_pet_data.copy()
     new_pet["status"] = "sold"
     new_pet["name"] = "Bolt2"
-    response = requests.post(f"{URL}/pet", json=new_pet)
+    response = client.post("/pet", json=new_pet)
     assert response.status_code == 200
     
     # Get pet name and status to confirm update
-    response = requests.get(f"{URL}/pet/{test_pet_data['id']}", timeout=10)
+    response = client.get(f"/pet/{test_pet_data['id']}")
     assert response.json()["name"] == "Bolt2"
     assert response.json()["status"] == "sold"
     
     # Delete pet
-    response = requests.delete(f"{URL}/pet/{test_pet_data['id']}")
+    response = client.delete(f"/pet/{test_pet_data['id']}")
     assert response.status_code == 200
     
     # Confirm pet has been delete
-    response = requests.get(f"{URL}/pet/{test_pet_data['id']}", timeout=10)
+    response = client.get(f"/pet/{test_pet_data['id']}")
     assert response.status_code == 404
 
-def test_invalid_name(pet_data):
+def test_invalid_name(client, pet_data):
     """Test passing invalid name to API"""
     new_pet = pet_data.copy()
     new_pet.pop("name", None)
-    response = requests.post(f"{URL}/pet", json=pet_data, timeout=10)
+    response = client.post("/pet", json=pet_data)
     # Verify if not accepted
     assert response.status_code != 200
 
-def test_large_id(pet_data):
+def test_large_id(client, pet_data):
     """Test passing a large id"""
     new_pet = pet_data.copy()
 
     # id is in int64, maximum value for int64 is 2^(63-1)
     new_pet["id"] = 2**(63)
-    response = requests.post(f"{URL}/pet", json=new_pet, timeout=10)
+    response = client.post("/pet", json=new_pet)
     assert response.status_code == 500
 
-def test_incorrect_json():
+def test_incorrect_json(client):
     """Test creating a pet with incorrect JSON data"""
-    response = requests.post(f"{URL}/pet", data="{name: 'Buddy'}", timeout=10)
+    response = client.post("/pet", data="{name: 'Buddy'}")
     assert response.status_code == 415
 
-def test_null_pet():
+def test_null_pet(client):
     """Test attempting to get/delete a non existent pet"""
     
     # Try to get pet with id 99999999
-    response = requests.get(f"{URL}/pet/99999999")
+    response = client.get("/pet/99999999")
     assert response.status_code == 404
     
     # Try to delete pet
-    response = requests.delete(f"{URL}/pet/99999999")
+    response = client.delete("/pet/99999999")
     assert response.status_code == 404
 
-def test_negative_id():
+def test_negative_id(client):
     """Test passing in a negative pet id"""
     negative_id = -10
-    response = requests.get(f"{URL}/pet{negative_id}", timeout=10)
+    response = client.get(f"/pet{negative_id}")
     assert response.status_code == 404
 
-def test_zero_id():
+def test_zero_id(client):
     """Test passing in pet id of 0"""
     zero_id = 0
-    response = requests.get(f"{URL}/pet{zero_id}", timeout=10)
+    response = client.get(f"/pet{zero_id}")
     assert response.status_code == 404
 
-def test_missing_id(pet_data):
+def test_missing_id(client, pet_data):
     """Test creating a pet with no id"""
     new_pet = pet_data.copy()
     new_pet.pop("id", None)
     
-    response = requests.post(f"{URL}/pet", json=new_pet, timeout=10)
+    response = client.post("/pet", json=new_pet)
     
     assert response.status_code != 200
 
-def test_invalid_http_method():
+def test_invalid_http_method(client):
     """Test using an invalid HTTP method for an endpoint."""
-    response = requests.put(f"{URL}/pet/findByStatus")
+    response = client.put("/pet/findByStatus")
 
     # Expecting 405 Method Not Allowed
     assert response.status_code == 405
 
-def create_pet_concurrently(test_pet_data, num_requests=10):
+def create_pet_concurrently(client, test_pet_data, num_requests=10):
     """Function to create pets concurrently to check for race conditions or resource conflicts."""
     
     def create_pet():
-        response = requests.post(f"{URL}/pet", json=test_pet_data)
+        response = client.post("/pet", json=test_pet_data)
         assert response.status_code == 200
 
     with ThreadPoolExecutor(max_workers=num_requests) as executor:
@@ -259,27 +254,36 @@ def create_pet_concurrently(test_pet_data, num_requests=10):
         for future in futures:
             future.result()
 
-def test_concurrent_pet_creation():
+def test_concurrent_pet_creation(client, ids):
     """Test creating pets concurrently to check for race conditions or resource conflicts"""
     test_pet_data = {
-        "id": 1234567,
+        "id": ids.pet_id(),
         "name": "TestPet",
         "category": {"id": 1, "name": "Dogs"},
         "status": "available"
     }
 
-    create_pet_concurrently(test_pet_data, num_requests=20)
+    create_pet_concurrently(client, test_pet_data, num_requests=20)
 
-def test_high_volume_requests():
+def test_high_volume_requests(base_url):
     """Test handling of high volume requests to ensure API performance under load"""
-    num_requests = 100
-    
-    # Helper function to get pet data
-    def get_pet():
-        response = requests.get(f"{URL}/pet/findByStatus", params={"status": "available"})
-        assert response.status_code == 200
+    mix = [
+        Call(
+            "GET", "/pet/findByStatus", params={"status": "available"},
+            check=lambda pet: pet["status"] == "available",
+        )
+    ]
 
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(get_pet) for _ in range(num_requests)]
-        for future in futures:
-            future.result()
+    # 100 requests arriving at 100/s, whether or not earlier ones have returned
+    result = run_load(base_url, mix, rate=100, duration=1, concurrency=10)
+    assert result.requests == 100
+    assert result.statuses[200] == result.requests
+    assert result.violations == 0
+    assert_budgets(result)
+
+def test_concurrent_pet_updates(client, ids):
+    """Test interleaved PUT and form updates of one pet never lose a write or read a stale value"""
+    history = pet_workload(client, ids.pet_id(), workers=4, operations=250, seed=1)
+    anomalies = check(history)
+    assert len(history) > 1000
+    assert not anomalies, "\n".join(str(anomaly) for anomaly in anomalies[:10])
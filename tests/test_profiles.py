@@ -0,0 +1,80 @@
+"""Test cases to test the write endpoints under ramp, step, spike and soak load profiles"""
+import json
+import pytest
+from petstore.load import Call, run_load
+from petstore.profiles import Constant, Ramp, Share, Soak, Spike, Step, profile_from_dict
+
+@pytest.fixture(name="order_call")
+def order_call_data(ids):
+    """Order placement call, overwriting one order so the run leaves a single order behind"""
+    order = {"id": ids.order_id(), "petId": ids.pet_id(), "quantity": 1, "status": "placed", "complete": False}
+    return Call("POST", "/store/order", json=order)
+
+@pytest.fixture(name="user_call")
+def user_call_data(ids):
+    """User creation call for a single user"""
+    user = {"id": ids.user_id(), "username": ids.username("profile"), "password": "root"}
+    return Call("POST", "/user", json=user)
+
+def busy_intervals(result):
+    """The intervals that saw traffic; the run itself is listed in the load runs section of the summary"""
+    return [interval for interval in result.intervals if interval.sent]
+
+def test_profile_arrivals():
+    """Test each profile sends the number of requests its rate curve integrates to"""
+    assert len(list(Constant(50, 2).arrivals())) == 100
+    assert len(list(Ramp(0, 100, 2).arrivals())) == 100
+    assert len(list(Step([10, 20, 30], 1).arrivals())) == 60
+    assert len(list(Spike(10, 100, 3, spike_at=1, spike_duration=1).arrivals())) == 120
+    arrivals = list(Ramp(10, 100, 2).arrivals())
+    assert arrivals == sorted(arrivals)
+    shares = [list(Share(Ramp(10, 100, 2), index, 3).arrivals()) for index in range(3)]
+    assert sorted(sum(shares, [])) == arrivals
+    assert Share(Ramp(10, 100, 2), 0, 4).peak == Ramp(10, 100, 2).peak / 4
+
+def test_profile_round_trip():
+    """Test every profile rebuilds from its JSON form with the same schedule"""
+    for profile in [Constant(50, 2), Soak(5, 3), Ramp(0, 100, 2), Step([10, 20], 1), Spike(10, 100, 3, 1, 1)]:
+        rebuilt = profile_from_dict(json.loads(json.dumps(profile.to_dict())))
+        assert type(rebuilt) is type(profile)
+        assert list(rebuilt.arrivals()) == list(profile.arrivals())
+
+def test_order_ramp(base_url, order_call):
+    """Test placing orders while the rate ramps up linearly"""
+    result = run_load(base_url, [order_call], profile=Ramp(10, 150, 3), concurrency=100)
+    intervals = busy_intervals(result)
+
+    assert result.requests == 240
+    assert all(interval.error_rate == 0 for interval in intervals), "\n".join(result.interval_lines())
+    # The last second should carry far more traffic than the first
+    assert intervals[-1].sent > 2 * intervals[0].sent
+
+def test_pet_step(base_url, ids):
+    """Test creating a pet at stepped rates"""
+    pet = {"id": ids.pet_id(), "name": "Steppy", "status": "available"}
+    result = run_load(base_url, [Call("POST", "/pet", json=pet)], profile=Step([20, 60, 120], 1), concurrency=100)
+    intervals = busy_intervals(result)
+
+    assert result.requests == 200
+    assert [interval.sent for interval in intervals[:3]] == [20, 60, 120]
+    assert all(interval.error_rate == 0 for interval in intervals), "\n".join(result.interval_lines())
+
+def test_user_spike(base_url, user_call):
+    """Test creating users through a sudden spike in traffic"""
+    result = run_load(base_url, [user_call], profile=Spike(20, 200, 3, spike_at=1, spike_duration=1), concurrency=200)
+    intervals = busy_intervals(result)
+
+    assert result.requests == 240
+    assert intervals[1].sent == 200
+    assert all(interval.error_rate == 0 for interval in intervals), "\n".join(result.interval_lines())
+
+def test_order_soak(request, base_url, order_call):
+    """Test holding a constant order rate for minutes (enable with --soak=SECONDS)"""
+    seconds = request.config.getoption("--soak")
+    if not seconds:
+        pytest.skip("soak runs only with --soak=SECONDS")
+    result = run_load(base_url, [order_call], profile=Soak(50, seconds), concurrency=100, interval=10)
+    intervals = busy_intervals(result)
+
+    assert result.degradation() is None, "\n".join(result.interval_lines())
+    assert all(interval.error_rate == 0 for interval in intervals), "\n".join(result.interval_lines())
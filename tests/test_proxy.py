@@ -0,0 +1,124 @@
+"""Test cases to test the client and load engine through the fault injecting proxy"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import requests
+from petstore.client import PetstoreClient
+from petstore.live import LiveMetrics
+from petstore.load import Call, run_load
+from petstore.metrics import Recorder
+from petstore.proxy import Fault, FaultProxy
+from petstore.throttle import RetryPolicy, ThrottleLog, TokenBucket
+from petstore.timing import PhaseLog
+
+@pytest.fixture(name="proxy")
+def fault_proxy(base_url):
+    """Proxy in front of the API under test with no faults until a test adds some"""
+    with FaultProxy(base_url, seed=1) as proxy:
+        yield proxy
+
+def test_fault_matching():
+    """Test faults match endpoint globs below the API base, first match first"""
+    proxy = FaultProxy("http://127.0.0.1:1/v2", [
+        Fault("/store/order/*", methods=["delete"], error_rate=1),
+        Fault("/store/*", delay=0.1),
+        Fault.from_dict({"pattern": "/pet/findByStatus", "bandwidth": 1000}),
+    ])
+    assert proxy.url.endswith("/v2")
+    assert proxy.fault_for("DELETE", "/v2/store/order/5").error_rate == 1
+    assert proxy.fault_for("GET", "/v2/store/order/5").delay == 0.1
+    assert proxy.fault_for("GET", "/v2/pet/findByStatus?status=sold").bandwidth == 1000
+    assert proxy.fault_for("GET", "/v2/pet/5") is None
+
+def test_forwards_concurrent_traffic(proxy, ids):
+    """Test writes and reads relay unchanged through the proxy from many threads"""
+    with PetstoreClient.isolated(proxy.url) as client:
+        def round_trip(_):
+            pet = {"id": ids.pet_id(), "name": ids.name("relay"), "photoUrls": [], "status": "available"}
+            assert client.post("/pet", json=pet).status_code == 200
+            response = client.get(f"/pet/{pet['id']}")
+            return response.status_code, response.json()["name"] == pet["name"]
+
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            results = list(executor.map(round_trip, range(200)))
+    assert results == [(200, True)] * 200
+    assert proxy.stats == {"requests": 400}
+
+def test_proxy_keeps_up_with_load(proxy):
+    """Test an open-loop run through the proxy completes on schedule without errors"""
+    result = run_load(
+        proxy.url, [Call("GET", "/store/inventory")], rate=300, duration=1, concurrency=50,
+        recorder=Recorder(), phases=PhaseLog(), live=LiveMetrics(enabled=False),
+    )
+    assert result.requests == 300
+    assert not result.errors
+    assert result.elapsed < 2
+
+def test_injected_latency_shows_in_tail(proxy):
+    """Test a delay on one endpoint in ten requests reaches its p99 but not its median or other endpoints"""
+    proxy.faults = [Fault("/store/inventory", delay=0.2, delay_rate=0.1)]
+    recorder = Recorder()
+    with PetstoreClient.isolated(proxy.url, recorder=recorder) as client:
+        for _ in range(100):
+            client.get("/store/inventory")
+            client.get("/pet/0")
+    histograms = recorder.snapshot()
+    inventory = histograms[("GET", "/store/inventory")]
+    assert inventory.percentile(99) >= 0.2
+    assert inventory.percentile(50) < 0.1
+    assert histograms[("GET", "/pet/{petId}")].percentile(99) < 0.1
+    assert 0 < proxy.stats["delayed"] < 30
+
+def test_read_timeout(proxy):
+    """Test a stalled response times out at the client's read timeout instead of hanging"""
+    proxy.faults = [Fault("/store/inventory", delay=2)]
+    with PetstoreClient.isolated(proxy.url, timeout=(1, 0.2), retry=RetryPolicy(retries=0)) as client:
+        started = time.perf_counter()
+        with pytest.raises(requests.Timeout):
+            client.get("/store/inventory")
+    assert time.perf_counter() - started < 1
+
+def test_errors_are_retried(proxy):
+    """Test injected 503s and 429s on reads are retried to success and reported"""
+    proxy.faults = [
+        Fault("/store/inventory", error_rate=0.3, error_statuses=[503]),
+        Fault("/pet/*", throttle_rate=0.3, retry_after=0),
+    ]
+    log = ThrottleLog()
+    # Injected 429s come at random rather than at a rate limit, so the bucket is kept from slowing to a crawl
+    limiter = TokenBucket(min_rate=500)
+    retry = RetryPolicy(retries=10, backoff=0.001)
+    with PetstoreClient.isolated(proxy.url, throttle=log, limiter=limiter, retry=retry) as client:
+        statuses = [client.get(path).status_code for path in ["/store/inventory", "/pet/0"] * 50]
+    assert statuses == [200, 404] * 50
+    assert proxy.stats["errors"] and proxy.stats["throttled"]
+    assert sum(log.retries.values()) == proxy.stats["errors"] + proxy.stats["throttled"]
+    assert log.gave_up == 0
+
+def test_resets_and_truncated_bodies(proxy, ids):
+    """Test reset connections and bodies cut short surface as connection errors"""
+    proxy.faults = [
+        Fault("/pet", methods=["POST"], reset_rate=1),
+        Fault("/store/inventory", truncate_rate=1),
+    ]
+    pet = {"id": ids.pet_id(), "name": ids.name("reset"), "photoUrls": []}
+    with PetstoreClient.isolated(proxy.url, retry=RetryPolicy(retries=0)) as client:
+        with pytest.raises(requests.ConnectionError):
+            client.post("/pet", json=pet)
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            client.get("/store/inventory")
+        # Neither fault broke the pool for the requests after them
+        assert client.get("/pet/0").status_code == 404
+    assert proxy.stats["reset"] == 1 and proxy.stats["truncated"] == 1
+
+def test_bandwidth_cap(proxy, ids):
+    """Test a capped response body takes its size over the bandwidth to arrive"""
+    pet = {"id": ids.pet_id(), "name": "x" * 50_000, "photoUrls": []}
+    proxy.faults = [Fault("/pet/*", methods=["GET"], bandwidth=200_000)]
+    with PetstoreClient.isolated(proxy.url) as client:
+        client.post("/pet", json=pet)
+        started = time.perf_counter()
+        response = client.get(f"/pet/{pet['id']}")
+        elapsed = time.perf_counter() - started
+    assert response.json()["name"] == pet["name"]
+    assert elapsed >= len(response.content) / 200_000 * 0.9
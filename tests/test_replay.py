@@ -0,0 +1,57 @@
+"""Test cases to test recording and replaying API traffic"""
+import json
+import pytest
+from petstore.bulk import JSON, ChunkedBody
+from petstore.client import PetstoreClient
+from petstore.replay import TrafficCapture, iter_records, replay
+
+@pytest.fixture(name="capture_file")
+def recorded_traffic(tmp_path, base_url, ids):
+    """Record a short pet, order and user session to a capture file"""
+    path = tmp_path / "capture.jsonl"
+    pet = {"id": ids.pet_id(), "name": "Replay", "status": "available"}
+    user = {"id": ids.user_id(), "username": ids.username("replay"), "password": "root"}
+
+    with PetstoreClient(base_url, capture=TrafficCapture(path)) as client:
+        assert client.post("/pet", json=pet).status_code == 200
+        assert client.post(f"/pet/{pet["id"]}", data={"name": "Replayed"}).status_code == 200
+        assert client.post("/store/order", data="{id: 1}").status_code == 415
+        assert client.post("/user", json=user).status_code == 200
+        for _ in range(20):
+            assert client.get(f"/pet/{pet["id"]}").status_code == 200
+            assert client.get("/user/login", params={"username": user["username"], "password": "root"}).status_code == 200
+    return path
+
+def test_capture_format(capture_file):
+    """Test every request is written as one JSON line with its response status and timing"""
+    records = list(iter_records(capture_file))
+    assert len(records) == 44
+    assert records[0]["method"] == "POST" and records[0]["json"]["name"] == "Replay"
+    assert records[1]["form"] == {"name": "Replayed"}
+    assert records[2]["data"] == "{id: 1}"
+    assert records[5]["params"]["password"] == "root"
+    assert all(record["latency"] > 0 for record in records)
+    assert [record["ts"] for record in records] == sorted(record["ts"] for record in records)
+    json.dumps(records)
+
+@pytest.mark.parametrize("speed", [4.0, None])
+def test_replay(base_url, capture_file, speed):
+    """Test replaying a capture reproduces the recorded statuses, at a speed multiplier or flat out"""
+    result = replay(base_url, capture_file, speed=speed, concurrency=8)
+
+    assert result.summary().startswith("replayed 44 requests")
+    assert result.requests == 44
+    assert not result.errors
+    assert not result.mismatches
+
+def test_capture_survives_odd_bodies(tmp_path, base_url, ids):
+    """Test a streamed body or unencodable params are noted without stopping the capture"""
+    path = tmp_path / "capture.jsonl"
+    with PetstoreClient(base_url, capture=TrafficCapture(path)) as client:
+        client.post("/user/createWithList", data=ChunkedBody([]), headers=JSON)
+        client.get("/pet/findByStatus", params={"status": b"\xff"})
+        client.get("/store/inventory")
+    records = list(iter_records(path))
+    assert records[0]["streamed"] == "ChunkedBody" and "data" not in records[0]
+    assert "unencodable" in records[1] and "params" not in records[1]
+    assert records[2]["path"] == "/store/inventory"
@@ -0,0 +1,74 @@
+"""Test cases to test sampling of the test process's own resource use"""
+import asyncio
+import time
+from petstore.resources import THRESHOLDS, ResourceSampler
+
+def spin(seconds):
+    """Keep one core busy in Python code"""
+    deadline = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+def test_busy_client_is_flagged():
+    """Test a run that keeps the client's CPU busy is client-bound, and an idle one isn't"""
+    with ResourceSampler(interval=0.02) as sampler:
+        sampler.begin("busy")
+        spin(0.15)
+        busy = sampler.end()
+        sampler.begin("idle")
+        time.sleep(0.3)
+        idle = sampler.end()
+    # Other xdist workers may share the core, so the bar is lowered well below a whole one
+    thresholds = {**THRESHOLDS, "cpu": 0.05}
+    assert busy.flags(thresholds, sampler.limit)[0].startswith("cpu")
+    assert idle.flags(thresholds, sampler.limit) == []
+    assert idle.rss > 0 and idle.threads >= 2
+    assert [usage.name for usage in sampler.runs] == ["busy", "idle"]
+    sampler.thresholds = thresholds
+    assert "CLIENT-BOUND: cpu" in "\n".join(sampler.report_lines())
+
+def test_event_loop_lag():
+    """Test a loop blocked by synchronous work is reported late to wake"""
+    async def blocked():
+        for _ in range(4):
+            time.sleep(0.15)
+            await asyncio.sleep(0)
+
+    with ResourceSampler(interval=0.02) as sampler:
+        usage = sampler.begin("blocked loop")
+
+        async def main():
+            sampler.watch(asyncio.get_running_loop())
+            await blocked()
+            sampler.unwatch(asyncio.get_running_loop())
+
+        asyncio.run(main())
+        sampler.end()
+    assert usage.loop_lag and max(usage.loop_lag) >= 0.04
+    assert any(flag.startswith("loop lag") for flag in usage.flags(thresholds={**sampler.thresholds, "cpu": 2}))
+
+def test_profile_finds_hot_function():
+    """Test the stack sampler attributes a busy thread's time to the function doing the work"""
+    with ResourceSampler(interval=0.05, profile=True, profile_interval=0.002) as sampler:
+        sampler.begin("profiled")
+        spin(0.15)
+        sampler.end()
+    assert sampler.stack_samples >= 3
+    hottest = sampler.self_samples.most_common(1)[0][0]
+    assert hottest.endswith(" spin")
+    assert sampler.total_samples[hottest] >= sampler.self_samples[hottest]
+
+def test_merge_from_workers():
+    """Test runs and profile samples sent by another worker are reported with this process's"""
+    with ResourceSampler(interval=0.01, profile=True, profile_interval=0.002) as worker:
+        worker.begin("worker run")
+        time.sleep(0.1)
+        worker.end()
+    controller = ResourceSampler()
+    controller.absorb(worker.to_dict())
+    assert controller.runs[0].name == "worker run"
+    assert controller.runs[0].cpu == worker.runs[0].cpu
+    assert controller.stack_samples == worker.stack_samples
+    assert controller.report_lines() == worker.report_lines()
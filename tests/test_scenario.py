@@ -0,0 +1,88 @@
+"""Test cases to test multi-step user journeys with many virtual users"""
+import pytest
+from petstore.scenario import SHOPPER, Scenario, Step, StepFailed, extract, render, run_scenario
+
+def shopper_data(allocator, status):
+    """Per-user data for the shopper journey, so no two virtual users touch the same user or order"""
+    def data(number):
+        return {
+            "user_id": allocator.next_id(),
+            "username": allocator.name(f"vu{number}"),
+            "order_id": allocator.next_id(),
+            "status": status,
+        }
+    return data
+
+def test_render_and_extract():
+    """Test placeholders keep the type of a whole-string value and extraction follows dotted paths"""
+    context = {"pet_id": 7, "name": "Rex"}
+    assert render({"id": "{pet_id}", "tags": ["{name}-{pet_id}"], "quantity": 1}, context) == {
+        "id": 7, "tags": ["Rex-7"], "quantity": 1
+    }
+    assert render("/pet/{pet_id}", context) == "/pet/7"
+    assert extract([{"id": 3, "category": {"name": "Dogs"}}], "0.category.name") == "Dogs"
+    with pytest.raises(StepFailed, match="no value for 'missing' in '{missing}'"):
+        render("{missing}", context)
+    for template in ("{x", "x}", "pet-{0}", "{name.missing}", "{name:%}"):
+        with pytest.raises(StepFailed, match="can't fill in"):
+            render({"name": template}, context)
+    with pytest.raises(StepFailed):
+        extract([], "0.id")
+
+def test_duplicate_step_names():
+    """Test step names must be unique, since latency is reported per step"""
+    with pytest.raises(ValueError):
+        Scenario("twice", [Step("get", "GET", "/store/inventory"), Step("get", "GET", "/store/inventory")])
+
+def test_shopper_journey(base_url, allocator, seeded):
+    """Test a thousand virtual users register, log in, browse, order, check stock, log out and clean up"""
+    scenario = Scenario.from_dict(SHOPPER)
+    data = shopper_data(allocator, seeded.statuses["available"])
+    result = run_scenario(base_url, scenario, 1000, ramp_up=1.0, connections=50, data=data, seed=1)
+    assert result.summary().startswith("shopper: 1000 users, 1000/1000 journeys completed")
+    names = [step.name for step in scenario.steps] + ["journey"]
+    assert all(
+        line.startswith(name) and line.endswith(" 0") for line, name in zip(result.step_lines()[1:], names, strict=True)
+    )
+    assert result.completed == result.started == 1000
+    assert not result.failures
+    assert result.requests == 1000 * len(scenario.steps)
+    assert all(histogram.count == 1000 for histogram in result.steps.values())
+    assert result.journeys.count == 1000
+    # Think times keep most users idle at once rather than finishing one by one
+    assert result.max_active > 100
+
+def test_failed_step_stops_journey(base_url, allocator):
+    """Test a journey stops at the first step that fails, but still runs its cleanup steps"""
+    scenario = Scenario("missing pet", [
+        Step("lookup", "GET", "/pet/{pet_id}", expect=200),
+        Step("never", "GET", "/store/inventory"),
+        Step("tidy up", "DELETE", "/pet/{pet_id}", expect=(200, 404), cleanup=True),
+    ])
+    result = run_scenario(base_url, scenario, 20, data=lambda number: {"pet_id": allocator.next_id()})
+
+    assert result.failures == {"lookup": 20}
+    assert result.completed == 0
+    assert result.steps["never"].count == 0
+    assert result.steps["tidy up"].count == 20
+    assert "answered 404" in result.examples[0]
+
+def test_extracted_values_flow_between_steps(base_url, ids):
+    """Test a value extracted from one response is used by the next steps"""
+    pet = {"id": ids.pet_id(), "name": "Journey", "photoUrls": [], "status": "available"}
+    scenario = Scenario("pet", [
+        Step("create", "POST", "/pet", json=pet, extract={"pet_id": "id", "name": lambda body: body["name"] + "2"}),
+        Step("rename", "POST", "/pet/{pet_id}", data={"name": "{name}"}),
+        Step("read", "GET", "/pet/{pet_id}", check=lambda body: body["name"] == "Journey2"),
+    ])
+    result = run_scenario(base_url, scenario, 1, iterations=3)
+
+    assert not result.failures, result.examples
+    assert result.completed == 3
+    assert result.steps["read"].count == 3
+
+    # The check is what makes the read step fail when the rename didn't take
+    scenario.steps[-1].check = lambda body: body["name"] == "{name}"
+    result = run_scenario(base_url, scenario, 1)
+    assert result.failures == {"read": 1}
+    assert "failed its check" in result.examples[0]
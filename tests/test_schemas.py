@@ -0,0 +1,56 @@
+"""Test cases to test the compiled Petstore response schemas"""
+import json
+import time
+import pytest
+from petstore.schemas import VALIDATORS, check_body
+
+PET = {
+    "id": 9223372036854775807,
+    "category": {"id": 0, "name": "dog"},
+    "name": "Oreo",
+    "photoUrls": ["https://images.pexels.com/photos/23542021/pexels-photo-23542021/free-photo.jpeg"],
+    "tags": [{"id": 0, "name": "tag1"}],
+    "status": "available",
+}
+
+@pytest.mark.parametrize("definition, value, error", [
+    ("Pet", PET, None),
+    ("Pet", {**PET, "id": 2**63}, ".id: expected int64, got 9223372036854775808"),
+    ("Pet", {"id": 1, "photoUrls": []}, ".name: missing"),
+    ("Pet", {**PET, "tags": [{"id": True}]}, ".tags[0].id: expected int64, got True"),
+    ("Pet", {**PET, "photoUrls": "x"}, ".photoUrls: expected array, got str"),
+    ("Order", {"id": 1, "quantity": 2**31, "complete": False}, ".quantity: expected int32, got 2147483648"),
+    ("Order", {"shipDate": "2024-11-20T10:00:00.000+0000"}, None),
+    ("Order", {"shipDate": "tomorrow"}, ".shipDate: expected date-time, got 'tomorrow'"),
+    ("User", {"username": "a" * 10000, "userStatus": 0}, None),
+    ("User", {"username": None}, ".username: expected string, got None"),
+    ("Inventory", {"available": 3, "sold": "2"}, "['sold']: expected int32, got '2'"),
+    ("ApiResponse", [], ": expected object, got list"),
+])
+def test_validators(definition, value, error):
+    """Test each definition accepts matching values and names the first mismatch otherwise"""
+    assert VALIDATORS[definition](value) == error
+
+def test_check_body():
+    """Test response bodies are checked against the schema for their endpoint and status"""
+    assert check_body("GET", "/pet/123", 200, json.dumps(PET)) is None
+    assert check_body("GET", "/pet/findByStatus", 200, json.dumps([PET, {"name": 1, "photoUrls": []}])) == (
+        "$[1].name: expected string, got 1"
+    )
+    assert check_body("GET", "/pet/123", 404, b'{"code":1,"type":"error","message":"Pet not found"}') is None
+    assert check_body("GET", "/pet/123", 200, b"{name:") == "$: not valid JSON"
+    assert check_body("GET", "/unknown", 200, b"[]") is None
+
+def test_validation_cost(record_property):
+    """Test validating a thousand responses and record the cost of each as a test property, e.g. in --junitxml"""
+    bodies = [json.dumps({**PET, "id": pet_id}).encode() for pet_id in range(1000)]
+    # Best of several rounds, so other threads competing for the GIL under xdist don't skew it
+    timings = []
+    for _ in range(5):
+        started = time.perf_counter()
+        for pet_id, body in enumerate(bodies):
+            assert check_body("GET", f"/pet/{pet_id}", 200, body) is None
+        timings.append((time.perf_counter() - started) / len(bodies))
+    per_response = min(timings)
+    # Recorded rather than asserted: wall-clock limits depend on the machine and whatever else it runs
+    record_property("validation_us_per_response", round(per_response * 1000000, 1))
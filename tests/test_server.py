@@ -0,0 +1,93 @@
+"""Test cases to test the stand-in server's HTTP handling of keep-alive and malformed requests"""
+import json
+import socket
+import pytest
+from petstore.server import MAX_HEAD, PetstoreServer
+
+@pytest.fixture(name="server", scope="module")
+def stand_in_server():
+    with PetstoreServer() as server:
+        yield server
+
+@pytest.fixture(name="connection")
+def raw_connection(server):
+    """A socket to the server and a file for reading its responses"""
+    with socket.create_connection((server.host, server.port), timeout=5) as sock, sock.makefile("rb") as responses:
+        yield sock, responses
+
+def request(method, path, body=b"", content_type="application/json", close=False):
+    head = [f"{method} /v2{path} HTTP/1.1", "Host: localhost", f"Content-Length: {len(body)}"]
+    if body:
+        head.append(f"Content-Type: {content_type}")
+    if close:
+        head.append("Connection: close")
+    return ("\r\n".join(head) + "\r\n\r\n").encode() + body
+
+def read_response(responses):
+    """Return (status, headers, decoded body) of the next response on the connection"""
+    status = int(responses.readline().split()[1])
+    headers = {}
+    while (line := responses.readline().decode("latin-1").strip()):
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = responses.read(int(headers.get("content-length", 0)))
+    return status, headers, json.loads(body) if body else None
+
+def test_keep_alive(connection):
+    """Test several requests are answered in turn over one connection until the client asks to close it"""
+    sock, responses = connection
+    pet = {"id": 9100, "name": "kept", "photoUrls": []}
+    sock.sendall(request("POST", "/pet", json.dumps(pet).encode()) + request("GET", "/pet/9100"))
+    assert read_response(responses)[0] == 200
+    status, headers, body = read_response(responses)
+    assert (status, headers["connection"], body["name"]) == (200, "keep-alive", "kept")
+    sock.sendall(request("DELETE", "/pet/9100", close=True))
+    status, headers, _ = read_response(responses)
+    assert (status, headers["connection"]) == (200, "close")
+    assert responses.read() == b""
+
+@pytest.mark.parametrize("request_line", [
+    b"GARBAGE",
+    b"GET /v2/store/inventory",
+    b"GET /v2/store/inventory HTTP/1.1 extra",
+    b"GET /v2/store/inventory HTTQ/1.1",
+])
+def test_malformed_request_line(connection, request_line):
+    """Test a request line that can't be parsed is answered 400 and the connection closed"""
+    sock, responses = connection
+    sock.sendall(request_line + b"\r\nHost: localhost\r\n\r\n")
+    status, headers, body = read_response(responses)
+    assert (status, headers["connection"], body["message"]) == (400, "close", "malformed request line")
+    assert responses.read() == b""
+
+def test_request_head_too_large(connection):
+    """Test a request head over the server's limit is answered 431 and the connection closed"""
+    sock, responses = connection
+    sock.sendall(b"GET /v2/store/inventory HTTP/1.1\r\nX-Padding: " + b"x" * MAX_HEAD + b"\r\n\r\n")
+    status, headers, body = read_response(responses)
+    assert (status, headers["connection"], body["message"]) == (431, "close", "request head too large")
+
+@pytest.mark.parametrize("framing", [
+    b"Content-Length: ten",
+    b"Content-Length: -1",
+    b"Transfer-Encoding: chunked\r\n\r\nzz\r\n",
+])
+def test_malformed_body_length(connection, framing):
+    """Test a body length or chunk size that can't be parsed is answered 400 and the connection closed"""
+    sock, responses = connection
+    sock.sendall(b"POST /v2/pet HTTP/1.1\r\nContent-Type: application/json\r\n" + framing + b"\r\n\r\n")
+    status, headers, body = read_response(responses)
+    assert (status, headers["connection"], body["message"]) == (400, "close", "malformed body length")
+    assert responses.read() == b""
+
+def test_bodies_that_are_not_utf8(connection):
+    """Test JSON and form bodies that aren't UTF-8 are answered 400, leaving the connection usable"""
+    sock, responses = connection
+    sock.sendall(request("POST", "/pet", b'{"id": 9101, "name": "\xff"}'))
+    assert read_response(responses)[0] == 400
+    sock.sendall(request("POST", "/pet", json.dumps({"id": 9101, "name": "form", "photoUrls": []}).encode()))
+    assert read_response(responses)[0] == 200
+    sock.sendall(request("POST", "/pet/9101", b"name=\xff", content_type="application/x-www-form-urlencoded"))
+    assert read_response(responses)[0] == 400
+    sock.sendall(request("DELETE", "/pet/9101"))
+    assert read_response(responses)[0] == 200
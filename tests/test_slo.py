@@ -0,0 +1,51 @@
+"""Test cases to test latency budgets and the baseline regression gate"""
+import random
+import pytest
+from petstore.load import LoadResult
+from petstore.metrics import Histogram
+from petstore.slo import Budget, check_budgets, find_regressions, load_baseline, save_baseline
+
+KEY = ("GET", "/store/inventory")
+
+def latencies(seed, scale=1.0, count=500):
+    """Histogram of lognormal latencies around 50ms"""
+    rng = random.Random(seed)
+    histogram = Histogram()
+    for _ in range(count):
+        histogram.record(rng.lognormvariate(-3, 0.3) * scale)
+    return histogram
+
+def test_parse_budget():
+    """Test parsing a latency budget"""
+    budget = Budget.parse("p99 GET /pet/{petId} < 300ms at 50 RPS")
+    assert (budget.pct, budget.method, budget.template, budget.limit_ms, budget.rate) == (
+        99, "GET", "/pet/{petId}", 300, 50
+    )
+    assert str(budget) == "p99 GET /pet/{petId} < 300ms at 50 RPS"
+
+    with pytest.raises(ValueError):
+        Budget.parse("GET /pet/{petId} is fast")
+
+def test_check_budgets():
+    """Test a budget only fails when its percentile is over the limit at or below its rate"""
+    result = LoadResult(rate=40, duration=10, concurrency=10)
+    result.elapsed = 10
+    result.endpoints[KEY] = latencies(1, count=400)
+
+    assert not check_budgets(result, ["p99 GET /store/inventory < 500ms at 50 RPS"])
+    assert check_budgets(result, ["p99 GET /store/inventory < 20ms at 50 RPS"])
+    # 40 RPS is past what this budget promises, so it doesn't apply
+    assert not check_budgets(result, ["p99 GET /store/inventory < 20ms at 10 RPS"])
+
+def test_same_distribution_is_not_a_regression():
+    """Test run to run noise isn't flagged as a regression"""
+    assert not find_regressions({KEY: latencies(1)}, {KEY: latencies(2)})
+
+def test_slowdown_is_a_regression(tmp_path):
+    """Test a 30% slowdown against a saved baseline is flagged"""
+    path = tmp_path / "baseline.json"
+    save_baseline(path, {KEY: latencies(1)})
+
+    regressions = find_regressions(load_baseline(path), {KEY: latencies(2, scale=1.3)})
+    assert len(regressions) == 1
+    assert regressions[0].startswith("GET /store/inventory")
@@ -1,16 +1,18 @@
 """Test cases to test store functionality"""
 import pytest
-import requests
 from concurrent.futures import ThreadPoolExecutor
-
-URL = "https://petstore.swagger.io/v2"
+from petstore.client import PetstoreClient
+from petstore.consistency import check, order_workload
+from petstore.inventory import InventoryBenchmark, curve_lines
+from petstore.load import Call, run_load
+from petstore.slo import assert_budgets
 
 @pytest.fixture(name="order_data")
-def sample_order_data():
+def sample_order_data(ids, pet_data):
     """Sample order data"""
     return {
-        "id": 2,
-        "petId": 12345,
+        "id": ids.order_id(),
+        "petId": pet_data["id"],
         "quantity": 2,
         "shipDate": "2024-11-13T12:15:45.209Z",
         "status": "placed",
@@ -18,118 +20,125 @@ def sample_order_data():
     }
 
 @pytest.fixture(name="pet_data")
-def sample_pet_data():
+def sample_pet_data(ids):
     """Sample pet data"""
     return {
-        "id": 12345,
+        "id": ids.pet_id(),
         "category": {"id": 0, "name": "dog"},
         "name": "Oreo2",
         "photoUrls":
             ["https://images.pexels.com/photos/23542021/pexels-photo-23542021/free-photo-of-brown-pomeranian-dog.jpeg"],
         "tags": [{"id": 0, "name": "tag1"}],
-        "status": "test123"
+        "status": ids.name("test123")
     }
 
-def test_place_get_order(pet_data, order_data):
+def test_place_get_order(client, pet_data, order_data):
     """Test placing and getting an order"""
     
     # First create a pet
-    response = requests.post(f"{URL}/pet", json=pet_data)
+    response = client.post("/pet", json=pet_data)
     assert response.status_code == 200
     
     # Place an order for the created pet
-    response = requests.post(f"{URL}/store/order", json=order_data)
+    response = client.post("/store/order", json=order_data)
     assert response.status_code == 200
     
     # Get order
-    response = requests.get(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.get(f"/store/order/{order_data["id"]}")
     assert response.status_code == 200
 
-def test_get_inventory(pet_data, order_data):
+def test_get_inventory(client, pet_data, order_data, seeded):
     """Test getting pet inventory"""
     
     # Create a pet
-    response = requests.post(f"{URL}/pet", json=pet_data)
+    response = client.post("/pet", json=pet_data)
     assert response.status_code == 200
     
     # Verify they are in the inventory
-    response = requests.get(f"{URL}/store/inventory")
+    response = client.get("/store/inventory")
     
-    print(response.json())
     assert response.status_code == 200
-    assert response.json()["test123"] == 1
+    assert response.json()[pet_data["status"]] == 1
+
+    # Verify the seeded statuses have their seeded counts
+    for status, pets in seeded.pets.items():
+        assert response.json()[seeded.statuses[status]] == len(pets)
     
 
-def test_delete_order(order_data):
+def test_delete_order(client, order_data):
     """Test deleting an order"""
     
+    # Place the order to delete
+    response = client.post("/store/order", json=order_data)
+    assert response.status_code == 200
+    
     # First verify order exists
-    response = requests.get(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.get(f"/store/order/{order_data["id"]}")
     assert response.status_code == 200
     
     # Now delete order
-    response = requests.delete(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.delete(f"/store/order/{order_data["id"]}")
     assert response.status_code == 200
     
     # Check order doesnt exist
-    response = requests.get(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.get(f"/store/order/{order_data["id"]}")
     assert response.status_code == 404
 
-def test_get_nonexistent_order():
+def test_get_nonexistent_order(client):
     """Test getting an invalid order"""
     
     # Get invalid order
-    response = requests.get(f"{URL}/store/order/99999996", timeout=10)
+    response = client.get("/store/order/99999996")
     assert response.status_code == 404
 
-def test_invalid_quantity(order_data):
+def test_invalid_quantity(client, order_data):
     """Test placing an order with no quantity"""
     new_order = order_data.copy()
     del new_order["quantity"]
     
-    response = requests.post(f"{URL}/store/order", json=new_order)
+    response = client.post("/store/order", json=new_order)
     assert response.status_code != 200
 
-def test_negative_quantity(order_data):
+def test_negative_quantity(client, order_data):
     """Test placing an order with negative quantity"""
     new_order = order_data.copy()
     new_order["quantity"] = -20
     
-    response = requests.post(f"{URL}/store/order", json=new_order)
+    response = client.post("/store/order", json=new_order)
     assert response.status_code != 200
 
-def test_large_quantity(order_data):
+def test_large_quantity(client, order_data):
     """Test placing an order with a large quantity"""
     new_order = order_data.copy()
     new_order["quantity"] = 1000000
     
-    response = requests.post(f"{URL}/store/order", json=new_order)
+    response = client.post("/store/order", json=new_order)
     assert response.status_code != 200
 
-def test_delete_twice(order_data):
+def test_delete_twice(client, order_data):
     """Test attempting to delete an order twice"""
     
     # Create order
-    response = requests.post(f"{URL}/store/order", json=order_data)
+    response = client.post("/store/order", json=order_data)
     assert response.status_code == 200
     
     # Now delete order
-    response = requests.delete(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.delete(f"/store/order/{order_data["id"]}")
     assert response.status_code == 200
     
     # Check order doesnt exist
-    response = requests.get(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.get(f"/store/order/{order_data["id"]}")
     assert response.status_code == 404
     
     # Attempt to delete again
-    response = requests.delete(f"{URL}/store/order/{order_data["id"]}", timeout=10)
+    response = client.delete(f"/store/order/{order_data["id"]}")
     assert response.status_code == 404
 
-def place_order_concurrently(test_order_data, num_requests=10):
+def place_order_concurrently(client, test_order_data, num_requests=10):
     """Function to place orders concurrently"""
     
     def place_order():
-        response = requests.post(f"{URL}/store/order", json=test_order_data) 
+        response = client.post("/store/order", json=test_order_data) 
         assert response.status_code == 200
     
     with ThreadPoolExecutor(max_workers=num_requests) as executor:
@@ -137,24 +146,40 @@ def place_order_concurrently(test_order_data, num_requests=10):
         for future in futures:
             future.result()
 
-def test_concurrent_orders(order_data):
+def test_concurrent_orders(client, order_data):
     """Test placing concurrent orders"""
     
-    place_order_concurrently(order_data, num_requests=20)
+    place_order_concurrently(client, order_data, num_requests=20)
 
-def test_high_volume_requests(order_data):
-    """Test handling of high volume requests to ensure API performance under load"""
-    num_requests = 100
-    # Place order
-    response = requests.post(f"{URL}/store/order", json=order_data)
-    assert response.status_code == 200
+def test_concurrent_orders_same_id(client, order_data):
+    """Test only one of many concurrent orders with the same id is accepted, and reads agree with it"""
+    history = order_workload(client, order_data, workers=20)
+    anomalies = check(history)
+    assert not anomalies, "\n".join(str(anomaly) for anomaly in anomalies)
 
-    # Helper function to get pet data
-    def place_order():
-        response = requests.get(f"{URL}/store/order/{order_data["id"]}")
-        assert response.status_code == 200
-
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(place_order) for _ in range(num_requests)]
-        for future in futures:
-            future.result()
+def test_high_volume_requests(base_url, seeded):
+    """Test handling of high volume requests to ensure API performance under load"""
+    # 100 requests arriving at 100/s across the seeded orders
+    mix = [Call("GET", f"/store/order/{order["id"]}") for order in seeded.orders]
+    result = run_load(base_url, mix, rate=100, duration=1, concurrency=10)
+    assert result.requests == 100
+    assert result.statuses[200] == result.requests
+    assert_budgets(result)
+
+def test_inventory_scaling(request, base_url, allocator):
+    """Test inventory counts stay exact as pets grow and change status (sizes set with --inventory-sizes)"""
+    sizes = [int(size) for size in request.config.getoption("--inventory-sizes").split(",")]
+    # A client of its own, so thousands of seeding calls stay out of the session's reports
+    with PetstoreClient.isolated(base_url) as client:
+        benchmark = InventoryBenchmark(client, allocator, reads=30, seed=1)
+        try:
+            points = benchmark.run(sizes)
+        finally:
+            benchmark.cleanup()
+    lines = curve_lines(points)
+    assert [point.size for point in points] == sorted(sizes)
+    assert lines[1:len(points) + 1] == [point.line() for point in points]
+    if len(points) > 1:
+        assert lines[len(points) + 1].startswith("idle p50 grows as pets^")
+    assert all(point.moves for point in points)
+    assert all(point.correct for point in points), "\n".join(lines)
@@ -0,0 +1,34 @@
+"""Test cases to test streaming JSON array parsing"""
+import json
+import pytest
+from petstore.streaming import JsonArrayParser, check_items
+
+PETS = [{"id": i, "name": f"Pet, [{i}] é", "status": "sold" if i == 700 else "available"} for i in range(1000)]
+PAYLOAD = json.dumps(PETS, ensure_ascii=False).encode()
+
+def chunked(data, size):
+    """Split bytes into fixed size chunks"""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+@pytest.mark.parametrize("size", [1, 13, 4096])
+def test_parser_matches_json_loads(size):
+    """Test items parsed chunk by chunk match a full parse, even when chunks split characters"""
+    parser = JsonArrayParser()
+    items = []
+    for chunk in chunked(PAYLOAD, size):
+        items.extend(parser.feed(chunk))
+    parser.close()
+    assert items == PETS
+
+def test_check_stops_at_first_violation():
+    """Test checking stops at the first failing item without reading the rest"""
+    stats = check_items(chunked(PAYLOAD, 256), lambda pet: pet["status"] == "available")
+    assert stats.violation["id"] == 700
+    assert stats.items == 701
+    assert stats.bytes < len(PAYLOAD)
+
+@pytest.mark.parametrize("payload", [b'[{"id": 1}', b'[{"id": 1} {"id": 2}]', b'{"id": 1}', b"[1, 2"])
+def test_malformed_payloads(payload):
+    """Test truncated or malformed arrays are rejected"""
+    with pytest.raises(ValueError):
+        check_items(chunked(payload, 3), lambda item: True)
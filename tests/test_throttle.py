@@ -0,0 +1,81 @@
+"""Test cases to test client-side rate limiting and retries"""
+import email.utils
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from petstore.client import PetstoreClient
+from petstore.server import PetstoreApp, PetstoreServer
+from petstore.throttle import RetryPolicy, ThrottleLog, TokenBucket, parse_retry_after
+
+def test_parse_retry_after():
+    """Test Retry-After is read as either seconds or an HTTP date"""
+    assert parse_retry_after("3") == 3.0
+    assert 9 < parse_retry_after(email.utils.formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+def test_retry_policy():
+    """Test only idempotent methods are retried on 5xx, while 429 is retried for any method"""
+    policy = RetryPolicy(backoff=0.1)
+    assert policy.should_retry("GET", 503)
+    assert not policy.should_retry("POST", 503)
+    assert policy.should_retry("POST", 429)
+    assert not policy.should_retry("GET", 500)
+    assert not policy.should_retry("GET", 404)
+    assert policy.delay(0, retry_after=2) == 2
+    assert all(0 <= policy.delay(3) <= 0.8 for _ in range(100))
+
+def test_token_bucket_paces_threads():
+    """Test threads sharing a bucket are held to its rate once the burst is spent"""
+    bucket = TokenBucket(rate=200, burst=1)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        list(executor.map(lambda _: bucket.acquire(), range(100)))
+    assert time.perf_counter() - started >= 99 / 200 * 0.95
+
+def test_token_bucket_slows_down_on_429():
+    """Test an unlimited bucket halves the observed rate on a 429 and then creeps back up"""
+    bucket = TokenBucket()
+    for _ in range(50):
+        bucket.acquire()
+    time.sleep(0.1)
+    bucket.throttled()
+    rate = bucket.rate
+    assert rate is not None
+    # A second 429 from the same burst doesn't halve it again
+    bucket.throttled()
+    assert bucket.rate == rate
+    bucket.succeeded()
+    assert bucket.rate > rate
+
+@pytest.fixture(name="limited_url", scope="module")
+def rate_limited_server():
+    """Stand-in server that answers anything over 200 requests per second with 429"""
+    with PetstoreServer(app=PetstoreApp(rate_limit=200)) as server:
+        yield server.url
+
+def test_client_stays_under_rate_limit(limited_url):
+    """Test concurrent reads and writes all succeed against a rate-limited server"""
+    log = ThrottleLog()
+    with PetstoreClient(limited_url, throttle=log) as client:
+        def call(index):
+            if index % 2:
+                return client.get("/store/inventory").status_code
+            order = {"id": index + 1, "petId": 1, "quantity": 1, "status": "placed"}
+            return client.post("/store/order", json=order).status_code
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=20) as executor:
+            statuses = list(executor.map(call, range(400)))
+        elapsed = time.perf_counter() - started
+
+    assert statuses == [200] * 400
+    assert log.gave_up == 0
+    retries = sum(log.retries.values())
+    assert retries > 0
+    # Every retry was for a 429, and the report names the endpoints that needed them
+    summary, *endpoints = log.report_lines()
+    assert summary.startswith(f"{retries} retries (429: {retries}), 0 gave up")
+    assert {line.split()[1] for line in endpoints} <= {"/store/inventory", "/store/order"}
+    # Nothing gets through faster than the server allows
+    assert elapsed >= (400 - 10) / 200 * 0.95
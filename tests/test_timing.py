@@ -0,0 +1,58 @@
+"""Test cases to test per-request phase timings"""
+from petstore.client import PetstoreClient
+from petstore.load import Call, run_load
+from petstore.timing import PhaseLog, traced_phases
+
+def test_new_and_reused_connections(base_url):
+    """Test only the request that opened a connection has DNS and connect times, and every one has TTFB"""
+    phases = PhaseLog()
+    with PetstoreClient(base_url, pool_size=1, phases=phases) as client:
+        responses = [client.get("/store/inventory") for _ in range(5)]
+
+    first, *rest = [response.phases for response in responses]
+    assert first["dns"] >= 0 and first["connect"] > 0
+    # The stand-in speaks plain HTTP
+    assert first["tls"] is None
+    assert all(later["dns"] is None and later["connect"] is None for later in rest)
+    assert all(timing["ttfb"] > 0 and timing["transfer"] >= 0 for timing in [first, *rest])
+
+    snapshot = phases.snapshot()
+    assert snapshot["ttfb"][("GET", "/store/inventory")].count == 5
+    assert snapshot["connect"][("GET", "/store/inventory")].count == 1
+    assert not snapshot["tls"]
+
+def test_streamed_body_has_no_transfer_time(base_url):
+    """Test a streamed response leaves its transfer time to whoever reads the body"""
+    with PetstoreClient(base_url, phases=PhaseLog()) as client:
+        response = client.get("/store/inventory", stream=True)
+        response.close()
+    assert response.phases["ttfb"] > 0
+    assert response.phases["transfer"] is None
+
+def test_phase_log_report_and_merge(base_url, seeded):
+    """Test phases from the load engine are reported per endpoint and survive a round trip between processes"""
+    phases = PhaseLog()
+    mix = [Call("GET", "/store/inventory"), Call("GET", f"/store/order/{seeded.orders[0]["id"]}")]
+    result = run_load(base_url, mix, rate=100, duration=1, concurrency=10, seed=1, phases=phases)
+    assert not result.errors
+
+    snapshot = phases.snapshot()
+    assert sum(histogram.count for histogram in snapshot["ttfb"].values()) == result.requests
+    assert sum(histogram.count for histogram in snapshot["transfer"].values()) == result.requests
+    assert 1 <= sum(histogram.count for histogram in snapshot["connect"].values()) <= 10
+
+    merged = PhaseLog()
+    merged.absorb(phases.to_dict())
+    merged.absorb(phases.to_dict())
+    assert merged.snapshot()["ttfb"][("GET", "/store/inventory")].count == 2 * snapshot["ttfb"][("GET", "/store/inventory")].count
+    lines = merged.report_lines()
+    assert any(line.startswith("GET /store/inventory") for line in lines)
+    assert any(line.startswith("all endpoints") for line in lines)
+
+def test_traced_phases():
+    """Test aiohttp trace marks are turned into phases, with a cached name taking no DNS time"""
+    marks = {"connect_start": 1.0, "connect_end": 1.5, "sent": 2.0, "first_byte": 2.25}
+    assert traced_phases(marks, 3.0) == {"dns": 0.0, "connect": 0.5, "tls": None, "ttfb": 0.25, "transfer": 0.75}
+    reused = traced_phases({"sent": 2.0, "first_byte": 2.5}, 2.5)
+    assert reused["connect"] is None and reused["ttfb"] == 0.5
+    assert traced_phases({}, 1.0) is None